@@ -1,10 +1,17 @@
+import re
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.utils import timezone
 from .models import (
     CustomUser, Equipe, Cliente, Fornecedor, Produto, 
-    Encomenda, ItemEncomenda, Entrega
+    Encomenda, ItemEncomenda, Entrega, CotacaoRecente, Notificacao, somente_digitos
 )
-from .forms import CustomUserCreationForm, CustomUserChangeForm
+from .forms import ClienteAdminForm, CustomUserCreationForm, CustomUserChangeForm
+from .paginacao import PaginadorEstimado
+
+# As buscas usam prefixo (^ = istartswith, = = iexact) para aproveitar os índices em
+# UPPER(coluna) criados na migration 0004; icontains sempre percorre a tabela inteira.
 
 # --- Administração de Autenticação e Equipe ---
 
@@ -13,6 +20,10 @@ class CustomUserAdmin(UserAdmin):
     form = CustomUserChangeForm
     model = CustomUser
     list_display = ['username', 'nome_completo', 'cargo', 'equipe', 'is_staff']
+    list_select_related = ['equipe']
+    search_fields = ['^username', '^nome_completo']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
     fieldsets = UserAdmin.fieldsets + (
         ('Informações Adicionais', {'fields': ('nome_completo', 'cargo', 'identificacao', 'equipe')}),
     )
@@ -21,31 +32,84 @@ class CustomUserAdmin(UserAdmin):
     )
 
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Equipe) # Registra o modelo Equipe no admin
+
+@admin.register(Equipe)
+class EquipeAdmin(admin.ModelAdmin):
+    list_display = ['nome', 'created_at']
+    search_fields = ['^nome']
+    ordering = ['nome']
 
 
 # --- Administração dos Modelos da Aplicação ---
 
+# Maior valor de uma coluna integer (AutoField); acima disso o filtro por pk dá DataError no PostgreSQL.
+NUMERO_MAXIMO = 2**31 - 1
+
 @admin.register(Cliente)
 class ClienteAdmin(admin.ModelAdmin):
     list_display = ['nome', 'cpf', 'bairro', 'telefone', 'equipe']
+    list_select_related = ['equipe']
     list_filter = ['equipe', 'bairro']
-    search_fields = ['nome', 'cpf', 'rua', 'bairro']
+    search_fields = ['^nome', '^cpf_normalizado', '^rua', '^bairro']
+    form = ClienteAdminForm
     ordering = ['nome']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # CPF com ou sem máscara: a coluna normalizada só tem dígitos.
+        if re.fullmatch(r'[\d.\-\s]+', search_term.strip()):
+            search_term = somente_digitos(search_term)
+        return super().get_search_results(request, queryset, search_term)
 
 @admin.register(Fornecedor)
 class FornecedorAdmin(admin.ModelAdmin):
     list_display = ['nome', 'codigo', 'contato', 'telefone', 'equipe']
+    list_select_related = ['equipe']
     list_filter = ['equipe']
-    search_fields = ['nome', 'codigo', 'contato']
+    search_fields = ['^nome', '=codigo', '^contato']
     ordering = ['nome']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
 
 @admin.register(Produto)
 class ProdutoAdmin(admin.ModelAdmin):
     list_display = ['nome', 'codigo', 'categoria', 'preco_base', 'equipe']
+    list_select_related = ['equipe']
     list_filter = ['equipe', 'categoria']
-    search_fields = ['nome', 'codigo']
+    search_fields = ['^nome', '=codigo']
     ordering = ['nome']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+@admin.register(CotacaoRecente)
+class CotacaoRecenteAdmin(admin.ModelAdmin):
+    list_display = ['produto', 'fornecedor', 'preco', 'preco_medio', 'total_cotacoes', 'data', 'equipe']
+    list_select_related = ['produto', 'fornecedor', 'equipe']
+    list_filter = ['equipe']
+    search_fields = ['^produto__nome', '^fornecedor__nome']
+    ordering = ['-data']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+@admin.register(Notificacao)
+class NotificacaoAdmin(admin.ModelAdmin):
+    list_display = ['encomenda', 'cliente', 'canal', 'destino', 'status', 'tentativas', 'proxima_tentativa', 'enviada_em']
+    list_select_related = ['cliente', 'encomenda__cliente']
+    list_filter = ['status', 'canal', 'equipe']
+    search_fields = ['^cliente__nome', '=destino']
+    ordering = ['-criada_em']
+    raw_id_fields = ['cliente', 'encomenda']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    actions = ['reenviar']
+
+    @admin.action(description='Reenviar notificações selecionadas')
+    def reenviar(self, request, queryset):
+        total = queryset.exclude(status='enviada').update(
+            status='pendente', tentativas=0, proxima_tentativa=timezone.now(), ultimo_erro='',
+        )
+        self.message_user(request, f'{total} notificação(ões) de volta à fila.')
 
 
 class ItemEncomendaInline(admin.TabularInline):
@@ -54,6 +118,9 @@ class ItemEncomendaInline(admin.TabularInline):
     readonly_fields = ['valor_total']
     autocomplete_fields = ['produto', 'fornecedor']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('produto', 'fornecedor')
+
 class EntregaInline(admin.StackedInline):
     model = Entrega
     extra = 0
@@ -61,9 +128,13 @@ class EntregaInline(admin.StackedInline):
 @admin.register(Encomenda)
 class EncomendaAdmin(admin.ModelAdmin):
     list_display = ['numero_encomenda', 'cliente', 'status', 'data_encomenda', 'responsavel_criacao', 'valor_total']
-    list_filter = ['status', 'equipe', 'data_encomenda']
-    search_fields = ['numero_encomenda', 'cliente__nome']
+    list_select_related = ['cliente', 'responsavel_criacao']
+    list_filter = ['status', 'equipe']
+    date_hierarchy = 'data_encomenda'
+    search_fields = ['^cliente__nome']
     ordering = ['-data_encomenda']
+    paginator = PaginadorEstimado
+    show_full_result_count = False
     readonly_fields = ['numero_encomenda', 'valor_total']
     inlines = [ItemEncomendaInline, EntregaInline]
     autocomplete_fields = ['cliente']
@@ -78,4 +149,11 @@ class EncomendaAdmin(admin.ModelAdmin):
         ('Detalhes', {
             'fields': ('data_encomenda', 'observacoes')
         }),
-    )
\ No newline at end of file
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Número da encomenda: busca exata pela chave primária em vez de icontains na coluna.
+        numero = search_term.strip().lstrip('#')
+        if numero.isdigit() and int(numero) <= NUMERO_MAXIMO:
+            return queryset.filter(pk=int(numero)), False
+        return super().get_search_results(request, queryset, search_term)
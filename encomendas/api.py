@@ -0,0 +1,182 @@
+"""
+API de leitura para integrações (ERP, aplicativo de entregas).
+
+    GET /api/v1/<recurso>/   recurso: encomendas, clientes, produtos, fornecedores
+
+Parâmetros:
+    fields          campos desejados, separados por vírgula (padrão: os campos básicos
+                    do recurso). Só as colunas pedidas são lidas do banco (values()).
+    ids             até 500 ids separados por vírgula, buscados em uma única consulta.
+    updated_since   data/hora ISO 8601: apenas registros alterados a partir dela.
+    cursor          valor de `proximo_cursor` da resposta anterior.
+    limit           registros por página (padrão 100, máximo 500).
+
+A paginação é por cursor sobre (updated_at, id), sem OFFSET: cada página custa o
+mesmo, e uma sincronização incremental guarda o último cursor e continua dele.
+Exclusões e encomendas arquivadas não aparecem como alteração; para conferir, busque
+os ids conhecidos com `ids=`.
+
+updated_at é gravado no save(), antes do commit: uma transação mais lenta pode ficar
+visível depois que registros com updated_at maior já foram lidos, e o cursor passa por
+ela. Por isso a sincronização incremental deve recomeçar com `updated_since` um pouco
+antes do último updated_at recebido (alguns minutos, mais que a transação mais longa)
+e ignorar pelo id os registros que já tem.
+"""
+import base64
+from collections import defaultdict
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_http_methods
+
+from .models import Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda
+
+LIMITE_PADRAO = 100
+LIMITE_MAXIMO = 500
+
+# Para cada recurso: modelo, campos expostos (nome na API -> caminho no ORM) e os
+# campos devolvidos quando `fields` não é informado.
+RECURSOS = {
+    'encomendas': {
+        'modelo': Encomenda,
+        'campos': {
+            'id': 'numero_encomenda', 'cliente': 'cliente_id', 'cliente_nome': 'cliente__nome',
+            'status': 'status', 'data_encomenda': 'data_encomenda',
+            'data_prevista_entrega': 'data_prevista_entrega', 'valor_total': 'valor_total',
+            'valor_pago_adiantamento': 'valor_pago_adiantamento', 'observacoes': 'observacoes',
+            'versao': 'versao', 'updated_at': 'updated_at',
+        },
+        'padrao': ['id', 'cliente', 'status', 'data_encomenda', 'valor_total', 'updated_at'],
+    },
+    'clientes': {
+        'modelo': Cliente,
+        'campos': {
+            'id': 'id', 'nome': 'nome', 'cpf': 'cpf', 'telefone': 'telefone', 'rua': 'rua', 'numero': 'numero',
+            'complemento': 'complemento', 'bairro': 'bairro', 'referencia': 'referencia', 'updated_at': 'updated_at',
+        },
+        'padrao': ['id', 'nome', 'cpf', 'telefone', 'bairro', 'updated_at'],
+    },
+    'produtos': {
+        'modelo': Produto,
+        'campos': {
+            'id': 'id', 'nome': 'nome', 'codigo': 'codigo', 'descricao': 'descricao', 'preco_base': 'preco_base',
+            'categoria': 'categoria', 'updated_at': 'updated_at',
+        },
+        'padrao': ['id', 'nome', 'codigo', 'preco_base', 'updated_at'],
+    },
+    'fornecedores': {
+        'modelo': Fornecedor,
+        'campos': {
+            'id': 'id', 'nome': 'nome', 'codigo': 'codigo', 'contato': 'contato', 'telefone': 'telefone',
+            'email': 'email', 'updated_at': 'updated_at',
+        },
+        'padrao': ['id', 'nome', 'codigo', 'updated_at'],
+    },
+}
+
+# `fields=itens` em encomendas traz os itens com uma consulta a mais para a página toda.
+CAMPOS_ITEM = ['id', 'produto_id', 'fornecedor_id', 'quantidade', 'preco_cotado', 'valor_total', 'observacoes']
+
+
+class ParametroInvalido(Exception):
+    pass
+
+
+def _lista(valor):
+    return [parte.strip() for parte in valor.split(',') if parte.strip()]
+
+
+def _codificar_cursor(atualizado, pk):
+    return base64.urlsafe_b64encode(f'{atualizado.isoformat()}|{pk}'.encode()).decode()
+
+
+def _decodificar_cursor(cursor):
+    try:
+        atualizado, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        atualizado, pk = parse_datetime(atualizado), int(pk)
+    except (ValueError, TypeError):
+        raise ParametroInvalido('cursor inválido')
+    if atualizado is None:
+        raise ParametroInvalido('cursor inválido')
+    return atualizado, pk
+
+
+def _campos_pedidos(recurso, parametro):
+    pedidos = _lista(parametro) if parametro else list(recurso['padrao'])
+    desconhecidos = [campo for campo in pedidos if campo not in recurso['campos'] and campo != 'itens']
+    if desconhecidos or ('itens' in pedidos and recurso['modelo'] is not Encomenda):
+        raise ParametroInvalido(f'Campo(s) desconhecido(s): {", ".join(desconhecidos) or "itens"}')
+    return ['id'] + [campo for campo in pedidos if campo != 'id']
+
+
+def _consultar(recurso, equipe, parametros):
+    modelo = recurso['modelo']
+    campos = _campos_pedidos(recurso, parametros.get('fields'))
+    pk = recurso['campos']['id']
+    consulta = modelo.objects.filter(equipe=equipe)
+
+    if parametros.get('ids'):
+        try:
+            ids = [int(valor) for valor in _lista(parametros['ids'])]
+        except ValueError:
+            raise ParametroInvalido('ids deve ser uma lista de números separados por vírgula')
+        if len(ids) > LIMITE_MAXIMO:
+            raise ParametroInvalido(f'No máximo {LIMITE_MAXIMO} ids por requisição')
+        consulta, limite = consulta.filter(**{f'{pk}__in': ids}), None
+    else:
+        try:
+            limite = min(int(parametros.get('limit', LIMITE_PADRAO)), LIMITE_MAXIMO)
+        except ValueError:
+            raise ParametroInvalido('limit deve ser um número')
+        if limite < 1:
+            raise ParametroInvalido('limit deve ser positivo')
+
+    if parametros.get('updated_since'):
+        desde = parse_datetime(parametros['updated_since'])
+        if desde is None:
+            raise ParametroInvalido('updated_since deve estar no formato ISO 8601')
+        if timezone.is_naive(desde):
+            desde = timezone.make_aware(desde)
+        consulta = consulta.filter(updated_at__gte=desde)
+    if parametros.get('cursor'):
+        atualizado, ultimo_pk = _decodificar_cursor(parametros['cursor'])
+        consulta = consulta.filter(Q(updated_at__gt=atualizado) | Q(updated_at=atualizado, **{f'{pk}__gt': ultimo_pk}))
+
+    # updated_at é sempre lido para montar o cursor, mesmo que não tenha sido pedido.
+    caminhos = {recurso['campos'][campo]: campo for campo in campos if campo != 'itens'}
+    caminhos.setdefault('updated_at', None)
+    consulta = consulta.order_by('updated_at', pk).values(*caminhos)
+    linhas = list(consulta[:limite + 1] if limite else consulta)
+
+    proximo_cursor = None
+    if limite and len(linhas) > limite:
+        linhas = linhas[:limite]
+        proximo_cursor = _codificar_cursor(linhas[-1]['updated_at'], linhas[-1][pk])
+
+    resultados = [
+        {nome: linha[caminho] for caminho, nome in caminhos.items() if nome is not None} for linha in linhas
+    ]
+    if 'itens' in campos:
+        itens = defaultdict(list)
+        for item in ItemEncomenda.objects.filter(encomenda_id__in=[r['id'] for r in resultados]).values(
+            'encomenda_id', *CAMPOS_ITEM
+        ):
+            itens[item.pop('encomenda_id')].append(item)
+        for resultado in resultados:
+            resultado['itens'] = itens[resultado['id']]
+    return resultados, proximo_cursor
+
+
+@login_required
+@require_http_methods(["GET"])
+def listar(request, recurso):
+    if recurso not in RECURSOS:
+        return JsonResponse({'error': f'Recurso desconhecido: {recurso}'}, status=404)
+    try:
+        resultados, proximo_cursor = _consultar(RECURSOS[recurso], request.user.equipe, request.GET)
+    except ParametroInvalido as erro:
+        return JsonResponse({'error': str(erro)}, status=400)
+    return JsonResponse({'resultados': resultados, 'proximo_cursor': proximo_cursor})
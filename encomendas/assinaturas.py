@@ -0,0 +1,122 @@
+"""
+Assinaturas de entrega capturadas na tela (canvas).
+
+O desenho chega como PNG em data URL e é gravado como arquivo (MEDIA_ROOT/assinaturas/
+<equipe>/<hash>.png), recortado no traço e reduzido a 1 bit por pixel: poucos KB por
+assinatura, e a linha da Entrega guarda só o caminho. O nome vem do conteúdo, então a
+URL de um arquivo nunca muda de conteúdo e pode ser servida com cache longo.
+
+A miniatura usada na impressão (<hash>-impressao.png) é gerada depois do commit em
+uma thread à parte; se ainda não existir quando for pedida, a view a gera na hora.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+PREFIXO_DATA_URL = 'data:image/png;base64,'
+MAX_BYTES = 2 * 1024 * 1024
+MAX_LADO = 4000          # recusa imagens maiores antes de decodificar os pixels
+TAMANHO_ARQUIVO = (1200, 400)
+TAMANHO_IMPRESSAO = (450, 150)
+LIMIAR_TRACO = 160       # tons mais escuros que isso viram traço (preto)
+MARGEM = 8
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='miniaturas-assinatura')
+
+
+class AssinaturaInvalida(ValueError):
+    pass
+
+
+def _um_bit(imagem, tamanho):
+    """Escala de cinza, reduzida para caber em `tamanho`, e limiarizada em preto e branco."""
+    imagem = imagem.convert('L')
+    imagem.thumbnail(tamanho, Image.Resampling.LANCZOS)
+    return imagem.point(lambda tom: 255 if tom > LIMIAR_TRACO else 0, mode='1')
+
+
+def _png(imagem):
+    saida = io.BytesIO()
+    imagem.save(saida, format='PNG', optimize=True)
+    return saida.getvalue()
+
+
+def comprimir(data_url):
+    """
+    Converte o data URL do canvas em PNG de 1 bit recortado no traço.
+    Retorna None para um canvas em branco.
+    """
+    if not data_url.startswith(PREFIXO_DATA_URL):
+        raise AssinaturaInvalida('Formato de assinatura não reconhecido.')
+    codificado = data_url[len(PREFIXO_DATA_URL):]
+    if len(codificado) > MAX_BYTES * 4 // 3:
+        raise AssinaturaInvalida('Assinatura grande demais.')
+    try:
+        imagem = Image.open(io.BytesIO(base64.b64decode(codificado, validate=True)))
+        if imagem.width > MAX_LADO or imagem.height > MAX_LADO:
+            raise AssinaturaInvalida('Assinatura grande demais.')
+        imagem.load()
+    except (binascii.Error, UnidentifiedImageError, OSError) as erro:
+        raise AssinaturaInvalida('Não foi possível ler a assinatura.') from erro
+
+    # O canvas é transparente fora do traço: compõe sobre fundo branco antes de converter.
+    fundo = Image.new('RGBA', imagem.size, 'white')
+    imagem = Image.alpha_composite(fundo, imagem.convert('RGBA')).convert('L')
+    caixa = ImageOps.invert(imagem).getbbox()
+    if caixa is None:
+        return None
+    esquerda, topo, direita, base = caixa
+    imagem = imagem.crop((
+        max(0, esquerda - MARGEM), max(0, topo - MARGEM),
+        min(imagem.width, direita + MARGEM), min(imagem.height, base + MARGEM),
+    ))
+    return _png(_um_bit(imagem, TAMANHO_ARQUIVO))
+
+
+def nome_arquivo(png):
+    return hashlib.sha256(png).hexdigest()[:24] + '.png'
+
+
+def nome_impressao(nome):
+    return nome[:-len('.png')] + '-impressao.png'
+
+
+def anexar(entrega, png):
+    """Grava o PNG (se ainda não existir) e aponta o campo da entrega para ele."""
+    campo = entrega.assinatura_imagem
+    caminho = campo.field.generate_filename(entrega, nome_arquivo(png))
+    if default_storage.exists(caminho):
+        campo.name = caminho
+    else:
+        campo.save(nome_arquivo(png), ContentFile(png), save=False)
+    nome = campo.name
+    transaction.on_commit(lambda: _executor.submit(_gerar_em_segundo_plano, nome))
+
+
+def gerar_miniatura(nome):
+    """Cria a versão de impressão de um arquivo de assinatura; não faz nada se ela já existir."""
+    destino = nome_impressao(nome)
+    if not default_storage.exists(destino):
+        with default_storage.open(nome, 'rb') as arquivo:
+            png = _png(_um_bit(Image.open(arquivo), TAMANHO_IMPRESSAO))
+        if not default_storage.exists(destino):
+            default_storage.save(destino, ContentFile(png))
+    return destino
+
+
+def _gerar_em_segundo_plano(nome):
+    try:
+        gerar_miniatura(nome)
+    except Exception:
+        # Sem a miniatura a view gera na primeira impressão; só registra.
+        logger.exception('Falha ao gerar a miniatura da assinatura %s', nome)
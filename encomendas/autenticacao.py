@@ -0,0 +1,47 @@
+"""
+Usuário da sessão carregado do cache (ver AUTHENTICATION_BACKENDS nas settings).
+
+Sem isto, toda requisição autenticada busca o CustomUser no banco e, na primeira vez
+que a view usa request.user.equipe, mais uma consulta para a equipe. O backend guarda
+o usuário já com a equipe por TEMPO_CACHE segundos; encomendas/signals.py apaga a
+entrada quando o usuário (senha, equipe, ativo...) ou a equipe dele é alterado, e o
+UsuarioQuerySet faz o mesmo nos update() em lote de usuários. Alterações que não
+passam pelo ORM (SQL direto) ou Equipe.objects.update() só aparecem quando a entrada
+vence, em até TEMPO_CACHE.
+
+Com o cache em memória local cada processo teria a sua cópia, e a invalidação só
+alcançaria o processo que fez a alteração; nesse caso o usuário é lido do banco como
+no ModelBackend, ainda com a equipe (CACHE_PERFIL = 'arquivo' nas settings).
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .cache_equipe import compartilhado
+
+TEMPO_CACHE = 120
+
+
+def chave_usuario(user_id):
+    return f'usuario:{user_id}'
+
+
+def invalidar_usuarios(*user_ids):
+    cache.delete_many([chave_usuario(user_id) for user_id in user_ids])
+
+
+class BackendComCache(ModelBackend):
+    """ModelBackend que carrega o usuário da sessão (com a equipe) do cache."""
+
+    def get_user(self, user_id):
+        chave, em_cache = chave_usuario(user_id), compartilhado()
+        usuario = cache.get(chave) if em_cache else None
+        if usuario is None:
+            UserModel = get_user_model()
+            try:
+                usuario = UserModel._default_manager.select_related('equipe').get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            if em_cache:
+                cache.set(chave, usuario, TEMPO_CACHE)
+        return usuario if self.user_can_authenticate(usuario) else None
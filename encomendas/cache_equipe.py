@@ -0,0 +1,107 @@
+"""
+Cache das listagens por equipe, invalidado por geração.
+
+Cada equipe tem um contador (geração) por família de dados: 'encomendas' (encomendas,
+itens e entregas), 'clientes', 'produtos' e 'fornecedores'. Toda gravação incrementa o
+contador da família (encomendas/signals.py para save/delete; chamadas explícitas a
+`invalidar` nas operações em lote, que não disparam sinais). As entradas em cache levam
+na chave as gerações de que dependem, então uma gravação torna as anteriores
+inalcançáveis: nada é apagado.
+
+Os contadores ficam no cache padrão, compartilhado pelos processos; as páginas e os
+fragmentos renderizados ficam no cache 'listagens' (LocMemCache de cada processo, com
+descarte LRU pelo MAX_ENTRIES, além do TEMPO_CACHE). Como a chave leva a geração
+compartilhada, a gravação feita em um worker também torna inalcançáveis as entradas
+guardadas nos outros.
+
+O incremento é feito na hora e de novo no commit: uma leitura concorrente que ainda
+viu os dados antigos pode ter gravado o cache com a geração nova, e o segundo
+incremento descarta essa entrada.
+
+Um contador perdido (LRU, reinício) recomeça em time.time_ns(), nunca num valor já
+usado. Com o cache padrão em memória local as gerações seriam por processo, e uma
+gravação não invalidaria as listagens dos outros workers: `compartilhado()` é falso e
+as listagens não usam o cache (CACHE_PERFIL = 'arquivo' nas settings).
+"""
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.paginator import Page
+from django.db import transaction
+
+TEMPO_CACHE = 600
+ALIAS_LISTAGENS = 'listagens'
+
+
+def compartilhado():
+    """O cache padrão é visto por todos os processos (não é o LocMemCache)."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def _listagens():
+    return caches[ALIAS_LISTAGENS]
+
+
+def _chave_geracao(equipe_id, familia):
+    return f'geracao:{equipe_id}:{familia}'
+
+
+def geracao(equipe_id, *familias):
+    """Identificador das gerações atuais das famílias, usado como parte das chaves."""
+    chaves = [_chave_geracao(equipe_id, familia) for familia in familias]
+    valores = cache.get_many(chaves)
+    for chave in chaves:
+        if chave not in valores:
+            cache.add(chave, time.time_ns(), None)
+            valores[chave] = cache.get(chave) or time.time_ns()
+    return f'{equipe_id}:' + '.'.join(str(valores[chave]) for chave in chaves)
+
+
+def _incrementar(equipe_id, familias):
+    for familia in familias:
+        chave = _chave_geracao(equipe_id, familia)
+        try:
+            cache.incr(chave)
+        except ValueError:
+            cache.add(chave, time.time_ns(), None)
+
+
+def invalidar(equipe_id, *familias):
+    """Incrementa a geração das famílias da equipe: agora e, dentro de transação, no commit."""
+    if equipe_id is None:
+        return
+    _incrementar(equipe_id, familias)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incrementar(equipe_id, familias))
+
+
+def obter(equipe_id, familias, nome, calcular):
+    """Valor em cache para (equipe, gerações, nome); `calcular()` só roda na falta."""
+    if not compartilhado():
+        return calcular()
+    chave = f'lista:{geracao(equipe_id, *familias)}:{nome}'
+    valor = _listagens().get(chave)
+    if valor is None:
+        valor = calcular()
+        _listagens().set(chave, valor, TEMPO_CACHE)
+    return valor
+
+
+def pagina_inicial(paginator, equipe_id, familias, nome):
+    """
+    Página 1 de um PaginadorEstimado com os objetos e a contagem vindos do cache.
+    Retorna (página, geração); a geração serve de chave para o fragmento renderizado.
+    Sem cache compartilhado, a página vem do banco e a geração é None.
+    """
+    if not compartilhado():
+        return paginator.get_page(1), None
+    versao = geracao(equipe_id, *familias)
+    chave = f'lista:{versao}:{nome}'
+    guardado = _listagens().get(chave)
+    if guardado is None:
+        pagina = paginator.get_page(1)
+        _listagens().set(chave, (list(pagina.object_list), paginator.count, paginator.aproximado), TEMPO_CACHE)
+        return pagina, versao
+    objetos, paginator.__dict__['count'], paginator.aproximado = guardado
+    return Page(objetos, 1, paginator), versao
@@ -0,0 +1,67 @@
+"""
+Consolidação de compras: itens ainda não pedidos das encomendas em aberto, somados por
+fornecedor e produto em uma única consulta agrupada (apoiada no índice parcial
+item_a_pedir_idx), com a lista das encomendas de origem.
+
+A marcação como pedido é um único UPDATE limitado aos ids dos itens que entraram no
+relatório, para que itens incluídos depois de gerado o relatório (novos ou de
+encomendas aprovadas nesse meio tempo) não sejam marcados sem ter sido vistos.
+"""
+from django.db.models import Aggregate, CharField, Count, Sum
+from django.utils import timezone
+
+from .cache_equipe import invalidar
+from .models import ItemEncomenda
+
+STATUS_A_COMPRAR = ['aprovada', 'em_andamento']
+
+
+class ListaDistinta(Aggregate):
+    """Valores distintos do grupo separados por vírgula (GROUP_CONCAT / STRING_AGG)."""
+    function = 'GROUP_CONCAT'
+    template = '%(function)s(DISTINCT %(expressions)s)'
+    output_field = CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, function='STRING_AGG',
+            template="%(function)s(DISTINCT (%(expressions)s)::text, ',')", **extra_context,
+        )
+
+
+def itens_a_pedir(equipe, fornecedor_id=None, ids=None):
+    itens = ItemEncomenda.objects.filter(
+        encomenda__equipe=equipe, encomenda__status__in=STATUS_A_COMPRAR, pedido_em__isnull=True,
+    )
+    if fornecedor_id:
+        itens = itens.filter(fornecedor_id=fornecedor_id)
+    if ids is not None:
+        itens = itens.filter(pk__in=ids)
+    return itens
+
+
+def consolidar(equipe, fornecedor_id=None):
+    """
+    Uma linha por fornecedor e produto, ordenada por fornecedor; `encomendas` (números) e
+    `itens` (ids dos itens somados) são listas.
+    """
+    linhas = list(
+        itens_a_pedir(equipe, fornecedor_id)
+        .values('fornecedor_id', 'fornecedor__nome', 'produto_id', 'produto__codigo', 'produto__nome')
+        .annotate(
+            quantidade=Sum('quantidade'), valor=Sum('valor_total'), total_itens=Count('pk'),
+            itens=ListaDistinta('pk'), encomendas=ListaDistinta('encomenda_id'),
+        )
+        .order_by('fornecedor__nome', 'fornecedor_id', 'produto__nome')
+    )
+    for linha in linhas:
+        linha['encomendas'] = sorted(int(numero) for numero in linha['encomendas'].split(','))
+        linha['itens'] = [int(pk) for pk in linha['itens'].split(',')]
+    return linhas
+
+
+def marcar_pedidos(equipe, ids, fornecedor_id=None):
+    """Marca como pedidos os itens do relatório (`ids`) ainda não pedidos. Retorna quantos foram marcados."""
+    marcados = itens_a_pedir(equipe, fornecedor_id, ids).update(pedido_em=timezone.now())
+    invalidar(equipe.pk, 'encomendas')
+    return marcados
@@ -0,0 +1,151 @@
+"""
+Registro de consultas lentas (ver ConsultasLentasMiddleware e o comando `consultas_lentas`).
+
+Durante cada requisição um execute_wrapper mede as consultas da conexão. As que passam
+de LIMIAR_MS viram uma linha JSON em ARQUIVO com a rota, o ponto do código do projeto
+que disparou a consulta e o SQL normalizado (literais trocados por `?`), que também dá a
+impressão digital usada para agrupar consultas iguais. Os valores dos parâmetros não são
+gravados.
+
+Para uma fração AMOSTRA_EXPLAIN dos SELECTs lentos no PostgreSQL a consulta é repetida
+com EXPLAIN (ANALYZE, BUFFERS), dentro de um savepoint, e o plano vai junto no registro.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+PADRAO = {
+    'ATIVO': False,
+    'LIMIAR_MS': 200,
+    'AMOSTRA_EXPLAIN': 0.1,
+    'ARQUIVO': Path(settings.BASE_DIR) / 'consultas_lentas.jsonl',
+    'MAX_BYTES': 20 * 1024 * 1024,
+}
+
+_trava_arquivo = threading.Lock()
+
+_LITERAIS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),              # strings
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),            # números
+    (re.compile(r'%s'), '?'),                           # parâmetros ainda não substituídos
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(?...)'),  # IN (?, ?, ?) de qualquer tamanho
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, 'CONSULTAS_LENTAS', {})}
+
+
+def normalizar(sql):
+    for padrao, troca in _LITERAIS:
+        sql = padrao.sub(troca, sql)
+    return sql.strip()
+
+
+def impressao_digital(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()[:12]
+
+
+def _origem():
+    """
+    Os dois quadros mais internos da pilha que pertencem ao projeto (fora do Django e
+    deste módulo), p.ex. "encomendas/views.py:110 encomenda_list > encomendas/paginacao.py:38 count".
+    """
+    base = str(settings.BASE_DIR)
+    do_projeto = [
+        f'{os.path.relpath(quadro.filename, base)}:{quadro.lineno} {quadro.name}'
+        for quadro in traceback.extract_stack()
+        if quadro.filename.startswith(base) and 'site-packages' not in quadro.filename
+        and not quadro.filename.endswith(('consultas_lentas.py', 'middleware.py'))
+    ]
+    return ' > '.join(do_projeto[-2:])
+
+
+def gravar(config, registro):
+    arquivo = Path(config['ARQUIVO'])
+    linha = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+    with _trava_arquivo:
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        if arquivo.exists() and arquivo.stat().st_size > config['MAX_BYTES']:
+            os.replace(arquivo, arquivo.with_name(arquivo.name + '.1'))  # mantém um arquivo anterior
+        with arquivo.open('a', encoding='utf-8') as saida:
+            saida.write(linha)
+
+
+def ler_registros(config):
+    arquivo = Path(config['ARQUIVO'])
+    for caminho in (arquivo.with_name(arquivo.name + '.1'), arquivo):
+        if not caminho.exists():
+            continue
+        with caminho.open(encoding='utf-8') as entrada:
+            for linha in entrada:
+                try:
+                    yield json.loads(linha)
+                except ValueError:
+                    continue  # linha cortada por uma gravação interrompida
+
+
+class MonitorDeConsultas:
+    """execute_wrapper instalado pelo middleware durante cada requisição."""
+
+    def __init__(self, config, request=None):
+        self.config = config
+        self.request = request
+        self._explicando = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explicando:
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if duracao_ms >= self.config['LIMIAR_MS']:
+                self._registrar(sql, params, many, context['connection'], duracao_ms)
+
+    def _registrar(self, sql, params, many, conexao, duracao_ms):
+        normalizado = normalizar(sql)
+        rota = ''
+        if self.request is not None:
+            correspondencia = self.request.resolver_match
+            rota = correspondencia.view_name if correspondencia else self.request.path
+        registro = {
+            'quando': timezone.now().isoformat(),
+            'impressao': impressao_digital(normalizado),
+            'sql': normalizado[:4000],
+            'duracao_ms': round(duracao_ms, 2),
+            'rota': rota,
+            'origem': _origem(),
+        }
+        if not many and random.random() < self.config['AMOSTRA_EXPLAIN']:
+            plano = self._explain(sql, params, conexao)
+            if plano:
+                registro['explain'] = plano
+        gravar(self.config, registro)
+
+    def _explain(self, sql, params, conexao):
+        inicio = sql.lstrip().upper()
+        if conexao.vendor != 'postgresql' or not inicio.startswith('SELECT') or 'FOR UPDATE' in inicio:
+            return None
+        self._explicando = True
+        try:
+            # O savepoint evita que uma falha no EXPLAIN aborte a transação da requisição.
+            with transaction.atomic(using=conexao.alias), conexao.cursor() as cursor:
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+                return '\n'.join(linha[0] for linha in cursor.fetchall())
+        except DatabaseError:
+            return None
+        finally:
+            self._explicando = False
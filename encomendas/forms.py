@@ -1,7 +1,8 @@
 from django import forms
 from django.forms import inlineformset_factory
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from .models import Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega, CustomUser
+from . import assinaturas
+from .models import Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega, CustomUser, somente_digitos
 
 class CustomUserCreationForm(UserCreationForm):
     class Meta(UserCreationForm.Meta):
@@ -21,6 +22,7 @@ class ClienteForm(forms.ModelForm):
             'nome': forms.TextInput(attrs={'class': 'form-control'}),
             'cpf': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '000.000.000-00'}),
             'telefone': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '(00) 00000-0000'}),
+            'email': forms.EmailInput(attrs={'class': 'form-control', 'placeholder': 'cliente@exemplo.com'}),
             'rua': forms.TextInput(attrs={'class': 'form-control'}),
             'numero': forms.TextInput(attrs={'class': 'form-control'}),
             'complemento': forms.TextInput(attrs={'class': 'form-control'}),
@@ -28,6 +30,38 @@ class ClienteForm(forms.ModelForm):
             'referencia': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+    def __init__(self, *args, equipe=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.equipe = equipe if equipe is not None else getattr(self.instance, 'equipe', None)
+
+    def clean_cpf(self):
+        cpf = self.cleaned_data['cpf']
+        digitos = somente_digitos(cpf)
+        if not digitos:
+            return cpf
+        if len(digitos) != 11:
+            raise forms.ValidationError("O CPF deve ter 11 dígitos.")
+        return cpf
+
+    def clean(self):
+        # Confere pelo valor normalizado, o mesmo do índice único: sem isto, editar um
+        # cadastro antigo com CPF repetido só falharia no banco (IntegrityError).
+        cleaned_data = super().clean()
+        equipe = cleaned_data.get('equipe', self.equipe)
+        digitos = somente_digitos(cleaned_data.get('cpf'))
+        if digitos and equipe is not None:
+            duplicado = Cliente.objects.filter(equipe=equipe, cpf_normalizado=digitos).exclude(pk=self.instance.pk)
+            if duplicado.exists():
+                self.add_error('cpf', "Já existe um cliente com este CPF nesta equipe.")
+        return cleaned_data
+
+
+class ClienteAdminForm(ClienteForm):
+    """ClienteForm com a equipe editável, para o admin."""
+    class Meta(ClienteForm.Meta):
+        exclude = []
+        fields = '__all__'
+
 class FornecedorForm(forms.ModelForm):
     class Meta: model = Fornecedor; exclude = ['equipe']
 
@@ -35,27 +69,44 @@ class ProdutoForm(forms.ModelForm):
     class Meta: model = Produto; exclude = ['equipe']
 
 class EncomendaForm(forms.ModelForm):
+    # Versão lida ao abrir o formulário, usada para detectar edições concorrentes.
+    versao = forms.IntegerField(widget=forms.HiddenInput, required=False, min_value=1)
+    # Gerada ao abrir o formulário de criação; o mesmo envio repetido não duplica a encomenda.
+    chave_idempotencia = forms.CharField(widget=forms.HiddenInput, required=False, max_length=64)
+
     class Meta:
         model = Encomenda
         # Campos a serem preenchidos na criação/edição da encomenda
-        fields = ['cliente', 'valor_pago_adiantamento', 'data_prevista_entrega', 'observacoes', 'status']
+        fields = ['cliente', 'valor_pago_adiantamento', 'data_prevista_entrega', 'recorrencia_dias', 'observacoes', 'status']
         widgets = {
             'cliente': forms.Select(attrs={'class': 'form-control'}),
             'valor_pago_adiantamento': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
             'data_prevista_entrega': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'recorrencia_dias': forms.NumberInput(attrs={'class': 'form-control', 'min': '1', 'placeholder': 'Não se repete'}),
             'observacoes': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'status': forms.Select(attrs={'class': 'form-control'}), # Para alterar o status na edição
         }
     
     def __init__(self, user, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['versao'].initial = self.instance.versao
         if user.is_authenticated and user.equipe:
             self.fields['cliente'].queryset = Cliente.objects.filter(equipe=user.equipe).order_by('nome')
         else:
             self.fields['cliente'].queryset = Cliente.objects.none()
 
+    def clean(self):
+        cleaned_data = super().clean()
+        # Sem a versão lida não há como detectar a edição concorrente: recusa em vez de sobrescrever.
+        if self.instance.pk and cleaned_data.get('versao') is None and 'versao' not in self.errors:
+            self.add_error(None, 'Não foi possível identificar a versão da encomenda. Recarregue a página e edite novamente.')
+        return cleaned_data
+
 class EntregaForm(forms.ModelForm):
     """Formulário apenas para os dados da execução da entrega."""
+    # Desenho do canvas (data URL PNG); vira arquivo em anexar_assinatura.
+    assinatura_desenho = forms.CharField(widget=forms.HiddenInput, required=False)
+
     class Meta:
         model = Entrega
         fields = ['responsavel_entrega', 'data_entrega_realizada', 'hora_entrega', 'entregue_por', 'assinatura_cliente']
@@ -67,6 +118,21 @@ class EntregaForm(forms.ModelForm):
             'assinatura_cliente': forms.TextInput(attrs={'class': 'form-control'}),
         }
 
+    def clean_assinatura_desenho(self):
+        desenho = self.cleaned_data['assinatura_desenho']
+        if not desenho:
+            return None
+        try:
+            return assinaturas.comprimir(desenho)
+        except assinaturas.AssinaturaInvalida as erro:
+            raise forms.ValidationError(str(erro))
+
+    def anexar_assinatura(self, entrega):
+        """Chamado depois de a entrega ter a encomenda (o caminho do arquivo usa a equipe)."""
+        png = self.cleaned_data.get('assinatura_desenho')
+        if png:
+            assinaturas.anexar(entrega, png)
+
 
 class ItemEncomendaForm(forms.ModelForm):
     class Meta:
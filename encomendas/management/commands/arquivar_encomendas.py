@@ -0,0 +1,94 @@
+"""
+Move encomendas finalizadas antigas (com itens e entrega) para as tabelas de arquivo.
+
+Cada lote é movido em uma transação própria: ou a encomenda está inteira nas tabelas
+principais, ou inteira no arquivo. Se o comando for interrompido, basta rodá-lo de
+novo — ele continua a partir do que ainda não foi movido.
+
+Encomendas entregues com recorrência ativa ficam: são elas que levam a recorrência
+para a próxima repetição (repetir_encomendas), e o arquivo não guarda esses campos.
+"""
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from encomendas.models import (
+    Encomenda, ItemEncomenda, Entrega, EncomendaArquivada, ItemEncomendaArquivado, EntregaArquivada
+)
+
+STATUS_FINALIZADOS = ['entregue', 'cancelada']
+
+
+def _campos_comuns(origem, destino):
+    """Colunas presentes nos dois modelos (pelo attname), na ordem do destino."""
+    da_origem = {campo.attname for campo in origem._meta.concrete_fields}
+    return [campo.attname for campo in destino._meta.concrete_fields if campo.attname in da_origem]
+
+
+def _meses_atras(meses):
+    hoje = timezone.localdate()
+    total = hoje.year * 12 + hoje.month - 1 - meses
+    return timezone.make_aware(datetime.combine(date(total // 12, total % 12 + 1, 1), time.min))
+
+
+class Command(BaseCommand):
+    help = 'Arquiva encomendas entregues/canceladas mais antigas que N meses, em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--meses', type=int, default=6,
+                            help='Arquiva encomendas feitas antes do início do mês de N meses atrás (padrão: 6).')
+        parser.add_argument('--lote', type=int, default=500, help='Encomendas por transação (padrão: 500).')
+        parser.add_argument('--equipe', type=int, help='Arquiva apenas a equipe com este id.')
+        parser.add_argument('--max-lotes', type=int, help='Para depois de N lotes (para rodar em janelas curtas).')
+
+    def handle(self, *args, **options):
+        corte = _meses_atras(options['meses'])
+        candidatas = Encomenda.objects.filter(status__in=STATUS_FINALIZADOS, data_encomenda__lt=corte).exclude(
+            status='entregue', proxima_recorrencia__isnull=False,
+        )
+        if options['equipe']:
+            candidatas = candidatas.filter(equipe_id=options['equipe'])
+
+        total, lotes = 0, 0
+        while options['max_lotes'] is None or lotes < options['max_lotes']:
+            movidas = self._arquivar_lote(candidatas, options['lote'])
+            if not movidas:
+                break
+            total += movidas
+            lotes += 1
+            self.stdout.write(f'Lote {lotes}: {movidas} encomenda(s) arquivada(s) (total {total})')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} encomenda(s) anteriores a {corte:%d/%m/%Y} arquivada(s).'
+        ))
+
+    @transaction.atomic
+    def _arquivar_lote(self, candidatas, tamanho):
+        # Trava o lote (pulando o que estiver em edição) para o status não mudar durante a cópia.
+        pks = list(
+            candidatas.order_by('numero_encomenda').select_for_update(skip_locked=True)
+            .values_list('pk', flat=True)[:tamanho]
+        )
+        if not pks:
+            return 0
+
+        EncomendaArquivada.objects.bulk_create(
+            EncomendaArquivada(**valores)
+            for valores in Encomenda.objects.filter(pk__in=pks).values(*_campos_comuns(Encomenda, EncomendaArquivada))
+        )
+        ItemEncomendaArquivado.objects.bulk_create(
+            ItemEncomendaArquivado(**valores)
+            for valores in ItemEncomenda.objects.filter(encomenda_id__in=pks)
+            .values(*_campos_comuns(ItemEncomenda, ItemEncomendaArquivado))
+        )
+        EntregaArquivada.objects.bulk_create(
+            EntregaArquivada(**valores)
+            for valores in Entrega.objects.filter(encomenda_id__in=pks).values(*_campos_comuns(Entrega, EntregaArquivada))
+        )
+
+        ItemEncomenda.objects.filter(encomenda_id__in=pks).delete()
+        Entrega.objects.filter(encomenda_id__in=pks).delete()
+        Encomenda.objects.filter(pk__in=pks).delete()
+        return len(pks)
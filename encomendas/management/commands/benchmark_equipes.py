@@ -0,0 +1,112 @@
+"""
+Benchmark da latência das consultas por equipe com muitas farmácias no mesmo banco.
+
+Gera (uma única vez) equipes sintéticas "Benchmark NNN" com o volume pedido e mede as
+consultas que as telas fazem para uma equipe: primeira página da lista, contagem de
+pendentes e itens das encomendas em aberto. Rode antes e depois de
+`particionar_encomendas` para comparar:
+
+    python manage.py benchmark_equipes --gerar --equipes 50 --encomendas 100000
+    python manage.py benchmark_equipes
+    python manage.py particionar_encomendas --estrategia equipe --particoes 64
+    python manage.py benchmark_equipes
+"""
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from encomendas.models import Equipe, Cliente, Produto, Fornecedor, Encomenda, ItemEncomenda
+
+PREFIXO = 'Benchmark '
+LOTE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência das consultas por equipe (gera dados sintéticos com --gerar).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gerar', action='store_true', help='Gera os dados sintéticos antes de medir.')
+        parser.add_argument('--limpar', action='store_true', help='Remove os dados sintéticos e sai.')
+        parser.add_argument('--equipes', type=int, default=50, help='Equipes sintéticas (padrão: 50).')
+        parser.add_argument('--encomendas', type=int, default=100000, help='Encomendas por equipe (padrão: 100000).')
+        parser.add_argument('--amostras', type=int, default=20, help='Equipes sorteadas para medir (padrão: 20).')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Execuções de cada consulta por equipe.')
+
+    def handle(self, *args, **options):
+        if options['limpar']:
+            Equipe.objects.filter(nome__startswith=PREFIXO).delete()
+            self.stdout.write(self.style.SUCCESS('Dados sintéticos removidos.'))
+            return
+        if options['gerar']:
+            self._gerar(options['equipes'], options['encomendas'])
+
+        equipes = list(Equipe.objects.filter(nome__startswith=PREFIXO).values_list('pk', flat=True))
+        if not equipes:
+            self.stderr.write('Nenhuma equipe sintética encontrada; use --gerar.')
+            return
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE encomendas_encomenda; ANALYZE encomendas_itemencomenda')
+
+        amostra = random.sample(equipes, min(options['amostras'], len(equipes)))
+        consultas = {
+            'lista (1ª página)': lambda equipe: list(
+                Encomenda.objects.filter(equipe_id=equipe).select_related('cliente').order_by('-numero_encomenda')[:20]
+            ),
+            'pendentes (count)': lambda equipe: Encomenda.objects.filter(equipe_id=equipe)
+                .exclude(status__in=['entregue', 'cancelada']).count(),
+            'itens em aberto': lambda equipe: list(
+                ItemEncomenda.objects.filter(encomenda__equipe_id=equipe, encomenda__status='aprovada')
+                .values_list('pk', flat=True)[:200]
+            ),
+        }
+        self.stdout.write(
+            f'{len(equipes)} equipes, {Encomenda.objects.filter(equipe_id__in=equipes).count()} encomendas; '
+            f'medindo {len(amostra)} equipes x {options["repeticoes"]} repetições\n'
+        )
+        self.stdout.write(f'{"consulta":<20}{"p50 ms":>10}{"p95 ms":>10}{"máx ms":>10}')
+        for nome, consulta in consultas.items():
+            tempos = []
+            for equipe in amostra:
+                consulta(equipe)  # aquece o cache antes de medir
+                for _ in range(options['repeticoes']):
+                    inicio = time.perf_counter()
+                    consulta(equipe)
+                    tempos.append((time.perf_counter() - inicio) * 1000)
+            tempos.sort()
+            p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+            self.stdout.write(f'{nome:<20}{statistics.median(tempos):>10.2f}{p95:>10.2f}{tempos[-1]:>10.2f}')
+
+    def _gerar(self, quantidade_equipes, encomendas_por_equipe):
+        status = [codigo for codigo, _ in Encomenda.STATUS_CHOICES]
+        agora = timezone.now()
+        existentes = Equipe.objects.filter(nome__startswith=PREFIXO).count()
+        for indice in range(existentes, quantidade_equipes):
+            with transaction.atomic():
+                equipe = Equipe.objects.create(nome=f'{PREFIXO}{indice:03d}')
+                clientes = Cliente.objects.bulk_create(
+                    Cliente(equipe=equipe, nome=f'Cliente {n}', bairro=f'Bairro {n % 10}') for n in range(50)
+                )
+                produto = Produto.objects.create(equipe=equipe, nome='Produto', codigo='P1', preco_base=Decimal('9.90'))
+                fornecedor = Fornecedor.objects.create(equipe=equipe, nome='Fornecedor', codigo='F1')
+                for inicio in range(0, encomendas_por_equipe, LOTE):
+                    encomendas = Encomenda.objects.bulk_create(
+                        Encomenda(
+                            equipe=equipe, cliente=random.choice(clientes), status=random.choice(status),
+                            data_encomenda=agora - timezone.timedelta(minutes=n), valor_total=Decimal('9.90'),
+                        )
+                        for n in range(inicio, min(inicio + LOTE, encomendas_por_equipe))
+                    )
+                    ItemEncomenda.objects.bulk_create(
+                        ItemEncomenda(
+                            encomenda=encomenda, produto=produto, fornecedor=fornecedor,
+                            preco_cotado=Decimal('9.90'), valor_total=Decimal('9.90'),
+                        )
+                        for encomenda in encomendas
+                    )
+            self.stdout.write(f'{equipe.nome}: {encomendas_por_equipe} encomendas geradas')
@@ -0,0 +1,103 @@
+"""
+Benchmark do custo de sessão e autenticação por requisição.
+
+Para cada perfil de sessão (db, cached_db, signed_cookies) e carregamento do usuário
+(ModelBackend padrão ou BackendComCache), faz requisições autenticadas a
+`api_produto_info` e ao `dashboard` e mostra as consultas por requisição (separando
+as de sessão/usuário/equipe das da própria view) e o tempo médio:
+
+    python manage.py benchmark_sessao --usuario joao.farma
+    python manage.py benchmark_sessao --usuario joao.farma --repeticoes 200
+
+As medições usam um cache em arquivo próprio, num diretório temporário: limpar o
+cache entre as combinações não derruba as sessões, os usuários e as listagens
+guardados no cache do site.
+"""
+import re
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from encomendas.models import Produto
+
+PERFIS = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+BACKENDS = {
+    'padrão': 'django.contrib.auth.backends.ModelBackend',
+    'com cache': 'encomendas.autenticacao.BackendComCache',
+}
+TABELAS_AUTENTICACAO = ('django_session', 'encomendas_customuser', 'encomendas_equipe')
+
+
+class Command(BaseCommand):
+    help = 'Compara consultas e tempo por requisição entre perfis de sessão e carregamento do usuário.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', required=True, help='Usuário (com equipe e produtos) usado nas requisições.')
+        parser.add_argument('--repeticoes', type=int, default=50, help='Requisições medidas por combinação (padrão: 50).')
+
+    def handle(self, *args, **options):
+        try:
+            usuario = get_user_model().objects.get(username=options['usuario'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'Usuário {options["usuario"]} não encontrado.')
+        produto = Produto.objects.filter(equipe_id=usuario.equipe_id).first()
+        if produto is None:
+            raise CommandError('O usuário precisa de uma equipe com pelo menos um produto.')
+        urls = {
+            'api_produto_info': reverse('api_produto_info', args=[produto.pk]),
+            'dashboard': reverse('dashboard'),
+        }
+
+        with tempfile.TemporaryDirectory() as diretorio, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': diretorio},
+            'listagens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'},
+        }):
+            self._comparar(usuario, urls, options['repeticoes'])
+
+    def _comparar(self, usuario, urls, repeticoes):
+        self.stdout.write(
+            f'{"sessão":<16}{"usuário":<12}{"view":<18}{"consultas":>10}{"sessão+auth":>13}{"ms/req":>9}'
+        )
+        for perfil, engine in PERFIS.items():
+            for nome_backend, backend in BACKENDS.items():
+                with override_settings(SESSION_ENGINE=engine, AUTHENTICATION_BACKENDS=[backend],
+                                       ALLOWED_HOSTS=['testserver']):
+                    cache.clear()
+                    cliente = Client()
+                    cliente.force_login(usuario, backend=backend)
+                    for nome_url, url in urls.items():
+                        consultas, de_autenticacao, ms = self._medir(cliente, url, repeticoes)
+                        self.stdout.write(
+                            f'{perfil:<16}{nome_backend:<12}{nome_url:<18}{consultas:>10}{de_autenticacao:>13}{ms:>9.2f}'
+                        )
+
+    def _medir(self, cliente, url, repeticoes):
+        resposta = cliente.get(url)  # aquece o cache de sessão/usuário
+        if resposta.status_code != 200:
+            raise CommandError(f'{url} respondeu {resposta.status_code}.')
+        with CaptureQueriesContext(connection) as capturadas:
+            cliente.get(url)
+        # Copiadas já: cada requisição seguinte limpa o registro de consultas da conexão.
+        consultas = [consulta['sql'] for consulta in capturadas.captured_queries]
+        de_autenticacao = sum(
+            1 for sql in consultas
+            if (tabela := re.search(r'FROM "(\w+)"', sql)) and tabela.group(1) in TABELAS_AUTENTICACAO
+        )
+        tempos = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            cliente.get(url)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return len(consultas), de_autenticacao, statistics.mean(tempos)
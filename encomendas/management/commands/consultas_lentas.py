@@ -0,0 +1,75 @@
+"""
+Resume o registro de consultas lentas (ver encomendas/consultas_lentas.py), agrupando
+pela impressão digital do SQL normalizado:
+
+    python manage.py consultas_lentas                   # top 20 por tempo total
+    python manage.py consultas_lentas --ordenar maximo --top 5 --explain
+    python manage.py consultas_lentas --desde 2026-10-01 --rota encomenda_list
+"""
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from encomendas.consultas_lentas import configuracao, ler_registros
+
+ORDENACOES = {
+    'total': lambda grupo: grupo['total_ms'],
+    'maximo': lambda grupo: grupo['maximo_ms'],
+    'quantidade': lambda grupo: grupo['quantidade'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Mostra as consultas lentas registradas, agrupadas por impressão digital.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ordenar', choices=ORDENACOES, default='total', help='Critério (padrão: total).')
+        parser.add_argument('--top', type=int, default=20, help='Quantidade de grupos exibidos (padrão: 20).')
+        parser.add_argument('--desde', help='Considera só registros a partir desta data (AAAA-MM-DD).')
+        parser.add_argument('--rota', help='Considera só consultas desta rota (nome da view).')
+        parser.add_argument('--explain', action='store_true', help='Mostra o plano mais recente de cada grupo.')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = parse_date(options['desde'])
+            if desde is None:
+                raise CommandError('--desde deve estar no formato AAAA-MM-DD')
+
+        grupos = defaultdict(lambda: {'duracoes': [], 'rotas': Counter(), 'origens': Counter(), 'explain': None})
+        for registro in ler_registros(configuracao()):
+            if desde and registro['quando'][:10] < desde.isoformat():
+                continue
+            if options['rota'] and registro['rota'] != options['rota']:
+                continue
+            grupo = grupos[registro['impressao']]
+            grupo['sql'] = registro['sql']
+            grupo['duracoes'].append(registro['duracao_ms'])
+            grupo['rotas'][registro['rota']] += 1
+            grupo['origens'][registro['origem']] += 1
+            grupo['explain'] = registro.get('explain') or grupo['explain']
+
+        if not grupos:
+            self.stdout.write('Nenhuma consulta lenta registrada.')
+            return
+
+        for impressao, grupo in grupos.items():
+            duracoes = sorted(grupo['duracoes'])
+            grupo.update(
+                impressao=impressao, quantidade=len(duracoes), total_ms=sum(duracoes), maximo_ms=duracoes[-1],
+                p95_ms=duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.95))],
+            )
+        ordenados = sorted(grupos.values(), key=ORDENACOES[options['ordenar']], reverse=True)[:options['top']]
+
+        self.stdout.write(f'{"impressão":<14}{"qtd":>6}{"total ms":>12}{"p95 ms":>10}{"máx ms":>10}  rota / origem')
+        for grupo in ordenados:
+            rota = grupo['rotas'].most_common(1)[0][0]
+            origem = grupo['origens'].most_common(1)[0][0]
+            self.stdout.write(
+                f'{grupo["impressao"]:<14}{grupo["quantidade"]:>6}{grupo["total_ms"]:>12.0f}'
+                f'{grupo["p95_ms"]:>10.0f}{grupo["maximo_ms"]:>10.0f}  {rota} / {origem}'
+            )
+            self.stdout.write(f'    {grupo["sql"][:300]}')
+            if options['explain'] and grupo['explain']:
+                self.stdout.write('    ' + grupo['explain'].replace('\n', '\n    '))
@@ -0,0 +1,49 @@
+"""
+Envia os avisos pendentes da fila de notificações (ver encomendas/notificacoes.py).
+
+    python manage.py enviar_notificacoes                 # uma rodada (cron)
+    python manage.py enviar_notificacoes --continuo      # repete a cada --intervalo segundos
+
+Para testar o e-mail localmente, suba um servidor de depuração na porta das settings:
+    python -m aiosmtpd -n -l localhost:1025
+"""
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from encomendas.notificacoes import configuracao, despachar
+
+
+class Command(BaseCommand):
+    help = 'Envia os avisos de encomenda pronta, agrupados por cliente e canal.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Notificações por rodada (padrão: NOTIFICACOES["LOTE"]).')
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando até ser interrompido.')
+        parser.add_argument('--intervalo', type=float, default=30, help='Segundos entre rodadas no modo contínuo.')
+
+    def handle(self, *args, **options):
+        config = configuracao()
+        if options['lote']:
+            config['LOTE'] = options['lote']
+        ritmo = defaultdict(float)
+        try:
+            self._rodar(config, ritmo, options)
+        except KeyboardInterrupt:
+            pass
+
+    def _rodar(self, config, ritmo, options):
+        while True:
+            resultado = despachar(config, ritmo=ritmo)
+            if resultado or not options['continuo']:
+                self.stdout.write(
+                    f"Enviadas: {resultado.get('enviadas', 0)} ({resultado.get('mensagens', 0)} mensagens), "
+                    f"reagendadas: {resultado.get('reagendadas', 0)}, falharam: {resultado.get('falharam', 0)}, "
+                    f"descartadas: {resultado.get('descartadas', 0)}, devolvidas à fila: {resultado.get('devolvidas', 0)}"
+                )
+            if not options['continuo']:
+                break
+            # Lote cheio: ainda há fila, segue sem esperar.
+            if sum(resultado.values()) - resultado.get('mensagens', 0) < config['LOTE']:
+                time.sleep(options['intervalo'])
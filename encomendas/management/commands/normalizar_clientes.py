@@ -0,0 +1,63 @@
+"""
+Preenche cpf_normalizado/telefone_normalizado dos clientes cadastrados antes dessas colunas.
+
+Percorre a tabela em lotes pela chave primária (cada lote em sua transação), então pode
+ser interrompido e rodado de novo. CPFs repetidos dentro da mesma equipe não podem ser
+gravados por causa do índice único: o primeiro cadastro fica com o CPF normalizado e os
+demais são listados para revisão manual.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from encomendas.cache_equipe import invalidar
+from encomendas.models import Cliente, somente_digitos
+
+
+class Command(BaseCommand):
+    help = 'Normaliza CPF e telefone dos clientes existentes, em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Clientes por transação (padrão: 1000).')
+
+    def handle(self, *args, **options):
+        ultimo_pk, total, duplicados = 0, 0, []
+        while True:
+            with transaction.atomic():
+                clientes = list(
+                    Cliente.objects.filter(pk__gt=ultimo_pk).order_by('pk')
+                    .only('pk', 'equipe_id', 'cpf', 'telefone', 'cpf_normalizado', 'telefone_normalizado')
+                    [:options['lote']]
+                )
+                if not clientes:
+                    break
+                ultimo_pk = clientes[-1].pk
+                alterados = self._normalizar_lote(clientes, duplicados)
+                Cliente.objects.bulk_update(alterados, ['cpf_normalizado', 'telefone_normalizado'])
+                for equipe_id in {cliente.equipe_id for cliente in alterados}:
+                    invalidar(equipe_id, 'clientes')
+            total += len(alterados)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} cliente(s) normalizado(s).'))
+        for cliente in duplicados:
+            self.stdout.write(self.style.WARNING(
+                f'CPF {cliente.cpf} repetido na equipe {cliente.equipe_id}: cliente {cliente.pk} não normalizado.'
+            ))
+
+    def _normalizar_lote(self, clientes, duplicados):
+        cpfs = {somente_digitos(cliente.cpf) for cliente in clientes} - {''}
+        donos = {
+            (equipe, cpf): pk for equipe, cpf, pk in
+            Cliente.objects.filter(cpf_normalizado__in=cpfs).values_list('equipe_id', 'cpf_normalizado', 'pk')
+        }
+
+        alterados = []
+        for cliente in clientes:
+            cpf = somente_digitos(cliente.cpf)
+            telefone = somente_digitos(cliente.telefone)
+            if cpf and donos.setdefault((cliente.equipe_id, cpf), cliente.pk) != cliente.pk:
+                duplicados.append(cliente)
+                cpf = ''
+            if (cpf, telefone) != (cliente.cpf_normalizado, cliente.telefone_normalizado):
+                cliente.cpf_normalizado, cliente.telefone_normalizado = cpf, telefone
+                alterados.append(cliente)
+        return alterados
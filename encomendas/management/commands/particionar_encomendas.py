@@ -0,0 +1,266 @@
+"""
+Converte as tabelas de encomendas e itens em tabelas particionadas do PostgreSQL.
+
+Estratégias:
+  equipe  encomendas particionadas por HASH(equipe_id): cada farmácia fica em uma
+          partição própria (ou compartilhada com poucas outras), com índices, vacuum
+          e cache separados.
+  data    encomendas particionadas por faixas mensais de data_encomenda, com uma
+          partição DEFAULT para datas fora das faixas criadas.
+
+Os itens não têm equipe nem data, então são sempre particionados por
+HASH(encomenda_id): todos os itens de uma encomenda ficam na mesma partição.
+
+O PostgreSQL exige que a chave primária de uma tabela particionada inclua a chave
+de partição, então a PK passa a ser composta (numero_encomenda, equipe_id) e
+(id, encomenda_id). Sem uma restrição única só em numero_encomenda não é possível
+manter FOREIGN KEYs apontando para a encomenda, por isso as FKs que chegam às
+tabelas particionadas (itens -> encomenda, entrega -> encomenda, ...) são
+substituídas por triggers com a mesma semântica (verificação na inclusão/alteração
+e bloqueio da exclusão de quem ainda tem dependentes). As FKs que saem das tabelas
+(equipe, cliente, produto, fornecedor...) e os unique_together das demais tabelas
+continuam como estão.
+
+Restrições e índices únicos das tabelas particionadas também precisam incluir a
+chave de partição. Se algum não incluir, o comando recusa a conversão em vez de
+trocá-lo por um índice comum: (equipe_id, chave_idempotencia) é o que impede
+encomendas duplicadas no reenvio de formulários, no lote da API e nas repetições,
+então a estratégia "data" é recusada enquanto essa restrição existir.
+
+Depois de particionar, novas FKs para Encomenda ou ItemEncomenda criadas por
+migrations precisam de db_constraint=False; rode este comando com --religar para
+criar as triggers equivalentes.
+"""
+from datetime import date
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from encomendas.models import Encomenda, ItemEncomenda
+
+
+def _adicionar_meses(dia, meses):
+    total = dia.year * 12 + dia.month - 1 + meses
+    return date(total // 12, total % 12 + 1, 1)
+
+
+class Command(BaseCommand):
+    help = 'Particiona encomendas (por equipe ou por data) e itens (por encomenda) no PostgreSQL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--estrategia', choices=['equipe', 'data'], default='equipe',
+                            help='Chave de partição das encomendas (padrão: equipe).')
+        parser.add_argument('--particoes', type=int, default=16,
+                            help='Número de partições hash (encomendas por equipe e itens). Padrão: 16.')
+        parser.add_argument('--meses-futuros', type=int, default=12,
+                            help='Estratégia "data": quantos meses à frente já criar. Padrão: 12.')
+        parser.add_argument('--sql', action='store_true', help='Apenas mostra o SQL, sem executar.')
+        parser.add_argument('--religar', action='store_true',
+                            help='Apenas recria as triggers das FKs que apontam para as tabelas já particionadas.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('O particionamento declarativo só está disponível no PostgreSQL.')
+        if options['particoes'] < 2:
+            raise CommandError('Use pelo menos 2 partições.')
+
+        self.comandos = []
+        encomenda, item = Encomenda._meta.db_table, ItemEncomenda._meta.db_table
+        with connection.cursor() as cursor:
+            self.cursor = cursor
+            particionadas = {tabela for tabela in (encomenda, item) if self._particionada(tabela)}
+            referencias = self._referencias((Encomenda, ItemEncomenda))
+            if options['religar']:
+                if particionadas != {encomenda, item}:
+                    raise CommandError('As tabelas ainda não foram particionadas.')
+            elif particionadas:
+                raise CommandError(f'Tabela(s) já particionada(s): {", ".join(sorted(particionadas))}.')
+            else:
+                self.removidas = {restricao for ref in referencias for restricao in ref['restricoes']}
+                for ref in referencias:
+                    for restricao in ref['restricoes']:
+                        self.comandos.append(f'ALTER TABLE {ref["tabela"]} DROP CONSTRAINT {restricao}')
+
+                if options['estrategia'] == 'equipe':
+                    self._converter(encomenda, 'numero_encomenda', 'equipe_id',
+                                    self._particoes_hash(encomenda, options['particoes']), 'HASH (equipe_id)')
+                else:
+                    self._converter(encomenda, 'numero_encomenda', 'data_encomenda',
+                                    self._particoes_mensais(encomenda, options['meses_futuros']), 'RANGE (data_encomenda)')
+                self._converter(item, 'id', 'encomenda_id',
+                                self._particoes_hash(item, options['particoes']), 'HASH (encomenda_id)')
+
+            for ref in referencias:
+                self._trigger_fk(ref)
+
+            if options['sql']:
+                self.stdout.write(';\n'.join(self.comandos) + ';')
+                return
+            with transaction.atomic():
+                for sql in self.comandos:
+                    cursor.execute(sql)
+        self.stdout.write(self.style.SUCCESS(
+            f'Tabelas particionadas ({options["estrategia"]}); {len(referencias)} FK(s) convertida(s) em trigger.'
+        ))
+
+    # --- Leitura do catálogo ---
+
+    def _particionada(self, tabela):
+        self.cursor.execute("SELECT relkind FROM pg_class WHERE oid = %s::regclass", [tabela])
+        return self.cursor.fetchone()[0] == 'p'
+
+    def _referencias(self, modelos):
+        """Colunas de outras tabelas que referenciam os modelos particionados, com o nome da FK no banco (se houver)."""
+        referencias = []
+        for modelo in apps.get_models():
+            for campo in modelo._meta.local_concrete_fields:
+                if not campo.is_relation or campo.related_model not in modelos:
+                    continue
+                tabela, alvo = modelo._meta.db_table, campo.related_model._meta.db_table
+                self.cursor.execute(
+                    """
+                    SELECT c.conname FROM pg_constraint c
+                    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+                    WHERE c.contype = 'f' AND c.conrelid = %s::regclass AND c.confrelid = %s::regclass
+                      AND a.attname = %s
+                    """,
+                    [tabela, alvo, campo.column],
+                )
+                referencias.append({
+                    'nome': f'{tabela}_{campo.column}_fk',
+                    'restricoes': [linha[0] for linha in self.cursor.fetchall()],
+                    'tabela': tabela,
+                    'coluna': campo.column,
+                    'alvo': alvo,
+                    'alvo_coluna': campo.target_field.column,
+                })
+        return referencias
+
+    def _indices(self, tabela, chave):
+        """Índices não ligados a PK/UNIQUE, para recriar com o mesmo nome na tabela nova."""
+        self.cursor.execute(
+            """
+            SELECT ci.relname, pg_get_indexdef(i.indexrelid), i.indisunique,
+                   ARRAY(SELECT attname FROM pg_attribute WHERE attrelid = i.indrelid AND attnum = ANY(i.indkey))
+            FROM pg_index i JOIN pg_class ci ON ci.oid = i.indexrelid
+            WHERE i.indrelid = %s::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+            """,
+            [tabela],
+        )
+        indices = []
+        for nome, definicao, unico, colunas in self.cursor.fetchall():
+            if unico and chave not in colunas:
+                self._recusar_unicidade(nome, colunas, chave)
+            indices.append(definicao)
+        return indices
+
+    def _recusar_unicidade(self, nome, colunas, chave):
+        raise CommandError(
+            f'{nome} ({", ".join(colunas)}) não inclui a chave de partição {chave}; a tabela particionada '
+            'não teria como garantir a unicidade. Use outra estratégia.'
+        )
+
+    def _restricoes(self, tabela, tipos):
+        self.cursor.execute(
+            """
+            SELECT conname, contype, pg_get_constraintdef(oid),
+                   ARRAY(SELECT attname FROM pg_attribute WHERE attrelid = conrelid AND attnum = ANY(conkey))
+            FROM pg_constraint WHERE conrelid = %s::regclass AND contype::text = ANY(%s)
+            """,
+            [tabela, list(tipos)],
+        )
+        return self.cursor.fetchall()
+
+    # --- Geração do SQL ---
+
+    def _particoes_hash(self, tabela, quantidade):
+        return [
+            f'CREATE TABLE {tabela}_p{resto:02d} PARTITION OF {tabela} '
+            f'FOR VALUES WITH (MODULUS {quantidade}, REMAINDER {resto})'
+            for resto in range(quantidade)
+        ]
+
+    def _particoes_mensais(self, tabela, meses_futuros):
+        self.cursor.execute(f'SELECT MIN(data_encomenda) FROM {tabela}')
+        menor = self.cursor.fetchone()[0]
+        inicio = date((menor or date.today()).year, (menor or date.today()).month, 1)
+        fim = _adicionar_meses(date.today().replace(day=1), meses_futuros)
+        particoes = []
+        mes = inicio
+        while mes < fim:
+            seguinte = _adicionar_meses(mes, 1)
+            particoes.append(
+                f"CREATE TABLE {tabela}_{mes:%Y%m} PARTITION OF {tabela} "
+                f"FOR VALUES FROM ('{mes.isoformat()}') TO ('{seguinte.isoformat()}')"
+            )
+            mes = seguinte
+        particoes.append(f'CREATE TABLE {tabela}_default PARTITION OF {tabela} DEFAULT')
+        return particoes
+
+    def _converter(self, tabela, pk, chave, particoes, particionamento):
+        """Recria a tabela como particionada, copiando dados, índices e FKs de saída."""
+        antiga, sequencia = f'{tabela}_antiga', f'{tabela}_{pk}_seq'
+        indices = self._indices(tabela, chave)
+        fks_saida = self._restricoes(tabela, 'f')
+        unicas = self._restricoes(tabela, 'u')
+        for nome, _, _, colunas in unicas:
+            if chave not in colunas:
+                self._recusar_unicidade(nome, colunas, chave)
+        self.comandos += [
+            f'ALTER TABLE {tabela} RENAME TO {antiga}',
+            f'CREATE TABLE {tabela} (LIKE {antiga} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY {particionamento}',
+            *particoes,
+            f'INSERT INTO {tabela} SELECT * FROM {antiga}',
+            # A sequência de identidade da tabela antiga tem o mesmo nome e só some junto com ela.
+            f'DROP TABLE {antiga}',
+            f'CREATE SEQUENCE {sequencia} OWNED BY {tabela}.{pk}',
+            f"ALTER TABLE {tabela} ALTER COLUMN {pk} SET DEFAULT nextval('{sequencia}')",
+            f"SELECT setval('{sequencia}', COALESCE((SELECT MAX({pk}) FROM {tabela}), 0) + 1, false)",
+            f'ALTER TABLE {tabela} ADD CONSTRAINT {tabela}_pkey PRIMARY KEY ({pk}, {chave})',
+            *indices,
+            *[
+                f'ALTER TABLE {tabela} ADD CONSTRAINT {nome} {definicao}'
+                for nome, _, definicao, _ in fks_saida if nome not in self.removidas
+            ],
+            *[f'ALTER TABLE {tabela} ADD CONSTRAINT {nome} {definicao}' for nome, _, definicao, _ in unicas],
+        ]
+
+    def _trigger_fk(self, ref):
+        """Substitui uma FK para tabela particionada por triggers com o mesmo efeito."""
+        nome = ref['nome'][:50]
+        tabela, coluna, alvo, alvo_coluna = ref['tabela'], ref['coluna'], ref['alvo'], ref['alvo_coluna']
+        self.comandos += [
+            f"""CREATE OR REPLACE FUNCTION {nome}_verifica() RETURNS trigger AS $$
+BEGIN
+    IF NEW.{coluna} IS NULL THEN
+        RETURN NEW;
+    END IF;
+    -- FOR KEY SHARE, como as verificações de FK do próprio PostgreSQL: a linha pai fica
+    -- travada até o commit, então uma exclusão concorrente espera (ou já terá sumido).
+    PERFORM 1 FROM {alvo} WHERE {alvo_coluna} = NEW.{coluna} FOR KEY SHARE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'insert or update on table "{tabela}" violates foreign key "{ref['nome']}"'
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN NEW;
+END $$ LANGUAGE plpgsql""",
+            f'DROP TRIGGER IF EXISTS {nome}_verifica ON {tabela}',
+            f'CREATE TRIGGER {nome}_verifica AFTER INSERT OR UPDATE OF {coluna} ON {tabela} '
+            f'FOR EACH ROW EXECUTE FUNCTION {nome}_verifica()',
+            f"""CREATE OR REPLACE FUNCTION {nome}_restringe() RETURNS trigger AS $$
+BEGIN
+    -- Trava as filhas encontradas; uma inclusão ainda não confirmada segura a linha pai
+    -- (FOR KEY SHARE acima), e esta exclusão só segue depois dela, já vendo a filha.
+    PERFORM 1 FROM {tabela} WHERE {coluna} = OLD.{alvo_coluna} LIMIT 1 FOR KEY SHARE;
+    IF FOUND THEN
+        RAISE EXCEPTION 'update or delete on table "{alvo}" violates foreign key "{ref['nome']}" on table "{tabela}"'
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+    RETURN OLD;
+END $$ LANGUAGE plpgsql""",
+            f'DROP TRIGGER IF EXISTS {nome}_restringe ON {alvo}',
+            f'CREATE TRIGGER {nome}_restringe AFTER DELETE OR UPDATE OF {alvo_coluna} ON {alvo} '
+            f'FOR EACH ROW EXECUTE FUNCTION {nome}_restringe()',
+        ]
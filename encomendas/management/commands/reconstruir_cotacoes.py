@@ -0,0 +1,58 @@
+"""
+Reconstrói o índice de cotações (CotacaoRecente) a partir do histórico de itens.
+
+No dia a dia o índice é mantido a cada gravação de itens; este comando serve para a
+carga inicial e para corrigir o índice depois de importações feitas direto no banco.
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, Count, Max, OuterRef, Subquery
+
+from encomendas.models import ItemEncomenda, CotacaoRecente
+
+LOTE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a última cotação e o preço médio de cada produto por fornecedor.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--equipe', type=int, help='Reconstrói apenas a equipe com este id.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        itens = ItemEncomenda.objects.all()
+        cotacoes = CotacaoRecente.objects.all()
+        if options['equipe']:
+            itens = itens.filter(encomenda__equipe_id=options['equipe'])
+            cotacoes = cotacoes.filter(equipe_id=options['equipe'])
+
+        ultimo_preco = ItemEncomenda.objects.filter(
+            encomenda__equipe_id=OuterRef('encomenda__equipe_id'),
+            produto_id=OuterRef('produto_id'),
+            fornecedor_id=OuterRef('fornecedor_id'),
+        ).order_by('-encomenda__data_encomenda', '-pk').values('preco_cotado')[:1]
+        agrupados = (
+            itens.values('encomenda__equipe_id', 'produto_id', 'fornecedor_id')
+            .annotate(
+                preco=Subquery(ultimo_preco), data=Max('encomenda__data_encomenda'),
+                preco_medio=Avg('preco_cotado'), total_cotacoes=Count('pk'),
+            )
+            .order_by()
+        )
+
+        cotacoes.delete()
+        lote, total = [], 0
+        for linha in agrupados.iterator(chunk_size=LOTE):
+            lote.append(CotacaoRecente(
+                equipe_id=linha['encomenda__equipe_id'], produto_id=linha['produto_id'],
+                fornecedor_id=linha['fornecedor_id'], preco=linha['preco'], data=linha['data'],
+                preco_medio=linha['preco_medio'], total_cotacoes=linha['total_cotacoes'],
+            ))
+            if len(lote) == LOTE:
+                CotacaoRecente.objects.bulk_create(lote)
+                total += len(lote)
+                lote = []
+        CotacaoRecente.objects.bulk_create(lote)
+        total += len(lote)
+        self.stdout.write(self.style.SUCCESS(f'{total} cotação(ões) recalculada(s).'))
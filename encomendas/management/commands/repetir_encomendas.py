@@ -0,0 +1,48 @@
+"""
+Cria as repetições das encomendas recorrentes vencidas até a data (ver
+services.repetir_encomendas). Feito para rodar uma vez por dia (cron):
+
+    python manage.py repetir_encomendas
+    python manage.py repetir_encomendas --data 2026-11-01
+
+Cada lote é uma transação; a recorrência passa para a encomenda criada, então rodar de
+novo (ou recuperar dias perdidos com --data) não repete a mesma encomenda duas vezes.
+Encomendas canceladas não são repetidas.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from encomendas.models import Encomenda
+from encomendas.services import repetir_encomendas
+
+
+class Command(BaseCommand):
+    help = 'Repete as encomendas recorrentes com próxima repetição até a data, em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data', type=date.fromisoformat, help='Data de referência, AAAA-MM-DD (padrão: hoje).')
+        parser.add_argument('--lote', type=int, default=200, help='Encomendas por transação (padrão: 200).')
+        parser.add_argument('--equipe', type=int, help='Repete apenas as encomendas da equipe com este id.')
+
+    def handle(self, *args, **options):
+        data = options['data'] or timezone.localdate()
+        vencidas = Encomenda.objects.filter(proxima_recorrencia__lte=data).exclude(status='cancelada')
+        if options['equipe']:
+            vencidas = vencidas.filter(equipe_id=options['equipe'])
+
+        total = 0
+        while True:
+            with transaction.atomic():
+                # Pula as que estiverem em edição; ficam para a próxima execução.
+                lote = list(
+                    vencidas.order_by('proxima_recorrencia', 'numero_encomenda')
+                    .select_for_update(skip_locked=True)[:options['lote']]
+                )
+                if not lote:
+                    break
+                total += sum(criada for _, criada in repetir_encomendas(lote, data=data))
+
+        self.stdout.write(self.style.SUCCESS(f'{total} encomenda(s) recorrente(s) criada(s) para {data:%d/%m/%Y}.'))
@@ -0,0 +1,94 @@
+import cProfile
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from . import consultas_lentas
+from .perfilamento import AmostradorDePilha, configuracao, gravar_perfil, resumir_cprofile, resumir_pilhas
+
+
+class PerfilamentoMiddleware:
+    """
+    Perfila uma amostra das requisições com cProfile e guarda o perfil por amostragem
+    de pilha de toda requisição mais lenta que LIMIAR_MS (ver encomendas/perfilamento.py).
+    Desligado (e fora da cadeia de middlewares) enquanto PERFILAMENTO['ATIVO'] for False.
+
+    Respostas em streaming (manifesto de entregas) são medidas até o início do envio.
+    """
+
+    def __init__(self, get_response):
+        self.config = configuracao()
+        if not self.config['ATIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.amostrador = AmostradorDePilha(self.config['INTERVALO_MS'] / 1000)
+
+    def __call__(self, request):
+        thread_id = threading.get_ident()
+        perfil = None
+        if random.random() < self.config['AMOSTRA']:
+            perfil = cProfile.Profile()
+            try:
+                perfil.enable()
+            except ValueError:
+                perfil = None  # outro profiler ativo nesta thread
+        if perfil is None:
+            self.amostrador.iniciar(thread_id)
+
+        inicio_em, inicio = timezone.now(), time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            if perfil is not None:
+                perfil.disable()
+            else:
+                amostras = self.amostrador.parar(thread_id)
+
+        if perfil is None and duracao_ms < self.config['LIMIAR_MS']:
+            return response
+
+        if perfil is not None:
+            resumo = {'tipo': 'cprofile', **resumir_cprofile(perfil, self.config['TOP_FUNCOES'])}
+        else:
+            resumo = {'tipo': 'pilha', **resumir_pilhas(amostras, self.config['INTERVALO_MS'], self.config['TOP_FUNCOES'])}
+        rota = request.resolver_match.view_name if request.resolver_match else request.path
+        gravar_perfil(self.config, {
+            'rota': rota,
+            'metodo': request.method,
+            'caminho': request.get_full_path(),
+            'status': response.status_code,
+            'duracao_ms': round(duracao_ms, 2),
+            'inicio': inicio_em.isoformat(),
+            'usuario': getattr(getattr(request, 'user', None), 'username', ''),
+            **resumo,
+        })
+        return response
+
+
+class ConsultasLentasMiddleware:
+    """
+    Mede as consultas de cada requisição e registra as mais lentas que
+    CONSULTAS_LENTAS['LIMIAR_MS'] (ver encomendas/consultas_lentas.py). Desligado
+    enquanto CONSULTAS_LENTAS['ATIVO'] for False.
+
+    Consultas feitas depois do retorno da view (respostas em streaming) não são medidas.
+    """
+
+    def __init__(self, get_response):
+        self.config = consultas_lentas.configuracao()
+        if not self.config['ATIVO']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        monitor = consultas_lentas.MonitorDeConsultas(self.config, request)
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(monitor))
+            return self.get_response(request)
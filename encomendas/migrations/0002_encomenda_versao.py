@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encomenda',
+            name='versao',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Versão'),
+        ),
+    ]
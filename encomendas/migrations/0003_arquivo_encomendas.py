@@ -0,0 +1,64 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:55
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0002_encomenda_versao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncomendaArquivada',
+            fields=[
+                ('numero_encomenda', models.IntegerField(primary_key=True, serialize=False, verbose_name='Número da Encomenda')),
+                ('data_encomenda', models.DateTimeField(verbose_name='Data do Pedido')),
+                ('status', models.CharField(choices=[('criada', 'Criada'), ('cotacao', 'Em Cotação'), ('aprovada', 'Aprovada'), ('em_andamento', 'Em Andamento'), ('pronta', 'Pronta para Entrega'), ('entregue', 'Entregue'), ('cancelada', 'Cancelada')], max_length=20, verbose_name='Status')),
+                ('valor_pago_adiantamento', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10, verbose_name='Valor de Adiantamento')),
+                ('data_prevista_entrega', models.DateField(blank=True, null=True, verbose_name='Data Prevista para Entrega')),
+                ('observacoes', models.TextField(blank=True, verbose_name='Observações Gerais')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10, verbose_name='Valor Total dos Itens')),
+                ('updated_at', models.DateTimeField()),
+                ('versao', models.PositiveIntegerField(default=1, verbose_name='Versão')),
+                ('arquivada_em', models.DateTimeField(auto_now_add=True, verbose_name='Arquivada em')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='encomendas.cliente', verbose_name='Cliente')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='encomendas_arquivadas', to='encomendas.equipe')),
+                ('responsavel_criacao', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Responsável pelo Pedido')),
+            ],
+            options={
+                'verbose_name': 'Encomenda Arquivada',
+                'verbose_name_plural': 'Encomendas Arquivadas',
+                'ordering': ['-numero_encomenda'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntregaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('responsavel_entrega', models.CharField(blank=True, max_length=100, verbose_name='Responsável pela Entrega')),
+                ('data_entrega_realizada', models.DateField(blank=True, null=True, verbose_name='Data da Entrega')),
+                ('hora_entrega', models.TimeField(blank=True, null=True, verbose_name='Hora da Entrega')),
+                ('entregue_por', models.CharField(blank=True, max_length=100, verbose_name='Entregue por')),
+                ('assinatura_cliente', models.TextField(blank=True, verbose_name='Assinatura/Recebedor')),
+                ('encomenda', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='entrega', to='encomendas.encomendaarquivada', verbose_name='Encomenda')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemEncomendaArquivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantidade', models.PositiveIntegerField(verbose_name='Quantidade')),
+                ('preco_cotado', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Preço Cotado')),
+                ('valor_total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Valor Total')),
+                ('observacoes', models.TextField(blank=True, verbose_name='Observações')),
+                ('encomenda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='itens', to='encomendas.encomendaarquivada')),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.fornecedor', verbose_name='Fornecedor')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='encomendas.produto', verbose_name='Produto')),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:57
+
+from django.db import migrations, models
+
+# Índices em UPPER(coluna) para as buscas por prefixo do admin (istartswith/iexact
+# viram UPPER(col) LIKE UPPER('x%') no PostgreSQL). text_pattern_ops atende tanto o
+# LIKE com prefixo quanto a igualdade.
+INDICES_BUSCA = [
+    ('encomendas_customuser', 'username'),
+    ('encomendas_customuser', 'nome_completo'),
+    ('encomendas_equipe', 'nome'),
+    ('encomendas_cliente', 'nome'),
+    ('encomendas_cliente', 'cpf'),
+    ('encomendas_cliente', 'bairro'),
+    ('encomendas_fornecedor', 'nome'),
+    ('encomendas_fornecedor', 'codigo'),
+    ('encomendas_produto', 'nome'),
+    ('encomendas_produto', 'codigo'),
+]
+
+
+def criar_indices_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela, coluna in INDICES_BUSCA:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_upper_idx '
+            f'ON {tabela} (UPPER({coluna}::text) text_pattern_ops)'
+        )
+
+
+def remover_indices_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela, coluna in INDICES_BUSCA:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {tabela}_{coluna}_upper_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0003_arquivo_encomendas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(fields=['equipe', 'status'], name='encomenda_equipe_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(fields=['-data_encomenda'], name='encomenda_data_idx'),
+        ),
+        migrations.RunPython(criar_indices_busca, remover_indices_busca),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0004_indices_admin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='cpf_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=14),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefone_normalizado',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['equipe', 'telefone_normalizado'], name='cliente_telefone_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cliente',
+            constraint=models.UniqueConstraint(condition=models.Q(('cpf_normalizado', ''), _negated=True), fields=('equipe', 'cpf_normalizado'), name='cliente_cpf_unico_por_equipe'),
+        ),
+    ]
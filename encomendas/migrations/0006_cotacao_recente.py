@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0005_cliente_normalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CotacaoRecente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preco', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Último Preço')),
+                ('data', models.DateTimeField(verbose_name='Data da Cotação')),
+                ('preco_medio', models.DecimalField(decimal_places=4, max_digits=14, verbose_name='Preço Médio')),
+                ('total_cotacoes', models.PositiveIntegerField(default=0, verbose_name='Cotações')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cotacoes', to='encomendas.equipe')),
+                ('fornecedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cotacoes', to='encomendas.fornecedor')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cotacoes', to='encomendas.produto')),
+            ],
+            options={
+                'verbose_name': 'Cotação Recente',
+                'verbose_name_plural': 'Cotações Recentes',
+                'constraints': [models.UniqueConstraint(fields=('equipe', 'produto', 'fornecedor'), name='cotacao_unica_por_fornecedor')],
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0006_cotacao_recente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encomenda',
+            name='chave_idempotencia',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='encomenda',
+            constraint=models.UniqueConstraint(fields=('equipe', 'chave_idempotencia'), name='encomenda_chave_unica_por_equipe'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0007_encomenda_chave_idempotencia'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['equipe', 'updated_at', 'id'], name='cliente_sincronizacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(fields=['equipe', 'updated_at', 'numero_encomenda'], name='encomenda_sincronizacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fornecedor',
+            index=models.Index(fields=['equipe', 'updated_at', 'id'], name='fornecedor_sincronizacao_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['equipe', 'updated_at', 'id'], name='produto_sincronizacao_idx'),
+        ),
+    ]
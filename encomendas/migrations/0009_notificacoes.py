@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0008_indices_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254, verbose_name='E-mail'),
+        ),
+        migrations.CreateModel(
+            name='Notificacao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('canal', models.CharField(choices=[('email', 'E-mail'), ('sms', 'SMS')], max_length=10, verbose_name='Canal')),
+                ('destino', models.CharField(max_length=254, verbose_name='Destino')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('enviada', 'Enviada'), ('falhou', 'Falhou'), ('descartada', 'Descartada')], default='pendente', max_length=20, verbose_name='Status')),
+                ('tentativas', models.PositiveIntegerField(default=0, verbose_name='Tentativas')),
+                ('proxima_tentativa', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próxima Tentativa')),
+                ('ultimo_erro', models.TextField(blank=True, verbose_name='Último Erro')),
+                ('criada_em', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('enviada_em', models.DateTimeField(blank=True, null=True, verbose_name='Enviada em')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to='encomendas.cliente')),
+                ('encomenda', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to='encomendas.encomenda')),
+                ('equipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notificacoes', to='encomendas.equipe')),
+            ],
+            options={
+                'verbose_name': 'Notificação',
+                'verbose_name_plural': 'Notificações',
+                'indexes': [models.Index(condition=models.Q(('status', 'pendente')), fields=['proxima_tentativa'], name='notificacao_pendente_idx')],
+            },
+        ),
+    ]
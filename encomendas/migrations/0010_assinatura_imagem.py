@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:21
+
+import encomendas.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0009_notificacoes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entrega',
+            name='assinatura_imagem',
+            field=models.ImageField(blank=True, editable=False, upload_to=encomendas.models.caminho_assinatura, verbose_name='Assinatura Capturada'),
+        ),
+        migrations.AddField(
+            model_name='entregaarquivada',
+            name='assinatura_imagem',
+            field=models.ImageField(blank=True, editable=False, upload_to=encomendas.models.caminho_assinatura, verbose_name='Assinatura Capturada'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0010_assinatura_imagem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemencomenda',
+            name='pedido_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Pedido ao Fornecedor em'),
+        ),
+        migrations.AddField(
+            model_name='itemencomendaarquivado',
+            name='pedido_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Pedido ao Fornecedor em'),
+        ),
+        migrations.AddIndex(
+            model_name='itemencomenda',
+            index=models.Index(condition=models.Q(('pedido_em__isnull', True)), fields=['encomenda'], name='item_a_pedir_idx'),
+        ),
+    ]
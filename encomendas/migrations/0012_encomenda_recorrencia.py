@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:38
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0011_item_pedido_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encomenda',
+            name='proxima_recorrencia',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='Próxima Repetição'),
+        ),
+        migrations.AddField(
+            model_name='encomenda',
+            name='recorrencia_dias',
+            field=models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(365)], verbose_name='Repetir a cada (dias)'),
+        ),
+        migrations.AddIndex(
+            model_name='encomenda',
+            index=models.Index(condition=models.Q(('proxima_recorrencia__isnull', False)), fields=['proxima_recorrencia'], name='encomenda_recorrencia_idx'),
+        ),
+    ]
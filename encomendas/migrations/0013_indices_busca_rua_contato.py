@@ -0,0 +1,36 @@
+from django.db import migrations
+
+# Mesmos índices em UPPER(coluna) de 0004_indices_admin, para as buscas por prefixo
+# em rua (clientes) e contato (fornecedores) do admin.
+INDICES_BUSCA = [
+    ('encomendas_cliente', 'rua'),
+    ('encomendas_fornecedor', 'contato'),
+]
+
+
+def criar_indices_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela, coluna in INDICES_BUSCA:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {tabela}_{coluna}_upper_idx '
+            f'ON {tabela} (UPPER({coluna}::text) text_pattern_ops)'
+        )
+
+
+def remover_indices_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for tabela, coluna in INDICES_BUSCA:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {tabela}_{coluna}_upper_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0012_encomenda_recorrencia'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices_busca, remover_indices_busca),
+    ]
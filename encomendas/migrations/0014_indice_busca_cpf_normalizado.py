@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# A busca do admin por CPF passou para a coluna normalizada (só dígitos): troca o índice
+# em UPPER(cpf) de 0004_indices_admin por um em UPPER(cpf_normalizado).
+
+
+def trocar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS encomendas_cliente_cpf_normalizado_upper_idx '
+        'ON encomendas_cliente (UPPER(cpf_normalizado::text) text_pattern_ops)'
+    )
+    schema_editor.execute('DROP INDEX IF EXISTS encomendas_cliente_cpf_upper_idx')
+
+
+def desfazer(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS encomendas_cliente_cpf_upper_idx '
+        'ON encomendas_cliente (UPPER(cpf::text) text_pattern_ops)'
+    )
+    schema_editor.execute('DROP INDEX IF EXISTS encomendas_cliente_cpf_normalizado_upper_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0013_indices_busca_rua_contato'),
+    ]
+
+    operations = [
+        migrations.RunPython(trocar_indice, desfazer),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:18
+
+import encomendas.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('encomendas', '0014_indice_busca_cpf_normalizado'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='customuser',
+            managers=[
+                ('objects', encomendas.models.UsuarioManager()),
+            ],
+        ),
+    ]
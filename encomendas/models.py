@@ -1,9 +1,18 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
-from django.core.validators import MinValueValidator
+import os
+import re
+
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.contrib.auth.models import AbstractUser, UserManager
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal
 from django.conf import settings
+from django.urls import reverse
+
+from .assinaturas import nome_impressao
+from .cache_equipe import invalidar
 
 # --- Modelos de Autenticação e Equipe ---
 class Equipe(models.Model):
@@ -11,7 +20,19 @@ class Equipe(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     def __str__(self): return self.nome
 
+class UsuarioQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # update() não dispara post_save: tira do cache os usuários alterados (desativação ou
+        # troca de equipe em lote, ações do admin), como encomendas/signals.py faz no save().
+        from .autenticacao import invalidar_usuarios  # importa o ModelBackend, que precisa dos modelos prontos
+        invalidar_usuarios(*self.values_list('pk', flat=True))
+        return super().update(**kwargs)
+
+class UsuarioManager(UserManager.from_queryset(UsuarioQuerySet)):
+    pass
+
 class CustomUser(AbstractUser):
+    objects = UsuarioManager()
     nome_completo = models.CharField(max_length=255, blank=True, verbose_name="Nome Completo")
     cargo = models.CharField(max_length=100, blank=True, verbose_name="Cargo")
     identificacao = models.CharField(max_length=100, blank=True, verbose_name="Identificação")
@@ -19,11 +40,16 @@ class CustomUser(AbstractUser):
     def __str__(self): return self.username
 
 # --- Modelos Principais da Aplicação ---
+def somente_digitos(valor):
+    """Remove máscara e espaços: "(32) 99999-1234" -> "32999991234"."""
+    return re.sub(r'\D', '', valor or '')
+
 class Cliente(models.Model):
     equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name="clientes")
     nome = models.CharField(max_length=200, verbose_name="Nome do Cliente")
     cpf = models.CharField(max_length=14, blank=True, verbose_name="CPF")
     telefone = models.CharField(max_length=20, blank=True, verbose_name="Telefone")
+    email = models.EmailField(blank=True, verbose_name="E-mail")
     
     # Endereço completo (com campos opcionais)
     rua = models.CharField(max_length=255, blank=True, verbose_name="Rua / Logradouro")
@@ -31,6 +57,10 @@ class Cliente(models.Model):
     complemento = models.CharField(max_length=100, blank=True, verbose_name="Complemento")
     bairro = models.CharField(max_length=100, blank=True, verbose_name="Bairro")
     referencia = models.CharField(max_length=200, blank=True, verbose_name="Ponto de Referência")
+
+    # Só dígitos, mantidos pelo save(); são as colunas usadas (e indexadas) na busca do balcão.
+    cpf_normalizado = models.CharField(max_length=14, blank=True, editable=False)
+    telefone_normalizado = models.CharField(max_length=20, blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -39,10 +69,27 @@ class Cliente(models.Model):
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
         ordering = ['nome']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['equipe', 'cpf_normalizado'], condition=~Q(cpf_normalizado=''),
+                name='cliente_cpf_unico_por_equipe',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['equipe', 'telefone_normalizado'], name='cliente_telefone_idx'),
+            models.Index(fields=['equipe', 'updated_at', 'id'], name='cliente_sincronizacao_idx'),
+        ]
 
     def __str__(self):
         return self.nome
 
+    def save(self, *args, **kwargs):
+        self.cpf_normalizado = somente_digitos(self.cpf)
+        self.telefone_normalizado = somente_digitos(self.telefone)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'cpf_normalizado', 'telefone_normalizado'}
+        super().save(*args, **kwargs)
+
 class Fornecedor(models.Model):
     equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name="fornecedores")
     nome = models.CharField(max_length=200, verbose_name="Nome do Fornecedor")
@@ -54,6 +101,7 @@ class Fornecedor(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         unique_together = ('equipe', 'codigo')
+        indexes = [models.Index(fields=['equipe', 'updated_at', 'id'], name='fornecedor_sincronizacao_idx')]
     def __str__(self): return self.nome
 
 class Produto(models.Model):
@@ -67,8 +115,15 @@ class Produto(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         unique_together = ('equipe', 'codigo')
+        indexes = [models.Index(fields=['equipe', 'updated_at', 'id'], name='produto_sincronizacao_idx')]
     def __str__(self): return self.nome
 
+class ConflitoDeVersao(Exception):
+    """A encomenda foi alterada por outra pessoa desde que foi lida."""
+    def __init__(self, encomenda):
+        super().__init__(f"Encomenda #{encomenda.pk} alterada por outro usuário.")
+        self.encomenda = encomenda
+
 class Encomenda(models.Model):
     STATUS_CHOICES = [
         ('criada', 'Criada'), ('cotacao', 'Em Cotação'), ('aprovada', 'Aprovada'),
@@ -87,9 +142,79 @@ class Encomenda(models.Model):
     observacoes = models.TextField(blank=True, verbose_name="Observações Gerais")
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor Total dos Itens")
     updated_at = models.DateTimeField(auto_now=True)
+    versao = models.PositiveIntegerField(default=1, editable=False, verbose_name="Versão")
+    # Gerada pelo navegador: reenviar a mesma encomenda (timeout, fila offline) não cria duplicata.
+    chave_idempotencia = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    # Pedido recorrente (receita de uso contínuo): a recorrência passa para cada repetição criada.
+    recorrencia_dias = models.PositiveSmallIntegerField(null=True, blank=True, validators=[MinValueValidator(1), MaxValueValidator(365)], verbose_name="Repetir a cada (dias)")
+    proxima_recorrencia = models.DateField(null=True, blank=True, editable=False, verbose_name="Próxima Repetição")
 
-    class Meta: ordering = ['-numero_encomenda']
+    class Meta:
+        ordering = ['-numero_encomenda']
+        indexes = [
+            models.Index(fields=['equipe', 'status'], name='encomenda_equipe_status_idx'),
+            models.Index(fields=['-data_encomenda'], name='encomenda_data_idx'),
+            models.Index(fields=['equipe', 'updated_at', 'numero_encomenda'], name='encomenda_sincronizacao_idx'),
+            models.Index(
+                fields=['proxima_recorrencia'], name='encomenda_recorrencia_idx',
+                condition=Q(proxima_recorrencia__isnull=False),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['equipe', 'chave_idempotencia'], name='encomenda_chave_unica_por_equipe'),
+        ]
     def __str__(self): return f"Encomenda #{self.numero_encomenda} - {self.cliente.nome}"
+
+    def save(self, *args, **kwargs):
+        # Gravação comum de uma encomenda existente (admin, calcular_valor_total) também avança a
+        # versão, para que uma edição aberta na tela veja a alteração como conflito.
+        if not self._state.adding:
+            self.versao = F('versao') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'versao'}
+        super().save(*args, **kwargs)
+        if not isinstance(self.versao, int):
+            self.refresh_from_db(fields=['versao'])
+
+    def salvar_versionado(self, versao_lida):
+        """
+        Grava a encomenda apenas se ela ainda estiver na versão lida (UPDATE ... WHERE versao = n).
+        Levanta ConflitoDeVersao se outra pessoa gravou antes, sem manter lock durante a edição.
+        """
+        self.updated_at = timezone.now()
+        valores = {
+            campo.attname: getattr(self, campo.attname) for campo in self._meta.concrete_fields
+            if not campo.primary_key and campo.attname != 'versao'
+        }
+        atualizadas = Encomenda.objects.filter(pk=self.pk, versao=versao_lida).update(versao=F('versao') + 1, **valores)
+        if not atualizadas:
+            raise ConflitoDeVersao(self)
+        self.versao = versao_lida + 1
+        invalidar(self.equipe_id, 'encomendas')
+
+    def atualizar_status(self, novo_status, versao_lida):
+        """
+        Altera só o status, também condicionado à versão lida. Retorna False em caso de conflito.
+        Ao passar para "pronta" o aviso ao cliente entra na fila na mesma transação.
+        """
+        with transaction.atomic():
+            atualizadas = Encomenda.objects.filter(pk=self.pk, versao=versao_lida).update(
+                status=novo_status, versao=F('versao') + 1, updated_at=timezone.now()
+            )
+            if atualizadas and novo_status == 'pronta' and self.status != 'pronta':
+                Notificacao.enfileirar(self)
+        if atualizadas:
+            self.status, self.versao = novo_status, versao_lida + 1
+            invalidar(self.equipe_id, 'encomendas')
+        return bool(atualizadas)
+
+    def agendar_recorrencia(self, a_partir=None):
+        """Próxima repetição `recorrencia_dias` depois de `a_partir` (hoje); sem recorrência, nenhuma."""
+        if self.recorrencia_dias:
+            self.proxima_recorrencia = (a_partir or timezone.localdate()) + timedelta(days=self.recorrencia_dias)
+        else:
+            self.proxima_recorrencia = None
+
     def calcular_valor_total(self):
         self.valor_total = sum(item.valor_total for item in self.itens.all()) if self.itens.exists() else Decimal('0.00')
         self.save()
@@ -102,16 +227,214 @@ class ItemEncomenda(models.Model):
     preco_cotado = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))], verbose_name="Preço Cotado")
     valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor Total")
     observacoes = models.TextField(blank=True, verbose_name="Observações")
+    # Preenchido ao marcar o item como comprado na consolidação de compras (encomendas/compras.py).
+    pedido_em = models.DateTimeField(null=True, blank=True, verbose_name="Pedido ao Fornecedor em")
+
+    class Meta:
+        indexes = [
+            # Só os itens ainda não pedidos, que são os que a consolidação de compras percorre.
+            models.Index(fields=['encomenda'], condition=Q(pedido_em__isnull=True), name='item_a_pedir_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        item._cotacao_gravada = item._cotacao()
+        return item
+
+    def _cotacao(self):
+        return tuple(self.__dict__.get(campo) for campo in ('produto_id', 'fornecedor_id', 'preco_cotado'))
+
     def save(self, *args, **kwargs):
         self.valor_total = self.quantidade * self.preco_cotado
         super().save(*args, **kwargs)
+        # Só preço, produto ou fornecedor novos contam como cotação (como em salvar_encomenda).
+        if self._cotacao() != getattr(self, '_cotacao_gravada', None):
+            CotacaoRecente.registrar([self], self.encomenda.equipe_id)
+            self._cotacao_gravada = self._cotacao()
     def __str__(self): return f"{self.produto.nome} - Qtd: {self.quantidade}"
 
-class Entrega(models.Model):
+def caminho_assinatura(entrega, nome):
+    return f'assinaturas/{entrega.encomenda.equipe_id}/{nome}'
+
+class AssinaturaMixin:
+    """URLs da assinatura capturada (ver encomendas/assinaturas.py), para Entrega e EntregaArquivada."""
+
+    @property
+    def url_assinatura(self):
+        return reverse('assinatura_entrega', args=[os.path.basename(self.assinatura_imagem.name)])
+
+    @property
+    def url_assinatura_impressao(self):
+        return reverse('assinatura_entrega', args=[nome_impressao(os.path.basename(self.assinatura_imagem.name))])
+
+class Entrega(AssinaturaMixin, models.Model):
     encomenda = models.OneToOneField(Encomenda, on_delete=models.CASCADE, verbose_name="Encomenda")
     responsavel_entrega = models.CharField(max_length=100, blank=True, verbose_name="Responsável pela Entrega")
     data_entrega_realizada = models.DateField(null=True, blank=True, verbose_name="Data da Entrega")
     hora_entrega = models.TimeField(null=True, blank=True, verbose_name="Hora da Entrega")
     entregue_por = models.CharField(max_length=100, blank=True, verbose_name="Entregue por")
     assinatura_cliente = models.TextField(blank=True, verbose_name="Assinatura/Recebedor")
-    def __str__(self): return f"Entrega da Encomenda #{self.encomenda.numero_encomenda}"
\ No newline at end of file
+    # Só o caminho do PNG; o arquivo fica em MEDIA_ROOT.
+    assinatura_imagem = models.ImageField(upload_to=caminho_assinatura, blank=True, editable=False, verbose_name="Assinatura Capturada")
+    def __str__(self): return f"Entrega da Encomenda #{self.encomenda.numero_encomenda}"
+
+class CotacaoRecente(models.Model):
+    """
+    Última cotação de cada produto por fornecedor (com média e quantidade de cotações),
+    mantida a cada gravação de itens. Evita varrer o histórico de ItemEncomenda para
+    sugerir preços no formulário.
+    """
+    equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name="cotacoes")
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name="cotacoes")
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name="cotacoes")
+    preco = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Último Preço")
+    data = models.DateTimeField(verbose_name="Data da Cotação")
+    preco_medio = models.DecimalField(max_digits=14, decimal_places=4, verbose_name="Preço Médio")
+    total_cotacoes = models.PositiveIntegerField(default=0, verbose_name="Cotações")
+
+    class Meta:
+        verbose_name = "Cotação Recente"
+        verbose_name_plural = "Cotações Recentes"
+        constraints = [
+            models.UniqueConstraint(fields=['equipe', 'produto', 'fornecedor'], name='cotacao_unica_por_fornecedor'),
+        ]
+
+    def __str__(self): return f"{self.produto} / {self.fornecedor}: R$ {self.preco}"
+
+    @classmethod
+    def registrar(cls, itens, equipe_id, data=None):
+        """
+        Atualiza o índice com os preços dos itens: uma consulta travando as linhas
+        existentes e um único upsert, independente da quantidade de itens.
+        """
+        precos = {}
+        for item in itens:
+            precos.setdefault((item.produto_id, item.fornecedor_id), []).append(item.preco_cotado)
+        if not precos:
+            return
+        data = data or timezone.now()
+        filtro = Q()
+        for produto_id, fornecedor_id in precos:
+            filtro |= Q(produto_id=produto_id, fornecedor_id=fornecedor_id)
+
+        with transaction.atomic():
+            atuais = {
+                (cotacao.produto_id, cotacao.fornecedor_id): cotacao
+                for cotacao in cls.objects.select_for_update().filter(filtro, equipe_id=equipe_id)
+            }
+            cotacoes = []
+            for (produto_id, fornecedor_id), novos in precos.items():
+                atual = atuais.get((produto_id, fornecedor_id))
+                anteriores = atual.total_cotacoes if atual else 0
+                soma = (atual.preco_medio * anteriores if atual else Decimal('0')) + sum(novos)
+                total = anteriores + len(novos)
+                cotacoes.append(cls(
+                    equipe_id=equipe_id, produto_id=produto_id, fornecedor_id=fornecedor_id, preco=novos[-1],
+                    data=data, preco_medio=(soma / total).quantize(Decimal('0.0001')), total_cotacoes=total,
+                ))
+            cls.objects.bulk_create(
+                cotacoes, update_conflicts=True, unique_fields=['equipe', 'produto', 'fornecedor'],
+                update_fields=['preco', 'data', 'preco_medio', 'total_cotacoes'],
+            )
+
+class Notificacao(models.Model):
+    """
+    Fila de avisos aos clientes (outbox), gravada na mesma transação da mudança de
+    status e enviada depois pelo comando `enviar_notificacoes` (ver encomendas/notificacoes.py).
+    """
+    CANAL_CHOICES = [('email', 'E-mail'), ('sms', 'SMS')]
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviada', 'Enviada'),
+        ('falhou', 'Falhou'),
+        ('descartada', 'Descartada'),
+    ]
+
+    equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name="notificacoes")
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name="notificacoes")
+    # Sem constraint no banco: encomendas pode ser uma tabela particionada (ver particionar_encomendas --religar).
+    encomenda = models.ForeignKey(Encomenda, on_delete=models.CASCADE, related_name="notificacoes", db_constraint=False)
+    canal = models.CharField(max_length=10, choices=CANAL_CHOICES, verbose_name="Canal")
+    destino = models.CharField(max_length=254, verbose_name="Destino")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente', verbose_name="Status")
+    tentativas = models.PositiveIntegerField(default=0, verbose_name="Tentativas")
+    proxima_tentativa = models.DateTimeField(default=timezone.now, verbose_name="Próxima Tentativa")
+    ultimo_erro = models.TextField(blank=True, verbose_name="Último Erro")
+    criada_em = models.DateTimeField(auto_now_add=True, verbose_name="Criada em")
+    enviada_em = models.DateTimeField(null=True, blank=True, verbose_name="Enviada em")
+
+    class Meta:
+        verbose_name = "Notificação"
+        verbose_name_plural = "Notificações"
+        indexes = [
+            models.Index(fields=['proxima_tentativa'], condition=Q(status='pendente'), name='notificacao_pendente_idx'),
+        ]
+
+    def __str__(self): return f"{self.get_canal_display()} para {self.destino} (#{self.encomenda_id})"
+
+    @classmethod
+    def enfileirar(cls, encomenda):
+        """Aviso de encomenda pronta: e-mail quando o cliente tem, senão SMS; sem contato, nada."""
+        cliente = encomenda.cliente
+        if cliente.email:
+            canal, destino = 'email', cliente.email
+        elif cliente.telefone_normalizado:
+            canal, destino = 'sms', cliente.telefone_normalizado
+        else:
+            return None
+        return cls.objects.create(
+            equipe_id=encomenda.equipe_id, cliente=cliente, encomenda=encomenda, canal=canal, destino=destino,
+        )
+
+# --- Arquivo de Encomendas Finalizadas ---
+# Encomendas entregues/canceladas antigas são movidas para estas tabelas pelo comando
+# `arquivar_encomendas`, mantendo as tabelas principais (e seus índices) pequenas.
+# Os nomes de campos e relacionamentos espelham Encomenda/ItemEncomenda/Entrega para
+# que os mesmos templates sirvam para as duas.
+
+class EncomendaArquivada(models.Model):
+    STATUS_CHOICES = Encomenda.STATUS_CHOICES
+
+    numero_encomenda = models.IntegerField(primary_key=True, verbose_name="Número da Encomenda")
+    equipe = models.ForeignKey(Equipe, on_delete=models.CASCADE, related_name="encomendas_arquivadas")
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, verbose_name="Cliente")
+    responsavel_criacao = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+", verbose_name="Responsável pelo Pedido")
+    data_encomenda = models.DateTimeField(verbose_name="Data do Pedido")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="Status")
+    valor_pago_adiantamento = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor de Adiantamento")
+    data_prevista_entrega = models.DateField(null=True, blank=True, verbose_name="Data Prevista para Entrega")
+    observacoes = models.TextField(blank=True, verbose_name="Observações Gerais")
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'), verbose_name="Valor Total dos Itens")
+    updated_at = models.DateTimeField()
+    versao = models.PositiveIntegerField(default=1, verbose_name="Versão")
+    arquivada_em = models.DateTimeField(auto_now_add=True, verbose_name="Arquivada em")
+
+    class Meta:
+        verbose_name = "Encomenda Arquivada"
+        verbose_name_plural = "Encomendas Arquivadas"
+        ordering = ['-numero_encomenda']
+    def __str__(self): return f"Encomenda #{self.numero_encomenda} - {self.cliente.nome} (arquivada)"
+
+class ItemEncomendaArquivado(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    encomenda = models.ForeignKey(EncomendaArquivada, related_name='itens', on_delete=models.CASCADE)
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name="+", verbose_name="Produto")
+    fornecedor = models.ForeignKey(Fornecedor, on_delete=models.CASCADE, related_name="+", verbose_name="Fornecedor")
+    quantidade = models.PositiveIntegerField(verbose_name="Quantidade")
+    preco_cotado = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Preço Cotado")
+    valor_total = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Valor Total")
+    observacoes = models.TextField(blank=True, verbose_name="Observações")
+    pedido_em = models.DateTimeField(null=True, blank=True, verbose_name="Pedido ao Fornecedor em")
+    def __str__(self): return f"{self.produto.nome} - Qtd: {self.quantidade}"
+
+class EntregaArquivada(AssinaturaMixin, models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    encomenda = models.OneToOneField(EncomendaArquivada, on_delete=models.CASCADE, related_name='entrega', verbose_name="Encomenda")
+    responsavel_entrega = models.CharField(max_length=100, blank=True, verbose_name="Responsável pela Entrega")
+    data_entrega_realizada = models.DateField(null=True, blank=True, verbose_name="Data da Entrega")
+    hora_entrega = models.TimeField(null=True, blank=True, verbose_name="Hora da Entrega")
+    entregue_por = models.CharField(max_length=100, blank=True, verbose_name="Entregue por")
+    assinatura_cliente = models.TextField(blank=True, verbose_name="Assinatura/Recebedor")
+    assinatura_imagem = models.ImageField(upload_to=caminho_assinatura, blank=True, editable=False, verbose_name="Assinatura Capturada")
+    def __str__(self): return f"Entrega da Encomenda #{self.encomenda.numero_encomenda} (arquivada)"
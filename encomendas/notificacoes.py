@@ -0,0 +1,223 @@
+"""
+Envio dos avisos da fila de notificações (modelo Notificacao, comando `enviar_notificacoes`).
+
+A mudança de status só grava a notificação; o envio acontece aqui, fora da requisição:
+  - cada rodada reserva até LOTE notificações vencidas (SKIP LOCKED no PostgreSQL, então
+    vários despachantes podem rodar juntos) adiando a próxima tentativa por RESERVA_S, e
+    envia sem transação aberta. Se o processo cair no meio, as não concluídas voltam à
+    fila quando a reserva vence;
+  - a rodada só envia enquanto a reserva tiver folga (MARGEM_RESERVA_S): o que o ritmo
+    de POR_MINUTO não deixar enviar a tempo volta na hora para a fila, em vez de
+    continuar sendo enviado depois que outro despachante já pôde reservá-lo de novo;
+  - avisos do mesmo cliente pelo mesmo canal e destino viram uma única mensagem;
+  - POR_MINUTO limita o ritmo de cada canal;
+  - falhas temporárias são reenviadas com espera crescente (ESPERA_INICIAL_S, dobrando a
+    cada tentativa) até MAX_TENTATIVAS; falhas permanentes (destino recusado) param na hora.
+
+Os backends de cada canal são configuráveis em settings.NOTIFICACOES['BACKENDS']:
+BackendEmail usa o envio de e-mail do Django (SMTP em EMAIL_HOST/EMAIL_PORT) e
+BackendArquivo grava as mensagens em um arquivo JSON, para testes e para o canal de
+SMS enquanto não houver um provedor.
+"""
+import json
+import smtplib
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notificacao
+
+PADRAO = {
+    'BACKENDS': {
+        'email': 'encomendas.notificacoes.BackendEmail',
+        'sms': 'encomendas.notificacoes.BackendArquivo',
+    },
+    'ARQUIVO': Path(settings.BASE_DIR) / 'notificacoes_enviadas.jsonl',
+    'LOTE': 200,
+    'POR_MINUTO': {'email': 60, 'sms': 20},
+    'MAX_TENTATIVAS': 5,
+    'ESPERA_INICIAL_S': 60,
+    'RESERVA_S': 600,
+    'MARGEM_RESERVA_S': 60,
+}
+
+
+class ErroTemporario(Exception):
+    """Falha que pode passar (servidor fora do ar, limite do provedor): tentar de novo depois."""
+
+
+class ErroPermanente(Exception):
+    """Falha que não passa com nova tentativa (destino recusado)."""
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, 'NOTIFICACOES', {})}
+
+
+class BackendDeNotificacao:
+    """Abre a conexão ao entrar no `with`, envia cada mensagem e fecha ao sair."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def enviar(self, mensagem):
+        raise NotImplementedError
+
+
+class BackendEmail(BackendDeNotificacao):
+    """Uma conexão SMTP para o lote inteiro (EMAIL_BACKEND/EMAIL_HOST das settings)."""
+
+    def __enter__(self):
+        self.conexao = get_connection(fail_silently=False)
+        try:
+            self.conexao.open()
+        except OSError as erro:
+            raise ErroTemporario(f'Servidor de e-mail indisponível: {erro}') from erro
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self.conexao.close()
+        except (OSError, smtplib.SMTPException):
+            pass
+        return False
+
+    def enviar(self, mensagem):
+        email = EmailMessage(mensagem['assunto'], mensagem['corpo'], to=[mensagem['destino']], connection=self.conexao)
+        try:
+            email.send()
+        except smtplib.SMTPRecipientsRefused as erro:
+            raise ErroPermanente(f'Destino recusado: {mensagem["destino"]}') from erro
+        except (OSError, smtplib.SMTPException) as erro:
+            raise ErroTemporario(str(erro)) from erro
+
+
+class BackendArquivo(BackendDeNotificacao):
+    """Acrescenta cada mensagem como uma linha JSON em ARQUIVO."""
+
+    _trava = threading.Lock()
+
+    def enviar(self, mensagem):
+        arquivo = Path(self.config['ARQUIVO'])
+        linha = json.dumps({'quando': timezone.now().isoformat(), **mensagem}, ensure_ascii=False) + '\n'
+        with self._trava:
+            arquivo.parent.mkdir(parents=True, exist_ok=True)
+            with arquivo.open('a', encoding='utf-8') as saida:
+                saida.write(linha)
+
+
+def montar_mensagem(canal, destino, cliente, encomendas):
+    equipe = encomendas[0].equipe.nome
+    numeros = ', '.join(f'nº {encomenda.numero_encomenda}' for encomenda in encomendas)
+    if len(encomendas) == 1:
+        assunto = f'{equipe}: sua encomenda está pronta'
+        frase = f'sua encomenda {numeros} já está pronta'
+    else:
+        assunto = f'{equipe}: suas encomendas estão prontas'
+        frase = f'suas encomendas {numeros} já estão prontas'
+    if canal == 'sms':
+        corpo = f'{equipe}: {cliente.nome.split()[0]}, {frase}.'
+    else:
+        corpo = f'Olá, {cliente.nome}!\n\nAvisamos que {frase}.\n\nQualquer dúvida, fale com a {equipe}.'
+    return {'canal': canal, 'destino': destino, 'assunto': assunto, 'corpo': corpo}
+
+
+def _reservar(config, agora):
+    with transaction.atomic():
+        ids = list(
+            Notificacao.objects.select_for_update(skip_locked=True)
+            .filter(status='pendente', proxima_tentativa__lte=agora)
+            .order_by('proxima_tentativa')
+            .values_list('pk', flat=True)[:config['LOTE']]
+        )
+        Notificacao.objects.filter(pk__in=ids).update(proxima_tentativa=agora + timedelta(seconds=config['RESERVA_S']))
+    return list(Notificacao.objects.filter(pk__in=ids).select_related('cliente', 'encomenda__equipe'))
+
+
+def _registrar_falha(config, grupo, erro, permanente):
+    agora = timezone.now()
+    for notificacao in grupo:
+        notificacao.tentativas += 1
+        notificacao.ultimo_erro = str(erro)[:1000]
+        if permanente or notificacao.tentativas >= config['MAX_TENTATIVAS']:
+            notificacao.status = 'falhou'
+        else:
+            espera = config['ESPERA_INICIAL_S'] * 2 ** (notificacao.tentativas - 1)
+            notificacao.proxima_tentativa = agora + timedelta(seconds=espera)
+    Notificacao.objects.bulk_update(grupo, ['tentativas', 'ultimo_erro', 'status', 'proxima_tentativa'])
+    return sum(notificacao.status == 'falhou' for notificacao in grupo)
+
+
+def despachar(config=None, dormir=time.sleep, ritmo=None, relogio=time.monotonic):
+    """
+    Uma rodada do despachante. Retorna a contagem de notificações por resultado.
+    `ritmo` (canal -> instante liberado para o próximo envio) pode ser reaproveitado
+    entre rodadas para o limite por minuto valer também de uma rodada para a outra.
+    """
+    config = config or configuracao()
+    resultado = defaultdict(int)
+    notificacoes = _reservar(config, timezone.now())
+    prazo = relogio() + config['RESERVA_S'] - config['MARGEM_RESERVA_S']
+
+    # Encomenda que saiu de "pronta" antes do envio (entregue, cancelada...) não gera aviso.
+    descartadas = [n.pk for n in notificacoes if n.encomenda.status != 'pronta']
+    if descartadas:
+        Notificacao.objects.filter(pk__in=descartadas).update(status='descartada')
+        resultado['descartadas'] = len(descartadas)
+
+    grupos = defaultdict(list)
+    for notificacao in notificacoes:
+        if notificacao.pk not in descartadas:
+            grupos[(notificacao.cliente_id, notificacao.canal, notificacao.destino)].append(notificacao)
+
+    proximo_envio = ritmo if ritmo is not None else defaultdict(float)
+    devolvidas = []
+    with ExitStack() as pilha:
+        backends = {}
+        for (_, canal, destino), grupo in grupos.items():
+            espera = proximo_envio[canal] - relogio()
+            if relogio() + max(espera, 0) > prazo:
+                devolvidas += [n.pk for n in grupo]
+                continue
+            try:
+                if canal not in backends:
+                    backends[canal] = pilha.enter_context(import_string(config['BACKENDS'][canal])(config))
+                if espera > 0:
+                    dormir(espera)
+                proximo_envio[canal] = relogio() + 60 / config['POR_MINUTO'][canal]
+                # Uma encomenda que voltou a "pronta" pode ter dois avisos pendentes; entra uma vez só.
+                encomendas = sorted({n.encomenda_id: n.encomenda for n in grupo}.values(), key=lambda e: e.pk)
+                backends[canal].enviar(montar_mensagem(canal, destino, grupo[0].cliente, encomendas))
+            except (ErroPermanente, ErroTemporario) as erro:
+                falharam = _registrar_falha(config, grupo, erro, permanente=isinstance(erro, ErroPermanente))
+                if falharam:
+                    resultado['falharam'] += falharam
+                if len(grupo) > falharam:
+                    resultado['reagendadas'] += len(grupo) - falharam
+            else:
+                Notificacao.objects.filter(pk__in=[n.pk for n in grupo]).update(
+                    status='enviada', enviada_em=timezone.now(), tentativas=F('tentativas') + 1, ultimo_erro='',
+                )
+                resultado['enviadas'] += len(grupo)
+                resultado['mensagens'] += 1
+    if devolvidas:
+        # Reserva perto de vencer: o restante fica para a próxima rodada, já liberado.
+        Notificacao.objects.filter(pk__in=devolvidas).update(proxima_tentativa=timezone.now())
+        resultado['devolvidas'] = len(devolvidas)
+    return dict(resultado)
@@ -0,0 +1,81 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginator para tabelas grandes, que evita o COUNT(*) exato quando o total passa
+    de `limiar` linhas:
+
+    - listagem sem filtros no PostgreSQL: usa a estimativa do planejador
+      (pg_class.reltuples), sem tocar na tabela;
+    - demais casos: conta no máximo `limiar + 1` linhas (COUNT sobre um LIMIT). Se
+      passar do limiar, o total vira a estimativa do EXPLAIN (no PostgreSQL) ou
+      simplesmente `limiar + 1`.
+
+    Abaixo do limiar a contagem é exata. `aproximado` indica se o total é estimado e
+    `total_exibicao` devolve o texto para os templates ("1.234" ou "10.000+").
+    """
+    limiar = 10000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.aproximado = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+
+        estimativa = self._estimativa_tabela()
+        if estimativa is not None and estimativa > self.limiar:
+            self.aproximado = True
+            return estimativa
+
+        limitado = self.object_list.order_by()[:self.limiar + 1].count()
+        if limitado <= self.limiar:
+            return limitado
+        self.aproximado = True
+        return max(self._estimativa_explain() or 0, limitado)
+
+    @property
+    def total_exibicao(self):
+        if self.aproximado:
+            return f'{self.limiar:,}+'.replace(',', '.')
+        return f'{self.count:,}'.replace(',', '.')
+
+    def _conexao_postgresql(self):
+        conexao = connections[self.object_list.db]
+        return conexao if conexao.vendor == 'postgresql' else None
+
+    def _estimativa_tabela(self):
+        consulta = self.object_list.query
+        if consulta.where or consulta.distinct or consulta.combinator or consulta.is_sliced:
+            return None
+        conexao = self._conexao_postgresql()
+        if conexao is None:
+            return None
+        tabela = self.object_list.model._meta.db_table
+        with conexao.cursor() as cursor:
+            # Tabela particionada (ver particionar_encomendas): soma a estimativa das partições.
+            cursor.execute(
+                """
+                SELECT CASE WHEN c.relkind = 'p' THEN (
+                    SELECT SUM(GREATEST(p.reltuples, 0)) FROM pg_inherits i
+                    JOIN pg_class p ON p.oid = i.inhrelid WHERE i.inhparent = c.oid
+                ) ELSE GREATEST(c.reltuples, 0) END::bigint
+                FROM pg_class c WHERE c.oid = %s::regclass
+                """,
+                [tabela],
+            )
+            linha = cursor.fetchone()
+        return linha[0] if linha and linha[0] else None
+
+    def _estimativa_explain(self):
+        if self._conexao_postgresql() is None:
+            return None
+        plano = json.loads(self.object_list.order_by().explain(format='json'))
+        return int(plano[0]['Plan']['Plan Rows'])
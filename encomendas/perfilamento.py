@@ -0,0 +1,182 @@
+"""
+Perfilamento de requisições em produção (ver PerfilamentoMiddleware).
+
+Dois modos, configurados em settings.PERFILAMENTO:
+  - cProfile em uma amostra aleatória das requisições (AMOSTRA), com tempo por função;
+  - amostrador de pilha para todas as outras: uma única thread por processo anota, a
+    cada INTERVALO_MS, a pilha das threads que estão atendendo requisições. O custo é
+    só o da amostragem, e as amostras são descartadas a menos que a requisição passe
+    de LIMIAR_MS.
+
+Cada perfil vira um arquivo JSON em DIRETORIO com o resumo (funções mais caras e
+pilhas mais frequentes); os arquivos mais antigos são apagados além de MAX_ARQUIVOS.
+"""
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+PADRAO = {
+    'ATIVO': False,
+    'AMOSTRA': 0.01,
+    'LIMIAR_MS': 1000,
+    'INTERVALO_MS': 5,
+    'DIRETORIO': Path(settings.BASE_DIR) / 'perfis',
+    'MAX_ARQUIVOS': 500,
+    'TOP_FUNCOES': 30,
+}
+
+PROFUNDIDADE_MAXIMA = 64
+
+
+def configuracao():
+    return {**PADRAO, **getattr(settings, 'PERFILAMENTO', {})}
+
+
+def _local(arquivo):
+    """Caminho curto para exibição: relativo ao projeto ou a partir do pacote instalado."""
+    base = str(settings.BASE_DIR)
+    if arquivo.startswith(base):
+        return os.path.relpath(arquivo, base)
+    for marcador in ('site-packages' + os.sep, 'lib' + os.sep + 'python'):
+        if marcador in arquivo:
+            return arquivo.split(marcador, 1)[1]
+    return arquivo
+
+
+def _descrever(arquivo, linha, funcao):
+    return f'{funcao} ({_local(arquivo)}:{linha})'
+
+
+class AmostradorDePilha:
+    """Uma thread por processo que amostra a pilha das threads registradas."""
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self._ativas = {}
+        self._trava = threading.Lock()
+        self._thread = None
+
+    def iniciar(self, thread_id):
+        with self._trava:
+            self._ativas[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name='amostrador-de-pilha', daemon=True)
+                self._thread.start()
+
+    def parar(self, thread_id):
+        with self._trava:
+            return self._ativas.pop(thread_id, Counter())
+
+    def _executar(self):
+        while True:
+            time.sleep(self.intervalo)
+            with self._trava:
+                ativas = list(self._ativas.items())
+            if not ativas:
+                continue
+            quadros = sys._current_frames()
+            for thread_id, contador in ativas:
+                quadro = quadros.get(thread_id)
+                if quadro is not None:
+                    contador[self._pilha(quadro)] += 1
+
+    @staticmethod
+    def _pilha(quadro):
+        pilha = []
+        while quadro is not None and len(pilha) < PROFUNDIDADE_MAXIMA:
+            codigo = quadro.f_code
+            pilha.append((codigo.co_filename, quadro.f_lineno, codigo.co_name))
+            quadro = quadro.f_back
+        return tuple(reversed(pilha))
+
+
+def resumir_cprofile(perfil, top):
+    """Funções mais caras (tempo acumulado), com tempo próprio e quem mais as chamou."""
+    estatisticas = pstats.Stats(perfil).stats
+    maiores = sorted(estatisticas.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    funcoes = []
+    for (arquivo, linha, funcao), (_, chamadas, proprio, acumulado, chamadores) in maiores:
+        principais = sorted(chamadores.items(), key=lambda item: item[1][3], reverse=True)[:3]
+        funcoes.append({
+            'funcao': _descrever(arquivo, linha, funcao),
+            'chamadas': chamadas,
+            'acumulado_ms': round(acumulado * 1000, 2),
+            'proprio_ms': round(proprio * 1000, 2),
+            'chamado_por': [_descrever(*chave) for chave, _ in principais],
+        })
+    return {'funcoes': funcoes}
+
+
+def resumir_pilhas(amostras, intervalo_ms, top):
+    """Tempo estimado por função (inclusivo e próprio) e as pilhas mais frequentes."""
+    inclusivo, proprio = Counter(), Counter()
+    for pilha, quantidade in amostras.items():
+        for quadro in set(pilha):
+            inclusivo[quadro] += quantidade
+        if pilha:
+            proprio[pilha[-1]] += quantidade
+    funcoes = [
+        {
+            'funcao': _descrever(*quadro),
+            'amostras': quantidade,
+            'acumulado_ms': round(quantidade * intervalo_ms, 2),
+            'proprio_ms': round(proprio[quadro] * intervalo_ms, 2),
+        }
+        for quadro, quantidade in inclusivo.most_common(top)
+    ]
+    # Formato "collapsed" (a;b;c N), aceito por ferramentas de flame graph.
+    pilhas = [
+        {'pilha': ';'.join(quadro[2] for quadro in pilha), 'amostras': quantidade}
+        for pilha, quantidade in amostras.most_common(10)
+    ]
+    return {'funcoes': funcoes, 'pilhas': pilhas}
+
+
+def gravar_perfil(config, dados):
+    diretorio = Path(config['DIRETORIO'])
+    diretorio.mkdir(parents=True, exist_ok=True)
+    nome = f'{time.time_ns() // 1_000_000}-{uuid.uuid4().hex[:8]}.json'
+    temporario = diretorio / f'.{nome}'
+    temporario.write_text(json.dumps({'nome': nome, **dados}, ensure_ascii=False))
+    temporario.rename(diretorio / nome)  # leitores nunca veem um arquivo pela metade
+    _rotacionar(diretorio, config['MAX_ARQUIVOS'])
+
+
+def _rotacionar(diretorio, maximo):
+    arquivos = sorted(entrada.name for entrada in os.scandir(diretorio) if entrada.name.endswith('.json')
+                      and not entrada.name.startswith('.'))
+    for nome in arquivos[:max(0, len(arquivos) - maximo)]:
+        try:
+            (diretorio / nome).unlink()
+        except FileNotFoundError:
+            pass  # outro processo já apagou
+
+
+def listar_perfis():
+    diretorio = Path(configuracao()['DIRETORIO'])
+    if not diretorio.is_dir():
+        return []
+    perfis = []
+    for arquivo in diretorio.glob('[!.]*.json'):
+        try:
+            perfis.append(json.loads(arquivo.read_text()))
+        except (OSError, ValueError):
+            continue  # apagado pela rotação durante a leitura
+    return perfis
+
+
+def carregar_perfil(nome):
+    if Path(nome).name != nome or not nome.endswith('.json'):
+        return None
+    try:
+        return json.loads((Path(configuracao()['DIRETORIO']) / nome).read_text())
+    except (OSError, ValueError):
+        return None
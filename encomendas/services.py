@@ -0,0 +1,310 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .cache_equipe import invalidar
+from .models import Encomenda, ItemEncomenda, Cliente, Produto, Fornecedor, CotacaoRecente, Notificacao
+
+CAMPOS_ITEM = ['produto', 'fornecedor', 'quantidade', 'preco_cotado', 'valor_total', 'observacoes']
+CAMPOS_COTACAO = {'produto', 'fornecedor', 'preco_cotado'}
+# Limites das colunas (integer e DecimalField(max_digits=10, decimal_places=2)), para que
+# um valor fora da faixa no lote vire erro do pedido e não DataError no banco.
+MAIOR_INTEIRO = 2**31 - 1
+MAIOR_VALOR = Decimal('99999999.99')
+
+
+@transaction.atomic
+def salvar_encomenda(form, formset, entrega_form=None):
+    """
+    Grava a encomenda, seus itens e, se preenchida, a entrega em uma única transação.
+
+    Os totais são calculados em memória a partir do formset já validado, então a
+    encomenda é gravada uma única vez e os itens com no máximo um INSERT, um UPDATE
+    e um DELETE em lote, independente da quantidade de itens.
+    """
+    encomenda = form.save(commit=False)
+    if 'recorrencia_dias' in form.changed_data:
+        encomenda.agendar_recorrencia()
+    formset.instance = encomenda
+    alterados = formset.save(commit=False)  # só monta as instâncias; nada é gravado aqui
+
+    excluidos = set(formset.deleted_forms)
+    itens = [
+        item_form.instance for item_form in formset.forms
+        if item_form not in excluidos and (item_form.instance.pk or item_form.has_changed())
+    ]
+    for item in itens:
+        item.valor_total = item.quantidade * item.preco_cotado
+    encomenda.valor_total = sum((item.valor_total for item in itens), Decimal('0.00'))
+    if encomenda.pk is None:
+        encomenda.save()
+    else:
+        encomenda.salvar_versionado(form.cleaned_data['versao'])
+        if encomenda.status == 'pronta' and 'status' in form.changed_data:
+            Notificacao.enfileirar(encomenda)
+
+    novos = [item for item in alterados if item.pk is None]
+    existentes = [item for item in alterados if item.pk is not None]
+    if novos:
+        ItemEncomenda.objects.bulk_create(novos)
+    if existentes:
+        ItemEncomenda.objects.bulk_update(existentes, CAMPOS_ITEM)
+    if formset.deleted_objects:
+        ItemEncomenda.objects.filter(pk__in=[item.pk for item in formset.deleted_objects]).delete()
+
+    # Só preços novos ou alterados entram no índice de cotações.
+    CotacaoRecente.registrar(
+        [
+            item_form.instance for item_form in formset.forms
+            if item_form not in excluidos and CAMPOS_COTACAO & set(item_form.changed_data)
+        ],
+        encomenda.equipe_id,
+    )
+
+    # A entrega só passa a existir quando algum dado dela é de fato informado.
+    if entrega_form is not None and entrega_form.has_changed():
+        entrega = entrega_form.save(commit=False)
+        entrega.encomenda = encomenda
+        entrega_form.anexar_assinatura(entrega)
+        entrega.save()
+
+    return encomenda
+
+
+def _inteiro(valor):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return numero if -MAIOR_INTEIRO - 1 <= numero <= MAIOR_INTEIRO else None
+
+
+def _decimal(valor):
+    """Valor com 2 casas que cabe nas colunas DecimalField(max_digits=10); NaN/Infinity viram None."""
+    try:
+        numero = Decimal(str(valor))
+        if not numero.is_finite() or abs(numero) > MAIOR_VALOR:
+            return None
+        return numero.quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _montar_pedido(pedido, equipe, usuario, clientes, produtos, fornecedores):
+    """Valida um pedido do lote e devolve (encomenda, itens, erros), sem gravar nada."""
+    erros = {}
+    cliente_id = _inteiro(pedido.get('cliente'))
+    if cliente_id not in clientes:
+        erros['cliente'] = 'Cliente inválido.'
+    adiantamento = _decimal(pedido.get('valor_pago_adiantamento') or '0')
+    if adiantamento is None or adiantamento < 0:
+        erros['valor_pago_adiantamento'] = 'Valor inválido.'
+    data_prevista = None
+    if pedido.get('data_prevista_entrega'):
+        try:
+            data_prevista = parse_date(str(pedido['data_prevista_entrega']))
+        except ValueError:
+            pass
+        if data_prevista is None:
+            erros['data_prevista_entrega'] = 'Data inválida.'
+    recorrencia = _inteiro(pedido.get('recorrencia_dias') or None)
+    if pedido.get('recorrencia_dias') and not 1 <= (recorrencia or 0) <= 365:
+        erros['recorrencia_dias'] = 'Recorrência inválida.'
+
+    itens = []
+    for indice, item in enumerate(pedido.get('itens') or []):
+        produto_id, fornecedor_id = _inteiro(item.get('produto')), _inteiro(item.get('fornecedor'))
+        quantidade, preco = _inteiro(item.get('quantidade', 1)), _decimal(item.get('preco_cotado'))
+        if (produto_id not in produtos or fornecedor_id not in fornecedores or not quantidade or quantidade < 1
+                or preco is None or preco < Decimal('0.01') or quantidade * preco > MAIOR_VALOR):
+            erros[f'itens.{indice}'] = 'Produto, fornecedor, quantidade ou preço inválido.'
+            continue
+        itens.append(ItemEncomenda(
+            produto_id=produto_id, fornecedor_id=fornecedor_id, quantidade=quantidade, preco_cotado=preco,
+            valor_total=quantidade * preco, observacoes=str(item.get('observacoes') or ''),
+        ))
+    if sum((item.valor_total for item in itens), Decimal('0.00')) > MAIOR_VALOR:
+        erros['itens'] = 'Valor total da encomenda acima do permitido.'
+    if erros:
+        return None, None, erros
+
+    encomenda = Encomenda(
+        equipe=equipe, responsavel_criacao=usuario, cliente_id=cliente_id, status='criada',
+        valor_pago_adiantamento=adiantamento, data_prevista_entrega=data_prevista,
+        observacoes=str(pedido.get('observacoes') or ''), chave_idempotencia=pedido['chave'],
+        valor_total=sum((item.valor_total for item in itens), Decimal('0.00')), recorrencia_dias=recorrencia,
+    )
+    encomenda.agendar_recorrencia()
+    return encomenda, itens, None
+
+
+@transaction.atomic
+def criar_encomendas_em_lote(equipe, usuario, pedidos):
+    """
+    Cria de uma vez as encomendas enviadas pela fila offline do formulário.
+
+    Cada pedido traz uma `chave` gerada no navegador: chaves já gravadas devolvem a
+    encomenda existente em vez de criar outra, então reenviar o lote é seguro. A
+    validação faz uma consulta por cadastro (clientes, produtos, fornecedores) e a
+    gravação dois bulk_create, independente do tamanho do lote.
+
+    Retorna (resultados, erros): [{'chave', 'numero', 'criada'}] e [{'chave', 'erros'}].
+    """
+    for pedido in pedidos:
+        pedido['chave'] = str(pedido.get('chave') or '')[:64]
+    chaves = {pedido['chave'] for pedido in pedidos if pedido['chave']}
+    gravadas = dict(
+        Encomenda.objects.filter(equipe=equipe, chave_idempotencia__in=chaves)
+        .values_list('chave_idempotencia', 'numero_encomenda')
+    )
+
+    def da_equipe(modelo, registros, campo):
+        valores = {_inteiro(registro.get(campo)) for registro in registros} - {None}
+        return set(modelo.objects.filter(equipe=equipe, pk__in=valores).values_list('pk', flat=True))
+
+    pendentes = [pedido for pedido in pedidos if pedido['chave'] and pedido['chave'] not in gravadas]
+    itens_pendentes = [item for pedido in pendentes for item in (pedido.get('itens') or [])]
+    clientes = da_equipe(Cliente, pendentes, 'cliente')
+    produtos = da_equipe(Produto, itens_pendentes, 'produto')
+    fornecedores = da_equipe(Fornecedor, itens_pendentes, 'fornecedor')
+
+    erros, novas = [], {}
+    for pedido in pedidos:
+        if not pedido['chave']:
+            erros.append({'chave': '', 'erros': {'chave': 'Chave de idempotência obrigatória.'}})
+        elif pedido['chave'] not in gravadas and pedido['chave'] not in novas:
+            encomenda, itens, invalidos = _montar_pedido(pedido, equipe, usuario, clientes, produtos, fornecedores)
+            if invalidos:
+                erros.append({'chave': pedido['chave'], 'erros': invalidos})
+            else:
+                novas[pedido['chave']] = (encomenda, itens)
+
+    Encomenda.objects.bulk_create([encomenda for encomenda, _ in novas.values()])
+    todos_itens = []
+    for encomenda, itens in novas.values():
+        for item in itens:
+            item.encomenda = encomenda
+        todos_itens.extend(itens)
+    ItemEncomenda.objects.bulk_create(todos_itens)
+    CotacaoRecente.registrar(todos_itens, equipe.pk)
+    if novas:
+        invalidar(equipe.pk, 'encomendas')
+
+    resultados = [{'chave': chave, 'numero': numero, 'criada': False} for chave, numero in gravadas.items()]
+    resultados += [
+        {'chave': chave, 'numero': encomenda.numero_encomenda, 'criada': True}
+        for chave, (encomenda, _) in novas.items()
+    ]
+    return resultados, erros
+
+
+def _resumo_itens(itens):
+    return sorted(f"{item.produto} x{item.quantidade} @ R$ {item.preco_cotado}" for item in itens)
+
+
+def diferencas_encomenda(form, formset, atual):
+    """
+    Compara o que o usuário enviou com a versão gravada por outra pessoa.
+    Retorna uma lista de dicionários (campo, sua, atual) apenas com o que diverge.
+    """
+    diferencas = []
+    for nome, campo in form.fields.items():
+        if nome not in form._meta.fields or nome not in form.cleaned_data:
+            continue
+        enviado, gravado = form.cleaned_data[nome], getattr(atual, nome)
+        if enviado != gravado:
+            if nome == 'status':
+                escolhas = dict(atual.STATUS_CHOICES)
+                enviado, gravado = escolhas.get(enviado, enviado), escolhas.get(gravado, gravado)
+            diferencas.append({'campo': campo.label, 'sua': enviado, 'atual': gravado})
+
+    excluidos = set(formset.deleted_forms)
+    enviados = _resumo_itens(
+        item_form.instance for item_form in formset.forms
+        if item_form not in excluidos and (item_form.instance.pk or item_form.has_changed())
+    )
+    gravados = _resumo_itens(atual.itens.select_related('produto'))
+    if enviados != gravados:
+        diferencas.append({'campo': 'Itens', 'sua': '; '.join(enviados), 'atual': '; '.join(gravados)})
+    return diferencas
+
+
+@transaction.atomic
+def repetir_encomendas(originais, usuario=None, data=None):
+    """
+    Cria uma nova encomenda (status "criada") com o cliente, as observações e os itens de
+    cada original, com o preço da última cotação do produto naquele fornecedor (ou o do
+    item, se não houver cotação). A recorrência passa da original para a nova, agendada
+    a partir de `data` (hoje).
+
+    Cada original é repetida no máximo uma vez por data (chave de idempotência), então
+    um duplo clique ou uma segunda execução do comando devolvem a repetição já criada.
+    As originais ficam travadas (SELECT ... FOR UPDATE) antes da busca das chaves: dois
+    envios simultâneos esperam um pelo outro, e o segundo encontra a repetição do primeiro.
+    São no máximo sete consultas, independente de quantas encomendas e itens.
+
+    Retorna [(encomenda, criada)] na ordem das originais.
+    """
+    data = data or timezone.localdate()
+    originais = list(originais)
+    chaves = {original.pk: f'repeticao:{original.pk}:{data:%Y%m%d}' for original in originais}
+    list(Encomenda.objects.filter(pk__in=chaves).order_by('pk').select_for_update().values_list('pk', flat=True))
+    existentes = {
+        encomenda.chave_idempotencia: encomenda
+        for encomenda in Encomenda.objects.filter(chave_idempotencia__in=chaves.values())
+    }
+    pendentes = [original for original in originais if chaves[original.pk] not in existentes]
+
+    itens = defaultdict(list)
+    for item in ItemEncomenda.objects.filter(encomenda_id__in=[original.pk for original in pendentes]).order_by('pk'):
+        itens[item.encomenda_id].append(item)
+    todos = [item for lista in itens.values() for item in lista]
+    precos = {
+        (equipe_id, produto_id, fornecedor_id): preco
+        for equipe_id, produto_id, fornecedor_id, preco in CotacaoRecente.objects.filter(
+            equipe_id__in={original.equipe_id for original in pendentes},
+            produto_id__in={item.produto_id for item in todos},
+            fornecedor_id__in={item.fornecedor_id for item in todos},
+        ).values_list('equipe_id', 'produto_id', 'fornecedor_id', 'preco')
+    } if todos else {}
+
+    novas, copias = {}, {}
+    for original in pendentes:
+        encomenda = Encomenda(
+            equipe_id=original.equipe_id, cliente_id=original.cliente_id,
+            responsavel_criacao_id=usuario.pk if usuario else original.responsavel_criacao_id,
+            observacoes=original.observacoes, recorrencia_dias=original.recorrencia_dias,
+            chave_idempotencia=chaves[original.pk],
+        )
+        encomenda.agendar_recorrencia(data)
+        copias[original.pk] = []
+        for item in itens[original.pk]:
+            preco = precos.get((original.equipe_id, item.produto_id, item.fornecedor_id), item.preco_cotado)
+            copias[original.pk].append(ItemEncomenda(
+                produto_id=item.produto_id, fornecedor_id=item.fornecedor_id, quantidade=item.quantidade,
+                preco_cotado=preco, valor_total=item.quantidade * preco, observacoes=item.observacoes,
+            ))
+        encomenda.valor_total = sum((copia.valor_total for copia in copias[original.pk]), Decimal('0.00'))
+        novas[original.pk] = encomenda
+
+    Encomenda.objects.bulk_create(novas.values())
+    novos_itens = []
+    for pk, encomenda in novas.items():
+        for item in copias[pk]:
+            item.encomenda = encomenda
+        novos_itens.extend(copias[pk])
+    ItemEncomenda.objects.bulk_create(novos_itens)
+    Encomenda.objects.filter(pk__in=[original.pk for original in originais if original.recorrencia_dias]).update(
+        recorrencia_dias=None, proxima_recorrencia=None, versao=F('versao') + 1, updated_at=timezone.now(),
+    )
+    for equipe_id in {original.equipe_id for original in originais}:
+        invalidar(equipe_id, 'encomendas')
+
+    return [
+        (novas[original.pk], True) if original.pk in novas else (existentes[chaves[original.pk]], False)
+        for original in originais
+    ]
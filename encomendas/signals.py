@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autenticacao import invalidar_usuarios
+from .cache_equipe import invalidar
+from .models import Cliente, Encomenda, Entrega, Equipe, Fornecedor, ItemEncomenda, Produto
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidar_usuario_alterado(sender, instance, **kwargs):
+    # Inclui troca de senha, de equipe, desativação e o last_login gravado no login.
+    invalidar_usuarios(instance.pk)
+
+
+@receiver(post_save, sender=Equipe)
+def invalidar_membros_da_equipe(sender, instance, **kwargs):
+    invalidar_usuarios(*instance.membros.values_list('pk', flat=True))
+
+
+FAMILIAS = {Encomenda: 'encomendas', Cliente: 'clientes', Produto: 'produtos', Fornecedor: 'fornecedores'}
+
+
+def invalidar_listagens(sender, instance, **kwargs):
+    invalidar(instance.equipe_id, FAMILIAS[sender])
+
+
+# Um receptor por modelo: sem `sender`, o post_delete impediria o DELETE rápido de todos os modelos.
+for modelo in FAMILIAS:
+    post_save.connect(invalidar_listagens, sender=modelo, dispatch_uid=f'listagens_save_{modelo.__name__}')
+    post_delete.connect(invalidar_listagens, sender=modelo, dispatch_uid=f'listagens_delete_{modelo.__name__}')
+
+
+@receiver(post_save, sender=ItemEncomenda)
+@receiver(post_save, sender=Entrega)
+def invalidar_encomenda_do_detalhe(sender, instance, **kwargs):
+    # Sem receptor de exclusão: itens e entregas só são apagados junto com a gravação ou a
+    # exclusão da encomenda (que já invalida), e assim o DELETE em lote continua sem
+    # carregar as linhas.
+    invalidar(instance.encomenda.equipe_id, 'encomendas')
@@ -0,0 +1,109 @@
+// Fila offline de encomendas.
+// O formulário entrega ao service worker as encomendas digitadas sem conexão; elas
+// ficam no IndexedDB e são enviadas em lotes quando a conexão volta (Background Sync,
+// ou aviso da página onde o navegador não suporta). O envio usa a chave de cada
+// encomenda, então repetir um lote interrompido não cria duplicatas.
+const URL_LOTE = '{% url "api_encomendas_lote" %}';
+const TAG_SYNC = 'enviar-encomendas';
+const TAMANHO_LOTE = 50;
+
+function abrirBanco() {
+    return new Promise((resolve, reject) => {
+        const pedido = indexedDB.open('encomendas-offline', 1);
+        pedido.onupgradeneeded = () => pedido.result.createObjectStore('rascunhos', { keyPath: 'chave' });
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+}
+
+function transacao(modo, operacao) {
+    return abrirBanco().then(banco => new Promise((resolve, reject) => {
+        const tx = banco.transaction('rascunhos', modo);
+        const resultado = operacao(tx.objectStore('rascunhos'));
+        tx.oncomplete = () => resolve(resultado ? resultado.result : undefined);
+        tx.onerror = () => reject(tx.error);
+    }));
+}
+
+async function avisarPaginas(mensagem) {
+    const paginas = await self.clients.matchAll({ includeUncontrolled: true, type: 'window' });
+    paginas.forEach(pagina => pagina.postMessage(mensagem));
+}
+
+async function avisarSituacao() {
+    const rascunhos = await transacao('readonly', store => store.getAll());
+    await avisarPaginas({
+        tipo: 'fila',
+        pendentes: rascunhos.filter(rascunho => !rascunho.erros).length,
+        rejeitadas: rascunhos.filter(rascunho => rascunho.erros),
+    });
+}
+
+async function enviar() {
+    const pendentes = (await transacao('readonly', store => store.getAll()))
+        .filter(rascunho => !rascunho.erros)
+        .sort((a, b) => a.criado_em - b.criado_em);
+
+    for (let inicio = 0; inicio < pendentes.length; inicio += TAMANHO_LOTE) {
+        const lote = pendentes.slice(inicio, inicio + TAMANHO_LOTE);
+        const resposta = await fetch(URL_LOTE, {
+            method: 'POST',
+            credentials: 'same-origin',
+            redirect: 'manual',  // sessão expirada redireciona para o login: tratar como falha
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': lote[lote.length - 1].csrf },
+            body: JSON.stringify({ encomendas: lote.map(rascunho => rascunho.pedido) }),
+        });
+        if (!resposta.ok) {
+            throw new Error(`Envio da fila falhou (${resposta.status || resposta.type})`);
+        }
+        const dados = await resposta.json();
+        await transacao('readwrite', store => {
+            dados.encomendas.forEach(encomenda => store.delete(encomenda.chave));
+            dados.erros.forEach(erro => {
+                const rascunho = lote.find(item => item.chave === erro.chave);
+                if (rascunho) store.put({ ...rascunho, erros: erro.erros });
+            });
+        });
+        await avisarPaginas({ tipo: 'enviadas', encomendas: dados.encomendas });
+    }
+    await avisarSituacao();
+}
+
+let envioEmAndamento = null;
+function enviarFila() {
+    if (!envioEmAndamento) {
+        envioEmAndamento = enviar().finally(() => { envioEmAndamento = null; });
+    }
+    return envioEmAndamento;
+}
+
+function agendarEnvio() {
+    if (self.registration.sync) {
+        return self.registration.sync.register(TAG_SYNC).catch(() => enviarFila().catch(() => {}));
+    }
+    return enviarFila().catch(() => {});
+}
+
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', evento => evento.waitUntil(self.clients.claim()));
+
+// Rejeitar a promessa faz o navegador tentar o sync de novo mais tarde.
+self.addEventListener('sync', evento => {
+    if (evento.tag === TAG_SYNC) evento.waitUntil(enviarFila());
+});
+
+self.addEventListener('message', evento => {
+    const dados = evento.data || {};
+    if (dados.tipo === 'guardar') {
+        const rascunho = { ...dados.rascunho, criado_em: Date.now() };
+        evento.waitUntil(
+            transacao('readwrite', store => store.put(rascunho)).then(avisarSituacao).then(agendarEnvio)
+        );
+    } else if (dados.tipo === 'enviar') {
+        evento.waitUntil(enviarFila().catch(avisarSituacao));
+    } else if (dados.tipo === 'descartar') {
+        evento.waitUntil(transacao('readwrite', store => store.delete(dados.chave)).then(avisarSituacao));
+    } else if (dados.tipo === 'situacao') {
+        evento.waitUntil(avisarSituacao());
+    }
+});
@@ -1,3 +1,1042 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import re
+import shutil
+import tempfile
+from unittest import mock
+from datetime import date, timedelta
+from pathlib import Path
+from io import StringIO
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from .management.commands.particionar_encomendas import Command as ComandoParticionar
+from .models import (
+    CustomUser, Equipe, Cliente, Produto, Fornecedor, Encomenda, ItemEncomenda, Entrega, EncomendaArquivada,
+    CotacaoRecente, Notificacao,
+)
+from .forms import ClienteAdminForm, ClienteForm, EncomendaForm, ItemEncomendaFormSet
+from .autenticacao import chave_usuario
+from .cache_equipe import geracao, obter as obter_em_cache
+from .services import repetir_encomendas, salvar_encomenda
+from .compras import consolidar
+from .consultas_lentas import normalizar
+from .notificacoes import BackendArquivo, ErroTemporario, configuracao as config_notificacoes, despachar
+from .paginacao import PaginadorEstimado
+from .perfilamento import listar_perfis
+from . import views
+
+# Cache compartilhado (como CACHE_PERFIL = 'arquivo'), fora do diretório do projeto.
+CACHE_LISTAGENS = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes-listagens'}
+CACHE_ARQUIVO = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': Path(tempfile.gettempdir()) / 'encomendas-testes-cache',
+    },
+    'listagens': CACHE_LISTAGENS,
+}
+CACHE_LOCAL = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'testes'},
+    'listagens': CACHE_LISTAGENS,
+}
+
+
+@override_settings(CACHES=CACHE_ARQUIVO)
+class EncomendaTestCase(TestCase):
+    """Base com uma equipe, um usuário logado e o cadastro mínimo para montar encomendas."""
+
+    def setUp(self):
+        cache.clear()  # o cache sobrevive ao rollback entre os testes
+        caches['listagens'].clear()
+        self.equipe = Equipe.objects.create(nome='Drogaria Teste')
+        self.user = CustomUser.objects.create_user(username='atendente', password='Senha123', equipe=self.equipe)
+        self.client.force_login(self.user)
+        self.cliente = Cliente.objects.create(equipe=self.equipe, nome='Maria', bairro='Centro')
+        self.fornecedor = Fornecedor.objects.create(equipe=self.equipe, nome='Distribuidora', codigo='F1')
+        self.produtos = [
+            Produto.objects.create(equipe=self.equipe, nome=f'Produto {i}', codigo=f'P{i}', preco_base=Decimal('10.00'))
+            for i in range(5)
+        ]
+
+    def dados_formulario(self, itens, existentes=(), **extra):
+        """Monta o POST do formulário de encomenda com o formset de itens (prefixo 'itens')."""
+        dados = {
+            'cliente': self.cliente.pk,
+            'valor_pago_adiantamento': '0.00',
+            'data_prevista_entrega': '',
+            'observacoes': '',
+            'itens-TOTAL_FORMS': str(len(existentes) + len(itens)),
+            'itens-INITIAL_FORMS': str(len(existentes)),
+            'itens-MIN_NUM_FORMS': '0',
+            'itens-MAX_NUM_FORMS': '1000',
+        }
+        for i, (item_id, produto, quantidade, preco) in enumerate(
+            [(item.pk, item.produto, item.quantidade, item.preco_cotado) for item in existentes]
+            + [(None, produto, quantidade, preco) for produto, quantidade, preco in itens]
+        ):
+            dados.update({
+                f'itens-{i}-id': item_id or '',
+                f'itens-{i}-produto': produto.pk,
+                f'itens-{i}-fornecedor': self.fornecedor.pk,
+                f'itens-{i}-quantidade': quantidade,
+                f'itens-{i}-preco_cotado': preco,
+                f'itens-{i}-observacoes': '',
+            })
+        dados.update(extra)
+        return dados
+
+    def contar_escritas(self, url, dados):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.post(url, dados)
+        self.assertEqual(response.status_code, 302)
+        return len([
+            consulta for consulta in consultas.captured_queries
+            if consulta['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+
+
+class ManifestoEntregasTests(EncomendaTestCase):
+
+    def criar_paradas(self, quantidade, data):
+        for indice in range(quantidade):
+            cliente = Cliente.objects.create(
+                equipe=self.equipe, nome=f'Cliente {indice}', bairro=f'Bairro {indice % 3}', rua=f'Rua {indice}',
+            )
+            encomenda = Encomenda.objects.create(
+                equipe=self.equipe, cliente=cliente, status='pronta', data_prevista_entrega=data,
+            )
+            for produto in self.produtos[:2]:
+                ItemEncomenda.objects.create(
+                    encomenda=encomenda, produto=produto, fornecedor=self.fornecedor, preco_cotado=Decimal('5.00'),
+                )
+            if indice % 2:
+                Entrega.objects.create(encomenda=encomenda, responsavel_entrega='João')
+
+    def manifesto(self, data):
+        response = self.client.get(reverse('manifesto_entregas'), {'data': data.isoformat()})
+        return b''.join(response.streaming_content).decode()
+
+    def test_duas_consultas_com_n_e_2n_paradas(self):
+        self.manifesto(date(2026, 11, 1))  # usuário da sessão vai para o cache
+        for data, quantidade in ((date(2026, 11, 2), 3), (date(2026, 11, 3), 6)):
+            self.criar_paradas(quantidade, data)
+            with self.assertNumQueries(2):  # encomendas com cliente/entrega/responsável e itens
+                pagina = self.manifesto(data)
+            self.assertEqual(pagina.count('class="parada"'), quantidade)
+            self.assertEqual(pagina.count('class="bairro-titulo"'), 3)
+            self.assertLess(pagina.index('Bairro 0'), pagina.index('Bairro 1'))
+
+
+class SalvarEncomendaTests(EncomendaTestCase):
+
+    def test_criacao_calcula_totais_em_memoria(self):
+        dados = self.dados_formulario([(self.produtos[0], 2, '3.50'), (self.produtos[1], 1, '10.00')])
+        self.client.post(reverse('encomenda_create'), dados)
+
+        encomenda = Encomenda.objects.get()
+        self.assertEqual(encomenda.status, 'criada')
+        self.assertEqual(encomenda.valor_total, Decimal('17.00'))
+        self.assertEqual(
+            sorted(encomenda.itens.values_list('valor_total', flat=True)), [Decimal('7.00'), Decimal('10.00')]
+        )
+        self.assertFalse(Entrega.objects.exists())
+
+    def test_escritas_na_criacao_nao_dependem_da_quantidade_de_itens(self):
+        url = reverse('encomenda_create')
+        um_item = self.contar_escritas(url, self.dados_formulario([(self.produtos[0], 1, '5.00')]))
+        cinco_itens = self.contar_escritas(
+            url, self.dados_formulario([(produto, 1, '5.00') for produto in self.produtos])
+        )
+        self.assertEqual(um_item, cinco_itens)
+        self.assertEqual(ItemEncomenda.objects.count(), 6)
+
+    def formularios(self, dados, encomenda=None):
+        form = EncomendaForm(self.user, dados, instance=encomenda)
+        if encomenda is None:
+            form.fields.pop('status')
+        formset = ItemEncomendaFormSet(dados, instance=encomenda, form_kwargs={'user': self.user})
+        self.assertTrue(form.is_valid() and formset.is_valid())
+        form.instance.equipe = self.equipe
+        return form, formset
+
+    def test_salvar_encomenda_faz_as_mesmas_consultas_com_n_e_2n_itens(self):
+        for produtos in (self.produtos[:2], self.produtos[:4]):
+            form, formset = self.formularios(self.dados_formulario([(produto, 1, '5.00') for produto in produtos]))
+            # encomenda, itens, cotações (leitura travada e upsert) e dois pares de savepoint
+            with self.assertNumQueries(8):
+                encomenda = salvar_encomenda(form, formset)
+            self.assertEqual(encomenda.itens.count(), len(produtos))
+
+            existentes = list(encomenda.itens.all())
+            for item in existentes:
+                item.preco_cotado = Decimal('6.00')
+            dados = self.dados_formulario([], existentes=existentes, status='aprovada', versao=encomenda.versao)
+            form, formset = self.formularios(dados, Encomenda.objects.get(pk=encomenda.pk))
+            # encomenda (UPDATE condicional), itens (bulk_update), cotações e os savepoints
+            with self.assertNumQueries(8):
+                salvar_encomenda(form, formset)
+            self.assertEqual(Encomenda.objects.get(pk=encomenda.pk).valor_total, Decimal('6.00') * len(produtos))
+
+    def test_escritas_na_edicao_nao_dependem_da_quantidade_de_itens(self):
+        encomendas = []
+        for quantidade_itens in (2, 5):
+            encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+            for produto in self.produtos[:quantidade_itens]:
+                ItemEncomenda.objects.create(
+                    encomenda=encomenda, produto=produto, fornecedor=self.fornecedor, preco_cotado=Decimal('5.00')
+                )
+            encomendas.append(encomenda)
+
+        escritas = []
+        for encomenda in encomendas:
+            existentes = list(encomenda.itens.all())
+            for item in existentes:
+                item.quantidade = 3
+            dados = self.dados_formulario(
+                [(self.produtos[0], 1, '2.00')], existentes=existentes, status='aprovada', versao=encomenda.versao,
+            )
+            dados['itens-0-DELETE'] = 'on'
+            escritas.append(self.contar_escritas(reverse('encomenda_edit', args=[encomenda.pk]), dados))
+
+        self.assertEqual(escritas[0], escritas[1])
+        encomendas[1].refresh_from_db()
+        self.assertEqual(encomendas[1].itens.count(), 5)
+        self.assertEqual(encomendas[1].valor_total, Decimal('62.00'))
+
+    def test_edicao_nao_cria_entrega_sem_dados(self):
+        encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+        self.client.get(reverse('encomenda_edit', args=[encomenda.pk]))
+        self.client.post(
+            reverse('encomenda_edit', args=[encomenda.pk]), self.dados_formulario([], status='criada', versao='1')
+        )
+        self.assertFalse(Entrega.objects.exists())
+
+        self.client.post(
+            reverse('encomenda_edit', args=[encomenda.pk]),
+            self.dados_formulario([], status='pronta', responsavel_entrega='João', versao='2'),
+        )
+        self.assertEqual(Entrega.objects.get().responsavel_entrega, 'João')
+
+
+class ConcorrenciaEncomendaTests(EncomendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+
+    def test_edicao_com_versao_antiga_mostra_conflito(self):
+        url = reverse('encomenda_edit', args=[self.encomenda.pk])
+        Encomenda.objects.get(pk=self.encomenda.pk).atualizar_status('aprovada', 1)
+
+        response = self.client.post(url, self.dados_formulario([], status='cancelada', versao='1'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['conflito'][0]['atual'], 'Aprovada')
+        self.encomenda.refresh_from_db()
+        self.assertEqual((self.encomenda.status, self.encomenda.versao), ('aprovada', 2))
+
+        # Reenviando a partir da versão mostrada no conflito a gravação passa.
+        response = self.client.post(url, self.dados_formulario([], status='cancelada', versao='2'))
+        self.assertEqual(response.status_code, 302)
+        self.encomenda.refresh_from_db()
+        self.assertEqual((self.encomenda.status, self.encomenda.versao), ('cancelada', 3))
+
+    def test_status_pela_api_respeita_versao(self):
+        url = reverse('api_update_status', args=[self.encomenda.pk])
+        response = self.client.post(url, {'status': 'aprovada', 'versao': '1'})
+        self.assertEqual(response.json()['versao'], 2)
+
+        response = self.client.post(url, {'status': 'cancelada', 'versao': '1'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'aprovada')
+        self.encomenda.refresh_from_db()
+        self.assertEqual(self.encomenda.status, 'aprovada')
+
+    def test_sem_versao_a_alteracao_e_recusada(self):
+        response = self.client.post(reverse('api_update_status', args=[self.encomenda.pk]), {'status': 'aprovada'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            reverse('encomenda_edit', args=[self.encomenda.pk]), self.dados_formulario([], status='cancelada'),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.encomenda.refresh_from_db()
+        self.assertEqual((self.encomenda.status, self.encomenda.versao), ('criada', 1))
+
+    def test_gravacao_comum_avanca_a_versao(self):
+        # Admin e calcular_valor_total gravam com save(): a edição aberta na versão 1 vira conflito.
+        self.encomenda.observacoes = 'Alterada no admin'
+        self.encomenda.save()
+        self.assertEqual(self.encomenda.versao, 2)
+        self.encomenda.calcular_valor_total()
+        self.assertEqual(Encomenda.objects.get(pk=self.encomenda.pk).versao, 3)
+
+        response = self.client.post(
+            reverse('encomenda_edit', args=[self.encomenda.pk]), self.dados_formulario([], status='aprovada', versao='1'),
+        )
+        self.assertTrue(response.context['conflito'])
+
+
+class ArquivamentoTests(EncomendaTestCase):
+
+    def criar(self, status, dias_atras):
+        encomenda = Encomenda.objects.create(
+            equipe=self.equipe, cliente=self.cliente, status=status,
+            data_encomenda=timezone.now() - timedelta(days=dias_atras),
+        )
+        ItemEncomenda.objects.create(
+            encomenda=encomenda, produto=self.produtos[0], fornecedor=self.fornecedor, preco_cotado=Decimal('4.00')
+        )
+        Entrega.objects.create(encomenda=encomenda, responsavel_entrega='João')
+        return encomenda
+
+    def test_move_apenas_finalizadas_antigas_com_itens_e_entrega(self):
+        antiga = self.criar('entregue', 400)
+        recente = self.criar('entregue', 1)
+        aberta = self.criar('aprovada', 400)
+
+        call_command('arquivar_encomendas', meses=6, lote=1, stdout=StringIO())
+
+        self.assertEqual(set(Encomenda.objects.values_list('pk', flat=True)), {recente.pk, aberta.pk})
+        arquivada = EncomendaArquivada.objects.get()
+        self.assertEqual(arquivada.pk, antiga.pk)
+        self.assertEqual(arquivada.itens.get().valor_total, Decimal('4.00'))
+        self.assertEqual(arquivada.entrega.responsavel_entrega, 'João')
+        self.assertEqual(ItemEncomenda.objects.filter(encomenda_id=antiga.pk).count(), 0)
+
+    def test_recorrencia_ativa_nao_e_arquivada(self):
+        recorrente = self.criar('entregue', 400)
+        Encomenda.objects.filter(pk=recorrente.pk).update(recorrencia_dias=30, proxima_recorrencia=date(2026, 11, 1))
+        cancelada = self.criar('cancelada', 400)
+        Encomenda.objects.filter(pk=cancelada.pk).update(recorrencia_dias=30, proxima_recorrencia=date(2026, 11, 1))
+
+        call_command('arquivar_encomendas', meses=6, stdout=StringIO())
+
+        self.assertEqual(list(Encomenda.objects.values_list('pk', flat=True)), [recorrente.pk])
+        self.assertEqual(list(EncomendaArquivada.objects.values_list('pk', flat=True)), [cancelada.pk])
+
+    def test_detalhe_e_busca_consultam_o_arquivo(self):
+        antiga = self.criar('cancelada', 400)
+        call_command('arquivar_encomendas', meses=6, stdout=StringIO())
+
+        response = self.client.get(reverse('encomenda_detail', args=[antiga.pk]))
+        self.assertTrue(response.context['arquivada'])
+
+        response = self.client.get(reverse('encomenda_list'), {'search': 'Produto 0'})
+        self.assertTrue(response.context['arquivo'])
+        self.assertEqual([encomenda.pk for encomenda in response.context['page_obj']], [antiga.pk])
+
+    def test_busca_com_ativas_oferece_as_arquivadas(self):
+        antiga = self.criar('cancelada', 400)
+        call_command('arquivar_encomendas', meses=6, stdout=StringIO())
+        ativa = self.criar('criada', 1)
+
+        response = self.client.get(reverse('encomenda_list'), {'search': 'Produto 0'})
+        self.assertEqual([encomenda.pk for encomenda in response.context['page_obj']], [ativa.pk])
+        self.assertTrue(response.context['tem_arquivadas'])
+
+        response = self.client.get(reverse('encomenda_list'), {'search': 'Produto 0', 'arquivo': '1'})
+        self.assertTrue(response.context['arquivo'])
+        self.assertEqual([encomenda.pk for encomenda in response.context['page_obj']], [antiga.pk])
+
+
+class ParticionamentoTests(TestCase):
+
+    def particionar(self, *args):
+        saida = StringIO()
+        call_command('particionar_encomendas', '--sql', *args, stdout=saida)
+        return saida.getvalue()
+
+    def test_triggers_substituem_a_fk_com_key_share(self):
+        comando = ComandoParticionar()
+        comando.comandos = []
+        comando._trigger_fk({
+            'nome': 'encomendas_entrega_encomenda_id_fk', 'tabela': 'encomendas_entrega', 'coluna': 'encomenda_id',
+            'alvo': 'encomendas_encomenda', 'alvo_coluna': 'numero_encomenda', 'restricoes': [],
+        })
+        sql = '\n'.join(comando.comandos)
+        self.assertIn(
+            'PERFORM 1 FROM encomendas_encomenda WHERE numero_encomenda = NEW.encomenda_id FOR KEY SHARE', sql,
+        )
+        self.assertIn('PERFORM 1 FROM encomendas_entrega WHERE encomenda_id = OLD.numero_encomenda LIMIT 1 FOR KEY SHARE', sql)
+        self.assertIn(
+            'CREATE TRIGGER encomendas_entrega_encomenda_id_fk_restringe AFTER DELETE OR UPDATE OF numero_encomenda '
+            'ON encomendas_encomenda', sql,
+        )
+        self.assertEqual(
+            comando._particoes_hash('encomendas_itemencomenda', 2),
+            [
+                'CREATE TABLE encomendas_itemencomenda_p00 PARTITION OF encomendas_itemencomenda '
+                'FOR VALUES WITH (MODULUS 2, REMAINDER 0)',
+                'CREATE TABLE encomendas_itemencomenda_p01 PARTITION OF encomendas_itemencomenda '
+                'FOR VALUES WITH (MODULUS 2, REMAINDER 1)',
+            ],
+        )
+
+    def test_estrategia_equipe_preserva_a_chave_de_idempotencia(self):
+        if connection.vendor != 'postgresql':
+            with self.assertRaisesMessage(CommandError, 'PostgreSQL'):
+                self.particionar()
+            return
+        sql = self.particionar('--particoes', '4')
+        self.assertIn('PARTITION BY HASH (equipe_id)', sql)
+        self.assertIn('PARTITION BY HASH (encomenda_id)', sql)
+        self.assertIn('ADD CONSTRAINT encomendas_encomenda_pkey PRIMARY KEY (numero_encomenda, equipe_id)', sql)
+        self.assertIn('ADD CONSTRAINT encomenda_chave_unica_por_equipe UNIQUE (equipe_id, chave_idempotencia)', sql)
+        self.assertIn('CREATE TABLE encomendas_encomenda_p03 PARTITION OF encomendas_encomenda', sql)
+        self.assertIn('CREATE TRIGGER encomendas_entrega_encomenda_id_fk_verifica', sql)
+        self.assertNotIn('CREATE TABLE encomendas_encomenda_p04', sql)
+
+    def test_estrategia_data_e_recusada_sem_a_chave_na_restricao_unica(self):
+        if connection.vendor != 'postgresql':
+            return
+        with self.assertRaisesMessage(CommandError, 'encomenda_chave_unica_por_equipe'):
+            self.particionar('--estrategia', 'data')
+
+
+class PaginadorEstimadoTests(EncomendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Encomenda.objects.bulk_create(Encomenda(equipe=self.equipe, cliente=self.cliente) for _ in range(7))
+
+    def test_contagem_exata_abaixo_do_limiar(self):
+        paginador = PaginadorEstimado(Encomenda.objects.filter(equipe=self.equipe), 2)
+        self.assertEqual(paginador.count, 7)
+        self.assertFalse(paginador.aproximado)
+        self.assertEqual(paginador.total_exibicao, '7')
+
+    def test_contagem_limitada_acima_do_limiar(self):
+        paginador = PaginadorEstimado(Encomenda.objects.filter(equipe=self.equipe), 2)
+        paginador.limiar = 5
+        self.assertGreaterEqual(paginador.count, 6)
+        self.assertTrue(paginador.aproximado)
+        self.assertEqual(paginador.total_exibicao, '5+')
+
+
+class AdminBuscaTests(EncomendaTestCase):
+
+    def test_numero_maior_que_integer_nao_quebra_a_busca(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+        url = reverse('admin:encomendas_encomenda_changelist')
+        self.assertEqual(self.client.get(url, {'q': '9' * 12}).status_code, 200)
+        self.assertContains(self.client.get(url, {'q': f'#{encomenda.pk}'}), f'Encomenda #{encomenda.pk}')
+
+
+class BuscaClienteTests(EncomendaTestCase):
+
+    def test_busca_por_telefone_com_mascara_traz_encomendas_abertas(self):
+        self.cliente.telefone = '(32) 99999-1234'
+        self.cliente.save()
+        aberta = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente, status='criada')
+        Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente, status='entregue')
+
+        with self.assertNumQueries(3):  # usuário com a equipe (sessão no cache), clientes, encomendas em aberto
+            response = self.client.get(reverse('api_buscar_cliente'), {'q': '32 999991234'})
+        clientes = response.json()['clientes']
+        self.assertEqual([c['id'] for c in clientes], [self.cliente.pk])
+        self.assertEqual([e['numero'] for e in clientes[0]['encomendas_abertas']], [aberta.pk])
+
+    def test_cpf_repetido_na_equipe_e_recusado(self):
+        self.cliente.cpf = '123.456.789-09'
+        self.cliente.save()
+        form = ClienteForm({'nome': 'João', 'cpf': '12345678909'}, equipe=self.equipe)
+        self.assertIn('cpf', form.errors)
+
+    def test_admin_recusa_cpf_repetido_de_cadastro_antigo_e_busca_com_mascara(self):
+        self.cliente.cpf = '123.456.789-09'
+        self.cliente.save()
+        antigo = Cliente.objects.create(equipe=self.equipe, nome='Maria (antigo)')
+        Cliente.objects.filter(pk=antigo.pk).update(cpf='12345678909', cpf_normalizado='')  # não normalizado
+        form = ClienteAdminForm({'nome': 'Maria (antigo)', 'cpf': '12345678909', 'equipe': self.equipe.pk}, instance=antigo)
+        self.assertIn('cpf', form.errors)
+
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse('admin:encomendas_cliente_changelist'), {'q': '123.456.789-09'})
+        self.assertContains(response, 'Maria')
+
+    def test_normalizar_clientes_preenche_existentes_e_aponta_duplicados(self):
+        Cliente.objects.bulk_create([
+            Cliente(equipe=self.equipe, nome='Ana', cpf='111.222.333-44', telefone='(32) 3333-0000'),
+            Cliente(equipe=self.equipe, nome='Ana (repetida)', cpf='11122233344'),
+        ])
+        saida = StringIO()
+        call_command('normalizar_clientes', lote=1, stdout=saida)
+        ana, repetida = Cliente.objects.filter(nome__startswith='Ana').order_by('pk')
+        self.assertEqual((ana.cpf_normalizado, ana.telefone_normalizado), ('11122233344', '3233330000'))
+        self.assertEqual(repetida.cpf_normalizado, '')
+        self.assertIn(f'cliente {repetida.pk}', saida.getvalue())
+
+
+class CotacaoRecenteTests(EncomendaTestCase):
+
+    def test_gravacao_de_itens_atualiza_ultimo_preco_e_media(self):
+        produto = self.produtos[0]
+        self.client.post(reverse('encomenda_create'), self.dados_formulario([(produto, 1, '10.00')]))
+        self.client.post(reverse('encomenda_create'), self.dados_formulario([(produto, 2, '12.00')]))
+
+        cotacao = CotacaoRecente.objects.get(produto=produto, fornecedor=self.fornecedor)
+        self.assertEqual((cotacao.preco, cotacao.preco_medio, cotacao.total_cotacoes),
+                         (Decimal('12.00'), Decimal('11.0000'), 2))
+
+        response = self.client.get(reverse('api_produto_cotacoes', args=[produto.pk]))
+        self.assertEqual(response.json()['cotacoes'][0]['preco'], '12.00')
+
+        CotacaoRecente.objects.all().delete()
+        call_command('reconstruir_cotacoes', stdout=StringIO())
+        cotacao = CotacaoRecente.objects.get(produto=produto, fornecedor=self.fornecedor)
+        self.assertEqual((cotacao.preco, cotacao.preco_medio, cotacao.total_cotacoes),
+                         (Decimal('12.00'), Decimal('11.0000'), 2))
+
+
+    def test_salvar_item_sem_mudar_preco_nao_conta_nova_cotacao(self):
+        encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+        item = ItemEncomenda.objects.create(
+            encomenda=encomenda, produto=self.produtos[0], fornecedor=self.fornecedor, preco_cotado=Decimal('8.00'),
+        )
+        item.quantidade = 3
+        item.save()
+        item = ItemEncomenda.objects.get(pk=item.pk)
+        item.observacoes = 'sem lactose'
+        item.save()
+        self.assertEqual(CotacaoRecente.objects.get().total_cotacoes, 1)
+
+        item.preco_cotado = Decimal('9.00')
+        item.save()
+        self.assertEqual(CotacaoRecente.objects.get().total_cotacoes, 2)
+
+class EnvioIdempotenteTests(EncomendaTestCase):
+
+    def lote(self, *pedidos):
+        return self.client.post(
+            reverse('api_encomendas_lote'), json.dumps({'encomendas': list(pedidos)}), content_type='application/json'
+        )
+
+    def pedido(self, chave, produto=None):
+        produto = produto or self.produtos[0]
+        return {
+            'chave': chave, 'cliente': self.cliente.pk,
+            'itens': [{'produto': produto.pk, 'fornecedor': self.fornecedor.pk, 'quantidade': 2, 'preco_cotado': '4.50'}],
+        }
+
+    def test_reenvio_do_lote_nao_duplica(self):
+        primeira = self.lote(self.pedido('a1'), self.pedido('a2')).json()
+        segunda = self.lote(self.pedido('a1'), self.pedido('a2'), self.pedido('a3')).json()
+
+        self.assertEqual(Encomenda.objects.count(), 3)
+        numeros = {r['chave']: r['numero'] for r in segunda['encomendas']}
+        self.assertEqual({r['chave']: r['numero'] for r in primeira['encomendas']}, {k: numeros[k] for k in ('a1', 'a2')})
+        self.assertEqual(Encomenda.objects.get(chave_idempotencia='a3').valor_total, Decimal('9.00'))
+        self.assertEqual(ItemEncomenda.objects.count(), 3)
+
+    def test_pedido_invalido_volta_como_erro_sem_impedir_os_demais(self):
+        outra_equipe = Equipe.objects.create(nome='Outra')
+        produto_alheio = Produto.objects.create(equipe=outra_equipe, nome='X', codigo='X', preco_base=Decimal('1.00'))
+        resposta = self.lote(self.pedido('ok'), self.pedido('ruim', produto=produto_alheio)).json()
+
+        self.assertEqual([r['chave'] for r in resposta['encomendas']], ['ok'])
+        self.assertEqual(resposta['erros'][0]['chave'], 'ruim')
+        self.assertFalse(Encomenda.objects.filter(chave_idempotencia='ruim').exists())
+
+    def test_formulario_reenviado_mostra_a_encomenda_ja_criada(self):
+        dados = self.dados_formulario([(self.produtos[0], 1, '5.00')], chave_idempotencia='f1')
+        primeira = self.client.post(reverse('encomenda_create'), dados)
+        segunda = self.client.post(reverse('encomenda_create'), dados)
+        self.assertEqual(Encomenda.objects.count(), 1)
+        self.assertEqual(primeira.url, segunda.url)
+
+    def test_envio_concorrente_com_a_mesma_chave_mostra_a_encomenda_ja_criada(self):
+        dados = self.dados_formulario([(self.produtos[0], 1, '5.00')], chave_idempotencia='f2')
+        primeira = self.client.post(reverse('encomenda_create'), dados)
+        original = views._ja_registrada
+        chamadas = []
+
+        def verificacao_antes_do_commit_concorrente(request, chave):
+            # A primeira consulta ainda não vê a encomenda gravada pelo outro envio.
+            chamadas.append(chave)
+            return None if len(chamadas) == 1 else original(request, chave)
+
+        with mock.patch.object(views, '_ja_registrada', verificacao_antes_do_commit_concorrente):
+            segunda = self.client.post(reverse('encomenda_create'), dados)
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(Encomenda.objects.count(), 1)
+        self.assertEqual(primeira.url, segunda.url)
+
+    def test_lote_recusa_valores_fora_da_faixa(self):
+        pedidos = []
+        for chave, quantidade, preco in [
+            ('nan', 1, 'NaN'), ('inf', 1, 'Infinity'), ('preco', 1, '123456789.00'),
+            ('qtd', 2**31, '1.00'), ('total_item', 1001, '99999.99'),
+        ]:
+            pedido = self.pedido(chave)
+            pedido['itens'][0].update(quantidade=quantidade, preco_cotado=preco)
+            pedidos.append(pedido)
+        total = self.pedido('total')
+        total['itens'] = [dict(total['itens'][0], quantidade=1, preco_cotado='60000000.00')] * 2
+        adiantamento = dict(self.pedido('adiantamento'), valor_pago_adiantamento='1e20')
+
+        resposta = self.lote(*pedidos, total, adiantamento, self.pedido('ok')).json()
+
+        self.assertEqual([r['chave'] for r in resposta['encomendas']], ['ok'])
+        self.assertEqual(
+            [e['chave'] for e in resposta['erros']], ['nan', 'inf', 'preco', 'qtd', 'total_item', 'total', 'adiantamento']
+        )
+        self.assertEqual(Encomenda.objects.count(), 1)
+
+
+class ApiLeituraTests(EncomendaTestCase):
+
+    def listar(self, recurso, **parametros):
+        return self.client.get(reverse('api_listar', args=[recurso]), parametros)
+
+    def test_campos_esparsos_e_paginacao_por_cursor(self):
+        encomendas = [Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente) for _ in range(5)]
+        vistos, cursor = [], None
+        while True:
+            parametros = {'fields': 'status,cliente_nome', 'limit': 2}
+            if cursor:
+                parametros['cursor'] = cursor
+            dados = self.listar('encomendas', **parametros).json()
+            vistos += dados['resultados']
+            cursor = dados['proximo_cursor']
+            if not cursor:
+                break
+        self.assertEqual([r['id'] for r in vistos], [e.pk for e in encomendas])
+        self.assertEqual(set(vistos[0]), {'id', 'status', 'cliente_nome'})
+
+    def test_busca_por_ids_em_uma_consulta_e_alteracoes_desde(self):
+        antes = timezone.now()
+        outra_equipe = Equipe.objects.create(nome='Outra')
+        alheio = Produto.objects.create(equipe=outra_equipe, nome='X', codigo='X', preco_base=Decimal('1.00'))
+        ids = ','.join(str(p.pk) for p in self.produtos[:3] + [alheio])
+        with self.assertNumQueries(2):  # usuário com a equipe (sessão no cache), produtos
+            dados = self.listar('produtos', ids=ids, fields='nome').json()
+        self.assertEqual(sorted(r['id'] for r in dados['resultados']), [p.pk for p in self.produtos[:3]])
+
+        Produto.objects.filter(pk=self.produtos[4].pk).update(updated_at=antes + timedelta(hours=1))
+        dados = self.listar('produtos', updated_since=(antes + timedelta(minutes=30)).isoformat()).json()
+        self.assertEqual([r['id'] for r in dados['resultados']], [self.produtos[4].pk])
+
+    def test_campo_desconhecido_e_recusado(self):
+        self.assertEqual(self.listar('clientes', fields='nome,senha').status_code, 400)
+
+    def test_cursor_com_data_invalida_e_recusado(self):
+        cursor = base64.urlsafe_b64encode(b'ontem|3').decode()
+        resposta = self.listar('encomendas', cursor=cursor)
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(resposta.json()['error'], 'cursor inválido')
+
+
+class PerfilamentoTests(EncomendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.diretorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.diretorio)
+
+    def perfilamento(self, **config):
+        return override_settings(PERFILAMENTO={'ATIVO': True, 'DIRETORIO': self.diretorio, **config})
+
+    def test_amostra_com_cprofile_aparece_para_a_equipe_tecnica(self):
+        with self.perfilamento(AMOSTRA=1.0):
+            self.client.get(reverse('encomenda_list'))
+        perfil, = listar_perfis_em(self.diretorio)
+        self.assertEqual((perfil['rota'], perfil['tipo']), ('encomenda_list', 'cprofile'))
+        self.assertTrue(perfil['funcoes'])
+
+        with self.settings(PERFILAMENTO={'DIRETORIO': self.diretorio}):
+            self.assertEqual(self.client.get(reverse('perfis_lista')).status_code, 302)
+            self.user.is_staff = True
+            self.user.save()
+            self.assertContains(self.client.get(reverse('perfis_lista')), 'encomenda_list')
+            self.assertEqual(self.client.get(reverse('perfil_detalhe', args=[perfil['nome']])).status_code, 200)
+
+    def test_requisicao_lenta_e_guardada_por_amostragem_de_pilha_com_rotacao(self):
+        with self.perfilamento(AMOSTRA=0, LIMIAR_MS=0, MAX_ARQUIVOS=2):
+            for _ in range(3):
+                self.client.get(reverse('dashboard'))
+        perfis = listar_perfis_em(self.diretorio)
+        self.assertEqual(len(perfis), 2)
+        self.assertEqual({perfil['tipo'] for perfil in perfis}, {'pilha'})
+
+
+def listar_perfis_em(diretorio):
+    with override_settings(PERFILAMENTO={'DIRETORIO': diretorio}):
+        return listar_perfis()
+
+
+class ConsultasLentasTests(EncomendaTestCase):
+
+    def test_normalizacao_agrupa_consultas_iguais(self):
+        a = normalizar("SELECT * FROM t WHERE id IN (1, 2, 3) AND nome = 'Maria'")
+        b = normalizar("SELECT  * FROM t WHERE id IN (7) AND nome = 'João'")
+        self.assertEqual(a, b)
+        self.assertEqual(a, 'SELECT * FROM t WHERE id IN (?...) AND nome = ?')
+
+    def test_registra_consultas_da_requisicao_e_resume_no_comando(self):
+        arquivo = Path(tempfile.mkdtemp()) / 'lentas.jsonl'
+        self.addCleanup(shutil.rmtree, arquivo.parent)
+        config = {'ATIVO': True, 'LIMIAR_MS': 0, 'AMOSTRA_EXPLAIN': 1.0, 'ARQUIVO': arquivo}
+        with override_settings(CONSULTAS_LENTAS=config):
+            self.client.get(reverse('encomenda_list'), {'search': 'Maria'})
+            saida = StringIO()
+            call_command('consultas_lentas', rota='encomenda_list', explain=True, stdout=saida)
+
+        registros = [json.loads(linha) for linha in arquivo.read_text().splitlines()]
+        da_lista = [r for r in registros if r['rota'] == 'encomenda_list' and 'encomendas/views.py' in r['origem']]
+        self.assertTrue(da_lista)
+        self.assertNotIn('Maria', arquivo.read_text().split('"explain"')[0])
+        if connection.vendor == 'postgresql':
+            self.assertTrue(any('explain' in r for r in registros))
+        self.assertIn(da_lista[0]['impressao'], saida.getvalue())
+
+
+
+class BackendQueFalha(BackendArquivo):
+    def enviar(self, mensagem):
+        raise ErroTemporario('servidor fora do ar')
+
+
+class NotificacaoTests(EncomendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Cliente.objects.filter(pk=self.cliente.pk).update(email='maria@exemplo.com')
+        self.arquivo = Path(tempfile.mkdtemp()) / 'enviadas.jsonl'
+        self.addCleanup(shutil.rmtree, self.arquivo.parent)
+
+    def config(self, backend='encomendas.notificacoes.BackendArquivo'):
+        return {**config_notificacoes(), 'BACKENDS': {'email': backend}, 'ARQUIVO': self.arquivo}
+
+    def marcar_pronta(self, encomenda):
+        return self.client.post(reverse('api_update_status', args=[encomenda.pk]), {'status': 'pronta', 'versao': encomenda.versao})
+
+    def test_status_pronta_grava_aviso_e_despachante_agrupa_por_cliente(self):
+        encomendas = [Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente) for _ in range(2)]
+        for encomenda in encomendas:
+            self.assertEqual(self.marcar_pronta(encomenda).status_code, 200)
+        self.assertEqual(self.marcar_pronta(Encomenda.objects.get(pk=encomendas[0].pk)).status_code, 200)
+        self.assertEqual(Notificacao.objects.filter(status='pendente', canal='email').count(), 2)
+
+        resultado = despachar(self.config(), dormir=lambda segundos: None)
+
+        self.assertEqual((resultado['enviadas'], resultado['mensagens']), (2, 1))
+        mensagens = [json.loads(linha) for linha in self.arquivo.read_text().splitlines()]
+        self.assertEqual(len(mensagens), 1)
+        self.assertIn(f'nº {encomendas[0].pk}, nº {encomendas[1].pk}', mensagens[0]['corpo'])
+        self.assertFalse(Notificacao.objects.exclude(status='enviada').exists())
+
+    def test_falha_temporaria_reagenda_e_desiste_apos_maximo(self):
+        encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+        self.marcar_pronta(encomenda)
+        config = {**self.config('encomendas.tests.BackendQueFalha'), 'MAX_TENTATIVAS': 2}
+
+        self.assertEqual(despachar(config), {'reagendadas': 1})
+        notificacao = Notificacao.objects.get()
+        self.assertEqual((notificacao.status, notificacao.tentativas), ('pendente', 1))
+        self.assertGreater(notificacao.proxima_tentativa, timezone.now())
+
+        Notificacao.objects.update(proxima_tentativa=timezone.now())
+        self.assertEqual(despachar(config), {'falharam': 1})
+        self.assertEqual(Notificacao.objects.get().status, 'falhou')
+
+    def test_rodada_para_antes_de_a_reserva_vencer(self):
+        for indice in range(5):
+            cliente = Cliente.objects.create(equipe=self.equipe, nome=f'Cliente {indice}', email=f'c{indice}@exemplo.com')
+            self.marcar_pronta(Encomenda.objects.create(equipe=self.equipe, cliente=cliente))
+        config = {**self.config(), 'POR_MINUTO': {'email': 1}, 'RESERVA_S': 200, 'MARGEM_RESERVA_S': 60}
+        relogio = [1000.0]
+
+        def dormir(segundos):
+            relogio[0] += segundos
+
+        resultado = despachar(config, dormir=dormir, relogio=lambda: relogio[0])
+
+        # Envios em 0, 60 e 120 s; o de 180 s passaria do prazo (200 - 60) e volta para a fila.
+        self.assertEqual((resultado['enviadas'], resultado['devolvidas']), (3, 2))
+        self.assertLessEqual(relogio[0] - 1000, config['RESERVA_S'] - config['MARGEM_RESERVA_S'])
+        self.assertEqual(
+            Notificacao.objects.filter(status='pendente', proxima_tentativa__lte=timezone.now()).count(), 2,
+        )
+        self.assertEqual(len(self.arquivo.read_text().splitlines()), 3)
+
+
+
+class AssinaturaEntregaTests(EncomendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        configuracao = override_settings(MEDIA_ROOT=media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+
+    def desenho(self):
+        imagem = Image.new('RGBA', (600, 200), (0, 0, 0, 0))
+        ImageDraw.Draw(imagem).line([(50, 150), (200, 40), (400, 160), (550, 60)], fill='black', width=3)
+        saida = io.BytesIO()
+        imagem.save(saida, format='PNG')
+        return 'data:image/png;base64,' + base64.b64encode(saida.getvalue()).decode()
+
+    def salvar(self, desenho):
+        return self.client.post(reverse('encomenda_edit', args=[self.encomenda.pk]), self.dados_formulario(
+            [], status='pronta', versao=str(self.encomenda.versao), responsavel_entrega='Carlos',
+            assinatura_desenho=desenho,
+        ))
+
+    def test_assinatura_vira_png_de_um_bit_servido_com_cache_longo(self):
+        self.assertEqual(self.salvar(self.desenho()).status_code, 302)
+        entrega = Entrega.objects.get(encomenda=self.encomenda)
+        self.assertTrue(entrega.assinatura_imagem.name.startswith(f'assinaturas/{self.equipe.pk}/'))
+        with entrega.assinatura_imagem.open('rb') as arquivo:
+            imagem = Image.open(arquivo)
+            self.assertEqual(imagem.mode, '1')
+            self.assertLess(imagem.width, 600)  # recortada no traço
+
+        self.assertContains(self.client.get(reverse('encomenda_detail', args=[self.encomenda.pk])), entrega.url_assinatura_impressao)
+        response = self.client.get(entrega.url_assinatura_impressao)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertLessEqual(Image.open(io.BytesIO(b''.join(response.streaming_content))).width, 450)
+
+        outra = Equipe.objects.create(nome='Outra Drogaria')
+        self.client.force_login(CustomUser.objects.create_user(username='outro', password='Senha123', equipe=outra))
+        self.assertEqual(self.client.get(entrega.url_assinatura).status_code, 404)
+
+    def test_desenho_invalido_volta_com_erro(self):
+        response = self.salvar('data:image/png;base64,nao-e-imagem')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Entrega.objects.filter(encomenda=self.encomenda).exists())
+
+
+
+class ConsolidacaoComprasTests(EncomendaTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.outro_fornecedor = Fornecedor.objects.create(equipe=self.equipe, nome='Atacadista', codigo='F2')
+        self.encomendas = [
+            Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente, status=status)
+            for status in ('aprovada', 'em_andamento', 'criada')
+        ]
+        for encomenda in self.encomendas:
+            self.item(encomenda, self.produtos[0], 2)
+        self.item(self.encomendas[0], self.produtos[1], 1, self.outro_fornecedor)
+
+    def item(self, encomenda, produto, quantidade, fornecedor=None):
+        return ItemEncomenda.objects.create(
+            encomenda=encomenda, produto=produto, fornecedor=fornecedor or self.fornecedor,
+            quantidade=quantidade, preco_cotado=Decimal('5.00'),
+        )
+
+    def test_agrupa_por_fornecedor_e_produto_em_uma_consulta(self):
+        with self.assertNumQueries(1):
+            linhas = consolidar(self.equipe)
+        self.assertEqual(
+            [(l['fornecedor__nome'], l['produto__nome'], l['quantidade'], l['valor'], l['encomendas']) for l in linhas],
+            [
+                ('Atacadista', 'Produto 1', 1, Decimal('5.00'), [self.encomendas[0].pk]),
+                ('Distribuidora', 'Produto 0', 4, Decimal('20.00'), [self.encomendas[0].pk, self.encomendas[1].pk]),
+            ],
+        )
+        csv = b''.join(self.client.get(reverse('compras_consolidadas'), {'formato': 'csv'}).streaming_content).decode()
+        self.assertIn(f'Distribuidora;P0;Produto 0;4;20,00;#{self.encomendas[0].pk} #{self.encomendas[1].pk}', csv)
+
+    def test_marcar_pedidos_respeita_o_relatorio_gerado(self):
+        response = self.client.get(reverse('compras_consolidadas'), {'fornecedor': self.fornecedor.pk})
+        pagina = b''.join(response.streaming_content).decode()
+        self.assertIn('Distribuidora', pagina)
+        self.assertNotIn('Atacadista</span>', pagina)
+        itens = re.search(r'name="itens" value="([\d,]+)"', pagina).group(1)
+        tardio = self.item(self.encomendas[1], self.produtos[2], 3)  # chegou depois do relatório
+
+        self.client.post(reverse('compras_marcar_pedidos'), {'itens': itens, 'fornecedor': self.fornecedor.pk})
+
+        self.assertEqual(
+            [(l['fornecedor__nome'], l['produto__nome']) for l in consolidar(self.equipe)],
+            [('Atacadista', 'Produto 1'), ('Distribuidora', 'Produto 2')],
+        )
+        tardio.refresh_from_db()
+        self.assertIsNone(tardio.pedido_em)
+
+    def test_marcar_pedidos_ignora_encomenda_aprovada_depois_do_relatorio(self):
+        pagina = b''.join(self.client.get(reverse('compras_consolidadas')).streaming_content).decode()
+        itens = re.search(r'name="itens" value="([\d,]+)"', pagina).group(1)
+        # Item mais antigo que os do relatório, de uma encomenda aprovada depois de gerá-lo.
+        self.encomendas[2].status = 'aprovada'
+        self.encomendas[2].save()
+
+        self.client.post(reverse('compras_marcar_pedidos'), {'itens': itens})
+
+        self.assertEqual(
+            [(l['fornecedor__nome'], l['encomendas']) for l in consolidar(self.equipe)],
+            [('Distribuidora', [self.encomendas[2].pk])],
+        )
+
+
+class SessaoEmCacheTests(EncomendaTestCase):
+
+    def test_sessao_e_usuario_vem_do_cache_ate_serem_alterados(self):
+        url = reverse('api_produto_info', args=[self.produtos[0].pk])
+        self.client.get(url)
+        with self.assertNumQueries(1):  # só o produto
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.equipe.nome = 'Drogaria Renomeada'
+        self.equipe.save()
+        self.assertIsNone(cache.get(chave_usuario(self.user.pk)))
+
+        self.user.set_password('OutraSenha456')
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 302)  # sessão com a senha antiga deixa de valer
+
+    def test_update_em_lote_tira_o_usuario_do_cache(self):
+        url = reverse('api_produto_info', args=[self.produtos[0].pk])
+        self.client.get(url)
+        self.assertIsNotNone(cache.get(chave_usuario(self.user.pk)))
+
+        CustomUser.objects.filter(equipe=self.equipe).update(is_active=False)  # ação do admin
+        self.assertIsNone(cache.get(chave_usuario(self.user.pk)))
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_benchmark_nao_limpa_o_cache_do_site(self):
+        cache.set('sessao-do-site', 'ativa')
+        saida = StringIO()
+        call_command('benchmark_sessao', '--usuario', self.user.username, '--repeticoes', '1', stdout=saida)
+        self.assertIn('api_produto_info', saida.getvalue())
+        self.assertEqual(cache.get('sessao-do-site'), 'ativa')
+
+    @override_settings(CACHES=CACHE_LOCAL)
+    def test_com_cache_por_processo_o_usuario_vem_do_banco(self):
+        url = reverse('api_produto_info', args=[self.produtos[0].pk])
+        self.client.get(url)
+        with self.assertNumQueries(2):  # usuário com a equipe e produto
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIsNone(cache.get(chave_usuario(self.user.pk)))
+
+
+class ListagemEmCacheTests(EncomendaTestCase):
+
+    def test_primeira_pagina_vem_do_cache_ate_a_proxima_gravacao(self):
+        url = reverse('cliente_list')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Maria')
+
+        Cliente.objects.create(equipe=self.equipe, nome='Beatriz')
+        self.assertContains(self.client.get(url), 'Beatriz')
+        # Busca não usa o cache.
+        self.assertNotContains(self.client.get(url, {'search': 'Bea'}), 'Maria')
+
+    @override_settings(CACHES={
+        **CACHE_ARQUIVO, 'listagens': {**CACHE_LISTAGENS, 'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}},
+    })
+    def test_listagens_cheias_descartam_a_menos_usada(self):
+        calculadas = []
+
+        def obter(nome):
+            return obter_em_cache(self.equipe.pk, ('clientes',), nome, lambda: calculadas.append(nome) or nome)
+
+        for nome in ('a', 'b', 'c', 'a', 'd'):  # 'a' volta a ser usada antes de 'd' encher o cache
+            obter(nome)
+        obter('a')
+        obter('b')
+        self.assertEqual(calculadas, ['a', 'b', 'c', 'd', 'b'])
+
+    @override_settings(CACHES=CACHE_LOCAL)
+    def test_com_cache_por_processo_a_listagem_vem_do_banco(self):
+        url = reverse('cliente_list')
+        self.client.get(url)
+        # update() não invalida a geração: com o cache compartilhado a página antiga voltaria.
+        Cliente.objects.filter(pk=self.cliente.pk).update(nome='Mariana')
+        self.assertContains(self.client.get(url), 'Mariana')
+
+    def test_operacoes_sem_sinal_tambem_invalidam(self):
+        encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente)
+        url = reverse('encomenda_list')
+        self.assertContains(self.client.get(url), f'data-versao="{encomenda.versao}"')
+
+        antes = geracao(self.equipe.pk, 'encomendas')
+        self.assertTrue(encomenda.atualizar_status('pronta', encomenda.versao))  # UPDATE direto
+        self.assertNotEqual(geracao(self.equipe.pk, 'encomendas'), antes)
+        self.assertContains(self.client.get(url), f'data-versao="{encomenda.versao}"')
+
+    def test_geracao_e_por_equipe(self):
+        outra = Equipe.objects.create(nome='Outra')
+        antes = geracao(outra.pk, 'produtos')
+        Produto.objects.create(equipe=self.equipe, nome='Novo', codigo='N1', preco_base=Decimal('1.00'))
+        self.assertEqual(geracao(outra.pk, 'produtos'), antes)
+
+
+class RepetirEncomendaTests(EncomendaTestCase):
+
+    def criar_original(self, **campos):
+        encomenda = Encomenda.objects.create(equipe=self.equipe, cliente=self.cliente, status='entregue', **campos)
+        for produto in self.produtos[:2]:
+            ItemEncomenda.objects.create(
+                encomenda=encomenda, produto=produto, fornecedor=self.fornecedor, quantidade=2, preco_cotado=Decimal('10.00'),
+            )
+        return encomenda
+
+    def test_repeticao_usa_ultima_cotacao_em_consultas_fixas(self):
+        original = self.criar_original()
+        CotacaoRecente.objects.filter(produto=self.produtos[0]).update(preco=Decimal('12.50'))
+
+        with CaptureQueriesContext(connection) as uma:
+            [(nova, criada)] = repetir_encomendas([original], self.user)
+        self.assertTrue(criada)
+        self.assertEqual((nova.status, nova.responsavel_criacao_id), ('criada', self.user.pk))
+        self.assertEqual(
+            sorted(nova.itens.values_list('preco_cotado', flat=True)), [Decimal('10.00'), Decimal('12.50')],
+        )
+        self.assertEqual(nova.valor_total, Decimal('45.00'))
+
+        outras = [self.criar_original() for _ in range(3)]
+        with CaptureQueriesContext(connection) as tres:
+            repetir_encomendas(outras, self.user)
+        self.assertEqual(len(tres), len(uma))
+
+    def test_trava_a_original_antes_de_procurar_a_repeticao(self):
+        original = self.criar_original()
+        with CaptureQueriesContext(connection) as consultas:
+            repetir_encomendas([original], self.user)
+        sql = [consulta['sql'] for consulta in consultas if 'SAVEPOINT' not in consulta['sql']]
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[0])
+        self.assertIn('chave_idempotencia', sql[1])
+
+    def test_repetir_pela_tela_nao_duplica_no_mesmo_dia(self):
+        original = self.criar_original()
+        url = reverse('cliente_repetir_ultima', args=[self.cliente.pk])
+        response = self.client.post(url)
+        nova = Encomenda.objects.exclude(pk=original.pk).get()
+        self.assertRedirects(response, reverse('encomenda_detail', args=[nova.pk]))
+        self.client.post(reverse('encomenda_repetir', args=[original.pk]))
+        self.assertEqual(Encomenda.objects.count(), 2)
+
+    def test_comando_repete_recorrentes_vencidas_uma_vez(self):
+        original = self.criar_original(recorrencia_dias=30, proxima_recorrencia=date(2026, 11, 1))
+        self.criar_original(recorrencia_dias=30, proxima_recorrencia=date(2026, 11, 2))
+
+        call_command('repetir_encomendas', '--data', '2026-11-01', stdout=StringIO())
+        call_command('repetir_encomendas', '--data', '2026-11-01', stdout=StringIO())
+        nova = Encomenda.objects.get(chave_idempotencia__startswith='repeticao:')
+        self.assertEqual((nova.recorrencia_dias, nova.proxima_recorrencia), (30, date(2026, 12, 1)))
+        self.assertEqual(nova.itens.count(), 2)
+        original.refresh_from_db()
+        self.assertIsNone(original.proxima_recorrencia)
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import views, api
 
 urlpatterns = [
     # Autenticação
@@ -17,10 +17,18 @@ urlpatterns = [
     path('encomendas/<int:pk>/', views.encomenda_detail, name='encomenda_detail'),
     path('encomendas/<int:pk>/editar/', views.encomenda_edit, name='encomenda_edit'),
     path('encomendas/<int:pk>/excluir/', views.encomenda_delete, name='encomenda_delete'),
+    path('encomendas/<int:pk>/repetir/', views.encomenda_repetir, name='encomenda_repetir'),
+
+    # Entregas
+    path('entregas/manifesto/', views.manifesto_entregas, name='manifesto_entregas'),
+    path('entregas/assinaturas/<str:nome>', views.assinatura_entrega, name='assinatura_entrega'),
+    path('compras/', views.compras_consolidadas, name='compras_consolidadas'),
+    path('compras/marcar/', views.compras_marcar_pedidos, name='compras_marcar_pedidos'),
     
     # Clientes
     path('clientes/', views.cliente_list, name='cliente_list'),
     path('clientes/novo/', views.cliente_create, name='cliente_create'),
+    path('clientes/<int:pk>/repetir/', views.cliente_repetir_ultima, name='cliente_repetir_ultima'),
     
     # Produtos
     path('produtos/', views.produto_list, name='produto_list'),
@@ -32,5 +40,16 @@ urlpatterns = [
     
     # API endpoints
     path('api/produto/<int:produto_id>/', views.api_produto_info, name='api_produto_info'),
+    path('api/produto/<int:produto_id>/cotacoes/', views.api_produto_cotacoes, name='api_produto_cotacoes'),
+    path('api/clientes/buscar/', views.api_buscar_cliente, name='api_buscar_cliente'),
     path('api/encomenda/<int:encomenda_pk>/status/', views.api_update_status, name='api_update_status'),
+    path('api/encomendas/lote/', views.api_encomendas_lote, name='api_encomendas_lote'),
+    path('sw-encomendas.js', views.service_worker_encomendas, name='service_worker_encomendas'),
+
+    # Perfis de desempenho (somente equipe técnica)
+    path('perfis/', views.perfis_lista, name='perfis_lista'),
+    path('perfis/<str:nome>/', views.perfil_detalhe, name='perfil_detalhe'),
+
+    # API de leitura para integrações (ver encomendas/api.py)
+    path('api/v1/<str:recurso>/', api.listar, name='api_listar'),
 ]
\ No newline at end of file
@@ -1,16 +1,40 @@
+import csv
+import json
+import re
+import uuid
+from decimal import Decimal
+from itertools import groupby
+from statistics import median
+
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Q, Prefetch, Count
+from django.core.exceptions import ObjectDoesNotExist
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
+from django.db import IntegrityError
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from .models import Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega, Equipe
+from .models import (
+    Encomenda, Cliente, Produto, Fornecedor, ItemEncomenda, Entrega, Equipe, ConflitoDeVersao, EncomendaArquivada,
+    somente_digitos,
+)
 from .forms import (
     EncomendaForm, ItemEncomendaFormSet, EntregaForm, ClienteForm,
     ProdutoForm, FornecedorForm, CustomUserCreationForm
 )
+from .services import salvar_encomenda, diferencas_encomenda, criar_encomendas_em_lote, repetir_encomendas
+from .paginacao import PaginadorEstimado
+from .perfilamento import listar_perfis, carregar_perfil
+from .assinaturas import gerar_miniatura
+from .compras import consolidar, marcar_pedidos
+from . import cache_equipe
 
 # --- Autenticação e Gestão de Equipe ---
 
@@ -48,25 +72,21 @@ def dashboard(request):
         return render(request, 'encomendas/dashboard_sem_equipe.html')
 
     encomendas = Encomenda.objects.filter(equipe=equipe)
+    arquivadas = EncomendaArquivada.objects.filter(equipe=equipe).aggregate(
+        total=Count('pk'), entregues=Count('pk', filter=Q(status='entregue'))
+    )
     context = {
-        'total_encomendas': encomendas.count(),
+        'total_encomendas': encomendas.count() + arquivadas['total'],
         'encomendas_pendentes': encomendas.exclude(status__in=['entregue', 'cancelada']).count(),
-        'encomendas_entregues': encomendas.filter(status='entregue').count(),
+        'encomendas_entregues': encomendas.filter(status='entregue').count() + arquivadas['entregues'],
         'ultimas_encomendas': encomendas.select_related('cliente').order_by('-data_encomenda')[:5],
     }
     return render(request, 'encomendas/dashboard.html', context)
 
 # --- CRUD de Encomendas ---
 
-@login_required
-def encomenda_list(request):
-    """Lista todas as encomendas da equipe."""
-    encomendas = Encomenda.objects.filter(equipe=request.user.equipe).select_related('cliente', 'responsavel_criacao').order_by('-numero_encomenda')
-    
-    status_filter = request.GET.get('status')
-    cliente_filter = request.GET.get('cliente')
-    search = request.GET.get('search')
-    
+def _filtrar_encomendas(encomendas, status_filter, cliente_filter, search):
+    """Aplica os filtros da lista; serve tanto para Encomenda quanto para EncomendaArquivada."""
     if status_filter:
         encomendas = encomendas.filter(status=status_filter)
     if cliente_filter:
@@ -77,13 +97,69 @@ def encomenda_list(request):
             Q(cliente__nome__icontains=search) |
             Q(itens__produto__nome__icontains=search)
         ).distinct()
+    return encomendas
+
+def _pagina_da_lista(request, itens, familias, nome, cacheavel=True):
+    """
+    Página pedida da listagem. A primeira página sem filtros vem do cache por geração
+    (encomendas/cache_equipe.py); nesse caso também devolve a geração, que o template
+    usa como chave do fragmento da tabela.
+    """
+    paginator = PaginadorEstimado(itens, 20)
+    equipe_id = request.user.equipe_id
+    if cacheavel and equipe_id and request.GET.get('page', '1') == '1':
+        return cache_equipe.pagina_inicial(paginator, equipe_id, familias, nome)
+    return paginator.get_page(request.GET.get('page')), None
 
-    paginator = Paginator(encomendas, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
+@login_required
+def encomenda_list(request):
+    """Lista todas as encomendas da equipe."""
+    status_filter = request.GET.get('status')
+    cliente_filter = request.GET.get('cliente')
+    search = request.GET.get('search')
     
+    encomendas = _filtrar_encomendas(
+        Encomenda.objects.filter(equipe=request.user.equipe).select_related('cliente', 'responsavel_criacao').order_by('-numero_encomenda'),
+        status_filter, cliente_filter, search,
+    )
+    page_obj, geracao = _pagina_da_lista(
+        request, encomendas, ('encomendas', 'clientes'), 'encomendas',
+        cacheavel=not (status_filter or cliente_filter or search),
+    )
+
+    # Com filtros, o arquivo também é consultado: mostrado direto quando não há ativas
+    # (ou com ?arquivo=1), senão oferecido por um link.
+    arquivo, tem_arquivadas, tem_ativas = False, False, bool(page_obj.paginator.count)
+    parametros = request.GET.copy()
+    parametros.pop('page', None)
+    parametros.pop('arquivo', None)
+    url_ativas = parametros.urlencode()
+    parametros['arquivo'] = '1'
+    if status_filter or cliente_filter or search:
+        arquivadas = _filtrar_encomendas(
+            EncomendaArquivada.objects.filter(equipe=request.user.equipe).select_related('cliente').order_by('-numero_encomenda'),
+            status_filter, cliente_filter, search,
+        )
+        if request.GET.get('arquivo') == '1' or not tem_ativas:
+            paginator = PaginadorEstimado(arquivadas, 20)
+            page_obj = paginator.get_page(request.GET.get('page'))
+            arquivo = True
+        else:
+            tem_arquivadas = arquivadas.exists()
+
     context = {
         'page_obj': page_obj,
-        'clientes': Cliente.objects.filter(equipe=request.user.equipe),
+        'arquivo': arquivo,
+        'tem_ativas': tem_ativas,
+        'tem_arquivadas': tem_arquivadas,
+        'url_ativas': url_ativas,
+        'url_arquivo': parametros.urlencode(),
+        'geracao': geracao,
+        'tempo_cache': cache_equipe.TEMPO_CACHE,
+        'clientes': cache_equipe.obter(
+            request.user.equipe_id, ('clientes',), 'clientes_filtro',
+            lambda: list(Cliente.objects.filter(equipe=request.user.equipe).only('pk', 'nome')),
+        ) if request.user.equipe_id else [],
         'status_choices': Encomenda.STATUS_CHOICES,
         'current_status': status_filter,
         'current_cliente': int(cliente_filter) if cliente_filter else None,
@@ -93,49 +169,75 @@ def encomenda_list(request):
 
 @login_required
 def encomenda_detail(request, pk):
-    encomenda = get_object_or_404(Encomenda, pk=pk, equipe=request.user.equipe)
+    encomenda = Encomenda.objects.filter(pk=pk, equipe=request.user.equipe).first()
+    arquivada = encomenda is None
+    if arquivada:
+        encomenda = get_object_or_404(EncomendaArquivada, pk=pk, equipe=request.user.equipe)
     itens = encomenda.itens.select_related('produto', 'fornecedor').all()
     try:
         entrega = encomenda.entrega
-    except Entrega.DoesNotExist:
+    except ObjectDoesNotExist:
         entrega = None
     
-    context = {'encomenda': encomenda, 'itens': itens, 'entrega': entrega}
+    context = {'encomenda': encomenda, 'itens': itens, 'entrega': entrega, 'arquivada': arquivada}
     return render(request, 'encomendas/encomenda_detail.html', context)
 
+def _ja_registrada(request, chave):
+    """Redireciona para a encomenda já gravada com esta chave de idempotência, se houver."""
+    existente = Encomenda.objects.filter(equipe=request.user.equipe, chave_idempotencia=chave).first()
+    if existente is None:
+        return None
+    messages.info(request, f'Encomenda #{existente.numero_encomenda} já havia sido registrada.')
+    return redirect('encomenda_detail', pk=existente.pk)
+
 @login_required
 def encomenda_create(request):
     if request.method == 'POST':
+        # Reenvio do mesmo formulário (timeout, duplo clique): mostra a encomenda já gravada.
+        chave = request.POST.get('chave_idempotencia', '')[:64]
+        existente = chave and _ja_registrada(request, chave)
+        if existente:
+            return existente
+
         form = EncomendaForm(request.user, request.POST)
+        form.fields.pop('status')
         formset = ItemEncomendaFormSet(request.POST, form_kwargs={'user': request.user})
         
         if form.is_valid() and formset.is_valid():
-            encomenda = form.save(commit=False)
-            encomenda.equipe = request.user.equipe
-            encomenda.responsavel_criacao = request.user
-            encomenda.status = 'criada'
-            encomenda.save()
-            
-            formset.instance = encomenda
-            formset.save()
-            
-            encomenda.calcular_valor_total()
+            form.instance.equipe = request.user.equipe
+            form.instance.responsavel_criacao = request.user
+            form.instance.status = 'criada'
+            form.instance.chave_idempotencia = chave or None
+            try:
+                encomenda = salvar_encomenda(form, formset)
+            except IntegrityError:
+                # Envio concorrente com a mesma chave (service worker e clique) gravou primeiro.
+                existente = chave and _ja_registrada(request, chave)
+                if not existente:
+                    raise
+                return existente
             messages.success(request, f'Encomenda #{encomenda.numero_encomenda} criada com sucesso!')
             return redirect('encomenda_detail', pk=encomenda.pk)
         else:
             messages.error(request, 'Por favor, corrija os erros abaixo.')
     else:
-        form = EncomendaForm(user=request.user)
+        form = EncomendaForm(user=request.user, initial={'chave_idempotencia': uuid.uuid4().hex})
         if 'status' in form.fields:
             form.fields.pop('status')
         formset = ItemEncomendaFormSet(form_kwargs={'user': request.user})
     
-    return render(request, 'encomendas/encomenda_form.html', {'form': form, 'formset': formset, 'title': 'Nova Encomenda'})
+    return render(request, 'encomendas/encomenda_form.html', {
+        'form': form, 'formset': formset, 'title': 'Nova Encomenda', 'fila_offline': True,
+    })
 
 @login_required
 def encomenda_edit(request, pk):
     encomenda = get_object_or_404(Encomenda, pk=pk, equipe=request.user.equipe)
-    entrega, created = Entrega.objects.get_or_create(encomenda=encomenda)
+    try:
+        entrega = encomenda.entrega
+    except Entrega.DoesNotExist:
+        entrega = None  # criada apenas se o formulário de entrega for preenchido
+    conflito = None
 
     if request.method == 'POST':
         form = EncomendaForm(request.user, request.POST, instance=encomenda)
@@ -143,13 +245,19 @@ def encomenda_edit(request, pk):
         formset = ItemEncomendaFormSet(request.POST, instance=encomenda, form_kwargs={'user': request.user})
         
         if form.is_valid() and formset.is_valid() and entrega_form.is_valid():
-            form.save()
-            entrega_form.save()
-            formset.save()
-            
-            encomenda.calcular_valor_total()
-            messages.success(request, f'Encomenda #{encomenda.numero_encomenda} atualizada com sucesso!')
-            return redirect('encomenda_detail', pk=encomenda.pk)
+            try:
+                salvar_encomenda(form, formset, entrega_form)
+            except ConflitoDeVersao:
+                # Outra pessoa gravou antes: mostra o que mudou e reabre o formulário já na versão atual.
+                atual = Encomenda.objects.get(pk=encomenda.pk)
+                conflito = diferencas_encomenda(form, formset, atual)
+                dados = request.POST.copy()
+                dados['versao'] = atual.versao
+                form = EncomendaForm(request.user, dados, instance=atual)
+                messages.error(request, 'Esta encomenda foi alterada por outra pessoa enquanto você editava. Confira as diferenças e salve novamente.')
+            else:
+                messages.success(request, f'Encomenda #{encomenda.numero_encomenda} atualizada com sucesso!')
+                return redirect('encomenda_detail', pk=encomenda.pk)
         else:
             messages.error(request, 'Por favor, corrija os erros abaixo.')
     else:
@@ -162,6 +270,7 @@ def encomenda_edit(request, pk):
         'formset': formset, 
         'entrega_form': entrega_form,
         'encomenda': encomenda,
+        'conflito': conflito,
         'title': f'Editar Encomenda #{encomenda.numero_encomenda}'
     }
     return render(request, 'encomendas/encomenda_form.html', context)
@@ -176,19 +285,191 @@ def encomenda_delete(request, pk):
         return redirect('encomenda_list')
     return render(request, 'encomendas/encomenda_confirm_delete.html', {'encomenda': encomenda})
 
+@login_required
+@require_http_methods(["POST"])
+def encomenda_repetir(request, pk):
+    """Nova encomenda com os mesmos itens, nos preços das últimas cotações."""
+    return _repetir(request, get_object_or_404(Encomenda, pk=pk, equipe=request.user.equipe))
+
+@login_required
+@require_http_methods(["POST"])
+def cliente_repetir_ultima(request, pk):
+    """Repete a última encomenda (não cancelada) do cliente."""
+    cliente = get_object_or_404(Cliente, pk=pk, equipe=request.user.equipe)
+    original = cliente.encomenda_set.exclude(status='cancelada').order_by('-numero_encomenda').first()
+    if original is None:
+        messages.warning(request, f'{cliente.nome} ainda não tem encomendas para repetir.')
+        return redirect('cliente_list')
+    return _repetir(request, original)
+
+def _repetir(request, original):
+    [(encomenda, criada)] = repetir_encomendas([original], request.user)
+    if criada:
+        messages.success(
+            request, f'Encomenda #{encomenda.numero_encomenda} criada a partir da #{original.numero_encomenda}, '
+                     'com os preços das últimas cotações.'
+        )
+    else:
+        messages.info(request, f'A encomenda #{original.numero_encomenda} já foi repetida hoje (#{encomenda.numero_encomenda}).')
+    return redirect('encomenda_detail', pk=encomenda.numero_encomenda)
+
+# --- Manifesto de Entregas ---
+
+@login_required
+def manifesto_entregas(request):
+    """Manifesto do dia: todas as encomendas prontas para a data, agrupadas por bairro e rua."""
+    try:
+        data = parse_date(request.GET.get('data') or '')
+    except ValueError:
+        data = None
+    data = data or timezone.localdate()
+
+    # Duas consultas no total (encomendas com cliente/entrega e itens), qualquer que seja o número de paradas.
+    paradas = list(
+        Encomenda.objects.filter(equipe=request.user.equipe, status='pronta', data_prevista_entrega=data)
+        .select_related('cliente', 'entrega', 'responsavel_criacao')
+        .prefetch_related(Prefetch('itens', queryset=ItemEncomenda.objects.select_related('produto', 'fornecedor')))
+        .order_by('cliente__bairro', 'cliente__rua', 'cliente__numero', 'numero_encomenda')
+    )
+    response = StreamingHttpResponse(_renderizar_manifesto(data, paradas), content_type='text/html; charset=utf-8')
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def _renderizar_manifesto(data, paradas):
+    """Gera o documento em partes (cabeçalho, um bloco por bairro, rodapé) para ser enviado aos poucos."""
+    contexto = {'data': data, 'total_paradas': len(paradas)}
+    yield get_template('encomendas/manifesto_inicio.html').render(contexto)
+
+    bloco_bairro = get_template('encomendas/manifesto_bairro.html')
+    ordem = 0
+    for bairro, grupo in groupby(paradas, key=lambda encomenda: encomenda.cliente.bairro):
+        itens_bairro = []
+        for encomenda in grupo:
+            ordem += 1
+            try:
+                entrega = encomenda.entrega
+            except Entrega.DoesNotExist:
+                entrega = None
+            itens_bairro.append({
+                'ordem': ordem,
+                'encomenda': encomenda,
+                'entrega': entrega,
+                'valor_restante': encomenda.valor_total - encomenda.valor_pago_adiantamento,
+            })
+        yield bloco_bairro.render({'bairro': bairro, 'paradas': itens_bairro})
+
+    yield get_template('encomendas/manifesto_fim.html').render(contexto)
+
+@login_required
+def assinatura_entrega(request, nome):
+    """
+    Assinatura capturada (ou sua miniatura de impressão), só da pasta da equipe do usuário.
+    O nome é o hash do conteúdo, então a resposta pode ficar em cache indefinidamente.
+    """
+    if not re.fullmatch(r'[0-9a-f]{24}(-impressao)?\.png', nome):
+        raise Http404
+    caminho = f'assinaturas/{request.user.equipe_id}/{nome}'
+    if nome.endswith('-impressao.png') and not default_storage.exists(caminho):
+        original = caminho.replace('-impressao', '')
+        if not default_storage.exists(original):
+            raise Http404
+        gerar_miniatura(original)  # a thread de miniaturas ainda não passou por esta
+    try:
+        arquivo = default_storage.open(caminho, 'rb')
+    except FileNotFoundError:
+        raise Http404
+    response = FileResponse(arquivo, content_type='image/png')
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+# --- Consolidação de Compras ---
+
+@login_required
+def compras_consolidadas(request):
+    """Itens a pedir das encomendas em aberto, somados por fornecedor e produto (impressão ou CSV)."""
+    fornecedor = request.GET.get('fornecedor', '')
+    fornecedor_id = int(fornecedor) if fornecedor.isdigit() else None
+    linhas = consolidar(request.user.equipe, fornecedor_id)
+
+    if request.GET.get('formato') == 'csv':
+        response = StreamingHttpResponse(_compras_csv(linhas), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="compras-{timezone.localdate():%Y-%m-%d}.csv"'
+        return response
+
+    contexto = {
+        'data': timezone.localdate(),
+        'fornecedores': Fornecedor.objects.filter(equipe=request.user.equipe).order_by('nome').values('id', 'nome'),
+        'fornecedor_id': fornecedor_id,
+        'total_linhas': len(linhas),
+        'itens': ','.join(str(pk) for linha in linhas for pk in linha['itens']),
+        'valor_total': sum(linha['valor'] for linha in linhas),
+    }
+    response = StreamingHttpResponse(_renderizar_compras(request, contexto, linhas), content_type='text/html; charset=utf-8')
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def _renderizar_compras(request, contexto, linhas):
+    """Cabeçalho, um bloco por fornecedor e rodapé, enviados aos poucos como no manifesto."""
+    yield get_template('encomendas/compras_inicio.html').render(contexto, request)
+    bloco_fornecedor = get_template('encomendas/compras_fornecedor.html')
+    for (_, nome), grupo in groupby(linhas, key=lambda linha: (linha['fornecedor_id'], linha['fornecedor__nome'])):
+        grupo = list(grupo)
+        yield bloco_fornecedor.render({
+            'fornecedor': nome, 'linhas': grupo, 'valor_total': sum(linha['valor'] for linha in grupo),
+        })
+    yield get_template('encomendas/compras_fim.html').render(contexto)
+
+class _Eco:
+    """Arquivo falso para o csv.writer: devolve a linha em vez de guardá-la."""
+    def write(self, valor):
+        return valor
+
+def _compras_csv(linhas):
+    escritor = csv.writer(_Eco(), delimiter=';')
+    yield '\ufeff'  # BOM: o Excel abre o arquivo como UTF-8
+    yield escritor.writerow(['Fornecedor', 'Código', 'Produto', 'Quantidade', 'Valor Cotado', 'Encomendas'])
+    for linha in linhas:
+        yield escritor.writerow([
+            linha['fornecedor__nome'], linha['produto__codigo'], linha['produto__nome'], linha['quantidade'],
+            f"{linha['valor']:.2f}".replace('.', ','), ' '.join(f'#{numero}' for numero in linha['encomendas']),
+        ])
+
+@login_required
+@require_http_methods(["POST"])
+def compras_marcar_pedidos(request):
+    fornecedor = request.POST.get('fornecedor', '')
+    fornecedor_id = int(fornecedor) if fornecedor.isdigit() else None
+    itens = request.POST.get('itens', '').split(',')
+    if all(pk.isdigit() for pk in itens):
+        total = marcar_pedidos(request.user.equipe, [int(pk) for pk in itens], fornecedor_id)
+        messages.success(request, f'{total} item(ns) marcado(s) como pedido(s) ao fornecedor.')
+    url = reverse('compras_consolidadas')
+    return redirect(f'{url}?fornecedor={fornecedor_id}' if fornecedor_id else url)
+
 # --- CRUD de Clientes, Produtos, Fornecedores ---
 
 @login_required
 def cliente_list(request):
-    clientes = Cliente.objects.filter(equipe=request.user.equipe).order_by('nome')
-    paginator = Paginator(clientes, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    return render(request, 'encomendas/cliente_list.html', {'page_obj': page_obj})
+    search = request.GET.get('search', '').strip()
+    clientes = _buscar_clientes(Cliente.objects.filter(equipe=request.user.equipe), search).order_by('nome')
+    page_obj, geracao = _pagina_da_lista(request, clientes, ('clientes', 'encomendas'), 'clientes', cacheavel=not search)
+    return render(request, 'encomendas/cliente_list.html', {
+        'page_obj': page_obj, 'current_search': search, 'geracao': geracao, 'tempo_cache': cache_equipe.TEMPO_CACHE,
+    })
+
+def _buscar_clientes(clientes, termo):
+    """CPF/telefone (com ou sem máscara) pela coluna normalizada; texto pelo início do nome."""
+    if not termo:
+        return clientes
+    digitos = somente_digitos(termo)
+    if digitos and not re.search(r'[^\d\s().\-/+]', termo):
+        return clientes.filter(Q(cpf_normalizado=digitos) | Q(telefone_normalizado=digitos))
+    return clientes.filter(nome__istartswith=termo)
 
 @login_required
 def cliente_create(request):
     if request.method == 'POST':
-        form = ClienteForm(request.POST)
+        form = ClienteForm(request.POST, equipe=request.user.equipe)
         if form.is_valid():
             cliente = form.save(commit=False)
             cliente.equipe = request.user.equipe
@@ -196,15 +477,16 @@ def cliente_create(request):
             messages.success(request, f'Cliente {cliente.nome} criado com sucesso!')
             return redirect('cliente_list')
     else:
-        form = ClienteForm()
+        form = ClienteForm(equipe=request.user.equipe)
     return render(request, 'encomendas/cliente_form.html', {'form': form, 'title': 'Novo Cliente'})
 
 @login_required
 def produto_list(request):
     produtos = Produto.objects.filter(equipe=request.user.equipe).order_by('nome')
-    paginator = Paginator(produtos, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    return render(request, 'encomendas/produto_list.html', {'page_obj': page_obj})
+    page_obj, geracao = _pagina_da_lista(request, produtos, ('produtos', 'encomendas'), 'produtos')
+    return render(request, 'encomendas/produto_list.html', {
+        'page_obj': page_obj, 'geracao': geracao, 'tempo_cache': cache_equipe.TEMPO_CACHE,
+    })
 
 @login_required
 def produto_create(request):
@@ -223,9 +505,10 @@ def produto_create(request):
 @login_required
 def fornecedor_list(request):
     fornecedores = Fornecedor.objects.filter(equipe=request.user.equipe).order_by('nome')
-    paginator = Paginator(fornecedores, 20)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    return render(request, 'encomendas/fornecedor_list.html', {'page_obj': page_obj})
+    page_obj, geracao = _pagina_da_lista(request, fornecedores, ('fornecedores', 'encomendas'), 'fornecedores')
+    return render(request, 'encomendas/fornecedor_list.html', {
+        'page_obj': page_obj, 'geracao': geracao, 'tempo_cache': cache_equipe.TEMPO_CACHE,
+    })
 
 @login_required
 def fornecedor_create(request):
@@ -249,15 +532,150 @@ def fornecedor_create(request):
 def api_update_status(request, encomenda_pk):
     encomenda = get_object_or_404(Encomenda, pk=encomenda_pk, equipe=request.user.equipe)
     new_status = request.POST.get('status')
-    if new_status in dict(Encomenda.STATUS_CHOICES):
-        encomenda.status = new_status
-        encomenda.save()
-        return JsonResponse({'success': True, 'status': encomenda.get_status_display()})
-    return JsonResponse({'error': 'Status inválido'}, status=400)
+    if new_status not in dict(Encomenda.STATUS_CHOICES):
+        return JsonResponse({'error': 'Status inválido'}, status=400)
+
+    versao = request.POST.get('versao', '')
+    if not versao.isdigit():
+        return JsonResponse({'error': 'Versão da encomenda ausente ou inválida. Recarregue a página.'}, status=400)
+    if encomenda.atualizar_status(new_status, int(versao)):
+        return JsonResponse({'success': True, 'status': encomenda.get_status_display(), 'versao': encomenda.versao})
+
+    encomenda.refresh_from_db()
+    return JsonResponse({
+        'error': 'A encomenda foi alterada por outra pessoa. Recarregue antes de alterar o status.',
+        'conflito': [{
+            'campo': 'Status',
+            'sua': dict(Encomenda.STATUS_CHOICES)[new_status],
+            'atual': encomenda.get_status_display(),
+        }],
+        'status': encomenda.status,
+        'versao': encomenda.versao,
+    }, status=409)
+
+LOTE_MAXIMO = 100
+
+@login_required
+@require_http_methods(["POST"])
+def api_encomendas_lote(request):
+    """
+    Recebe um lote de encomendas em JSON (fila offline do formulário) e cria todas em
+    uma transação. Reenviar o mesmo lote devolve as encomendas já gravadas.
+    """
+    try:
+        pedidos = json.loads(request.body)['encomendas']
+    except (ValueError, KeyError, TypeError):
+        pedidos = None
+    if (not isinstance(pedidos, list) or not all(isinstance(pedido, dict) for pedido in pedidos)
+            or not all(isinstance(pedido.get('itens', []), list) for pedido in pedidos)
+            or not all(isinstance(item, dict) for pedido in pedidos for item in pedido.get('itens', []))):
+        return JsonResponse({'error': 'Formato inválido: esperado {"encomendas": [...]}'}, status=400)
+    if len(pedidos) > LOTE_MAXIMO:
+        return JsonResponse({'error': f'Envie no máximo {LOTE_MAXIMO} encomendas por lote'}, status=400)
+
+    try:
+        resultados, erros = criar_encomendas_em_lote(request.user.equipe, request.user, pedidos)
+    except IntegrityError:
+        # Outro envio com as mesmas chaves gravou primeiro; repetir devolve as encomendas existentes.
+        return JsonResponse({'error': 'Lote enviado em paralelo; tente novamente'}, status=409)
+    for resultado in resultados:
+        resultado['url'] = reverse('encomenda_detail', args=[resultado['numero']])
+    return JsonResponse({'encomendas': resultados, 'erros': erros})
+
+@login_required
+def service_worker_encomendas(request):
+    """Service worker da fila offline, servido na raiz para controlar todas as páginas."""
+    response = render(request, 'encomendas/sw_encomendas.js', content_type='application/javascript')
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 @login_required
 @require_http_methods(["GET"])
 def api_produto_info(request, produto_id):
     produto = get_object_or_404(Produto, id=produto_id, equipe=request.user.equipe)
     data = {'nome': produto.nome, 'codigo': produto.codigo, 'preco_base': str(produto.preco_base)}
-    return JsonResponse(data)
\ No newline at end of file
+    return JsonResponse(data)
+
+@login_required
+@require_http_methods(["GET"])
+def api_produto_cotacoes(request, produto_id):
+    """Matriz de cotações do produto (último preço e média por fornecedor), mais recente primeiro."""
+    produto = get_object_or_404(Produto, id=produto_id, equipe=request.user.equipe)
+    cotacoes = produto.cotacoes.filter(equipe=request.user.equipe).select_related('fornecedor').order_by('-data')
+    return JsonResponse({
+        'produto': produto.nome,
+        'preco_base': str(produto.preco_base),
+        'cotacoes': [
+            {
+                'fornecedor_id': cotacao.fornecedor_id,
+                'fornecedor': cotacao.fornecedor.nome,
+                'preco': str(cotacao.preco),
+                'data': cotacao.data.isoformat(),
+                'preco_medio': str(cotacao.preco_medio.quantize(Decimal('0.01'))),
+                'total_cotacoes': cotacao.total_cotacoes,
+            }
+            for cotacao in cotacoes
+        ],
+    })
+
+@login_required
+@require_http_methods(["GET"])
+def api_buscar_cliente(request):
+    """Identificação no balcão: clientes pelo CPF/telefone (ou nome) com as últimas encomendas em aberto."""
+    termo = request.GET.get('q', '').strip()
+    if not termo:
+        return JsonResponse({'clientes': []})
+    abertas = Encomenda.objects.exclude(status__in=['entregue', 'cancelada']).order_by('-data_encomenda')
+    clientes = _buscar_clientes(Cliente.objects.filter(equipe=request.user.equipe), termo).prefetch_related(
+        Prefetch('encomenda_set', queryset=abertas[:5], to_attr='encomendas_abertas')
+    )[:10]
+    return JsonResponse({'clientes': [
+        {
+            'id': cliente.pk,
+            'nome': cliente.nome,
+            'cpf': cliente.cpf,
+            'telefone': cliente.telefone,
+            'bairro': cliente.bairro,
+            'encomendas_abertas': [
+                {
+                    'numero': encomenda.numero_encomenda,
+                    'status': encomenda.get_status_display(),
+                    'data': encomenda.data_encomenda.isoformat(),
+                    'valor_total': str(encomenda.valor_total),
+                    'url': reverse('encomenda_detail', args=[encomenda.pk]),
+                }
+                for encomenda in cliente.encomendas_abertas
+            ],
+        }
+        for cliente in clientes
+    ]})
+
+# --- Perfis de desempenho (equipe técnica) ---
+
+@staff_member_required
+def perfis_lista(request):
+    perfis = listar_perfis()
+    rotas = {}
+    for perfil in perfis:
+        rotas.setdefault(perfil['rota'], []).append(perfil['duracao_ms'])
+    resumo_rotas = sorted(
+        (
+            {'rota': rota, 'quantidade': len(duracoes), 'mediana_ms': median(duracoes), 'maxima_ms': max(duracoes)}
+            for rota, duracoes in rotas.items()
+        ),
+        key=lambda linha: linha['maxima_ms'], reverse=True,
+    )
+    rota = request.GET.get('rota')
+    if rota:
+        perfis = [perfil for perfil in perfis if perfil['rota'] == rota]
+    mais_lentos = sorted(perfis, key=lambda perfil: perfil['duracao_ms'], reverse=True)[:50]
+    return render(request, 'encomendas/perfis.html', {
+        'rotas': resumo_rotas, 'perfis': mais_lentos, 'rota_atual': rota,
+    })
+
+@staff_member_required
+def perfil_detalhe(request, nome):
+    perfil = carregar_perfil(nome)
+    if perfil is None:
+        raise Http404('Perfil não encontrado (talvez já removido pela rotação).')
+    return render(request, 'encomendas/perfil_detalhe.html', {'perfil': perfil})
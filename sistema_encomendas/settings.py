@@ -46,6 +46,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'encomendas.middleware.PerfilamentoMiddleware',
+    'encomendas.middleware.ConsultasLentasMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -138,6 +140,11 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Arquivos enviados (assinaturas de entrega). Não são publicados em MEDIA_URL: a view
+# assinatura_entrega serve cada arquivo só para a equipe dona.
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_URL = 'media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -146,9 +153,102 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Adicione estas linhas no final do arquivo
 
+# Sessões e cache. SESSAO_PERFIL:
+#   'db'              uma leitura de django_session por requisição (padrão do Django);
+#   'cached_db'       lê do cache e só vai ao banco quando a sessão não está nele;
+#   'signed_cookies'  sessão inteira no cookie assinado, sem banco nem cache. O logout
+#                     só apaga o cookie deste navegador; uma cópia antiga continua válida
+#                     até expirar (SESSION_COOKIE_AGE).
+# CACHE_PERFIL: 'arquivo' (compartilhado pelos processos da mesma máquina, como os
+# workers do gunicorn) ou 'locmem' (por processo). Compare com `benchmark_sessao`.
+# O mesmo cache guarda o usuário da sessão e os contadores de geração das listagens
+# (encomendas/autenticacao.py, encomendas/cache_equipe.py). Com o locmem a invalidação
+# só alcançaria o processo que gravou: as sessões ficam no banco ('cached_db' vira 'db')
+# e o usuário e as listagens deixam de vir do cache. Com o MAX_ENTRIES cheio, o cache em
+# arquivo descarta uma fração aleatória das entradas (não é LRU); por isso as páginas e
+# os fragmentos das listagens ficam no cache 'listagens', em memória de cada processo,
+# que descarta as menos usadas (LRU).
+SESSAO_PERFIL = 'cached_db'
+CACHE_PERFIL = 'arquivo'
+
+if CACHE_PERFIL == 'locmem' and SESSAO_PERFIL == 'cached_db':
+    SESSAO_PERFIL = 'db'
+
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[SESSAO_PERFIL]
+
+CACHES = {
+    'default': {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'encomendas',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+        'arquivo': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+    }[CACHE_PERFIL],
+    'listagens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'listagens',
+        'OPTIONS': {'MAX_ENTRIES': 2000},
+    },
+}
+
+# O usuário da sessão vem do cache compartilhado (encomendas/autenticacao.py). O ModelBackend fica na
+# lista para que sessões abertas antes da troca continuem válidas até o próximo login.
+AUTHENTICATION_BACKENDS = [
+    'encomendas.autenticacao.BackendComCache',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 
 # Adicione esta linha no final do arquivo
-AUTH_USER_MODEL = 'encomendas.CustomUser'
\ No newline at end of file
+AUTH_USER_MODEL = 'encomendas.CustomUser'
+
+# Perfilamento de requisições (encomendas/perfilamento.py). Com ATIVO = False o
+# middleware nem entra na cadeia. Perfis visíveis para a equipe técnica em /perfis/.
+PERFILAMENTO = {
+    'ATIVO': False,
+    'AMOSTRA': 0.01,         # fração das requisições perfiladas com cProfile
+    'LIMIAR_MS': 1000,       # requisições mais lentas que isso são sempre guardadas
+    'INTERVALO_MS': 5,       # intervalo do amostrador de pilha
+    'DIRETORIO': BASE_DIR / 'perfis',
+    'MAX_ARQUIVOS': 500,
+}
+
+# Registro de consultas lentas (encomendas/consultas_lentas.py); resumo com
+# `python manage.py consultas_lentas`.
+CONSULTAS_LENTAS = {
+    'ATIVO': False,
+    'LIMIAR_MS': 200,
+    'AMOSTRA_EXPLAIN': 0.1,  # fração dos SELECTs lentos repetidos com EXPLAIN (ANALYZE, BUFFERS)
+    'ARQUIVO': BASE_DIR / 'consultas_lentas.jsonl',
+    'MAX_BYTES': 20 * 1024 * 1024,
+}
+
+# E-mail dos avisos aos clientes. Em desenvolvimento, um servidor de depuração local:
+# python -m aiosmtpd -n -l localhost:1025
+EMAIL_HOST = 'localhost'
+EMAIL_PORT = 1025
+DEFAULT_FROM_EMAIL = 'Drogaria Benfica <nao-responda@localhost>'
+
+# Fila de avisos de encomenda pronta (encomendas/notificacoes.py), enviada pelo
+# comando `enviar_notificacoes` (cron ou --continuo).
+NOTIFICACOES = {
+    'BACKENDS': {
+        'email': 'encomendas.notificacoes.BackendEmail',
+        'sms': 'encomendas.notificacoes.BackendArquivo',  # sem provedor de SMS: grava em ARQUIVO
+    },
+    'ARQUIVO': BASE_DIR / 'notificacoes_enviadas.jsonl',
+    'POR_MINUTO': {'email': 60, 'sms': 20},
+    'MAX_TENTATIVAS': 5,
+}
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do sistema de encomendas contra um servidor local (só biblioteca padrão).
+
+Cada usuário virtual faz login pela tela de login e repete jornadas sorteadas por peso,
+como no balcão: dashboard, lista, busca, detalhe, criação de encomenda com N itens e
+troca de status pela API. No fim mostra, por etapa, vazão, histograma de latência e
+taxa de erro. Com --rampa a concorrência sobe em degraus para achar o ponto de saturação.
+
+Exemplos:
+    python manage.py runserver --noreload       (ou gunicorn, em outro terminal)
+    python teste_carga.py --usuario joao.farma --senha Password123 --usuarios 10 --duracao 60
+    python teste_carga.py --usuario joao.farma --senha Password123 --rampa 5,10,20,40 --duracao 30
+    python teste_carga.py ... --pesos dashboard=1,lista=5,criar=2 --itens 5
+
+Cada usuário virtual abre sua própria sessão, mas todos usam a conta informada.
+As encomendas criadas ficam no banco; rode contra uma base de teste.
+"""
+import argparse
+import asyncio
+import bisect
+import http.cookiejar
+import json
+import random
+import re
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+FAIXAS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+PESOS_PADRAO = {'dashboard': 20, 'lista': 25, 'busca': 15, 'detalhe': 20, 'criar': 10, 'status': 10}
+STATUS = ['criada', 'cotacao', 'aprovada', 'em_andamento', 'pronta']
+
+
+class Estatisticas:
+    """Latências e resultados de uma etapa, por passo da jornada."""
+
+    def __init__(self, usuarios):
+        self.usuarios = usuarios
+        self.inicio = time.perf_counter()
+        self.fim = None
+        self.latencias = defaultdict(list)
+        self.erros = defaultdict(int)
+        self.conflitos = defaultdict(int)
+
+    def registrar(self, passo, ms, resultado):
+        self.latencias[passo].append(ms)
+        if resultado == 'erro':
+            self.erros[passo] += 1
+        elif resultado == 'conflito':
+            self.conflitos[passo] += 1
+
+    @property
+    def duracao(self):
+        return (self.fim or time.perf_counter()) - self.inicio
+
+    def total(self):
+        return sum(len(valores) for valores in self.latencias.values())
+
+    def percentil(self, valores, p):
+        ordenados = sorted(valores)
+        return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p))] if ordenados else 0
+
+
+class Cliente:
+    """Um usuário virtual: sessão própria (cookies) e as requisições da jornada."""
+
+    def __init__(self, base, timeout):
+        self.base = base.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def requisitar(self, caminho, dados=None, cabecalhos=None):
+        """Retorna (status, url final, corpo). Erros HTTP viram status, não exceção."""
+        corpo = urllib.parse.urlencode(dados, doseq=True).encode() if dados is not None else None
+        pedido = urllib.request.Request(self.base + caminho, data=corpo, headers={
+            'Referer': self.base + caminho, **(cabecalhos or {}),
+        })
+        try:
+            with self.opener.open(pedido, timeout=self.timeout) as resposta:
+                return resposta.status, resposta.geturl(), resposta.read().decode('utf-8', 'replace')
+        except urllib.error.HTTPError as erro:
+            return erro.code, erro.geturl(), erro.read().decode('utf-8', 'replace')
+
+    def login(self, usuario, senha):
+        self.requisitar('/login/')
+        status, url, _ = self.requisitar('/login/', {
+            'username': usuario, 'password': senha, 'csrfmiddlewaretoken': self.csrf(),
+        })
+        if status != 200 or '/login/' in url:
+            raise SystemExit(f'Falha no login de {usuario} (status {status}).')
+
+    def api(self, recurso, campos):
+        status, _, corpo = self.requisitar(f'/api/v1/{recurso}/?fields={campos}&limit=500')
+        if status != 200:
+            raise SystemExit(f'Não foi possível ler {recurso} pela API (status {status}).')
+        return json.loads(corpo)['resultados']
+
+
+class Cenario:
+    """Dados da equipe usados para montar as jornadas (lidos uma vez pela API de leitura)."""
+
+    def __init__(self, cliente, itens):
+        self.itens = itens
+        self.clientes = cliente.api('clientes', 'nome')
+        self.produtos = [p['id'] for p in cliente.api('produtos', 'id')]
+        self.fornecedores = [f['id'] for f in cliente.api('fornecedores', 'id')]
+        # número -> versão conhecida, para a troca de status mandar a versão como a tela manda
+        self.encomendas = {e['id']: e['versao'] for e in cliente.api('encomendas', 'id,versao')}
+        if not (self.clientes and self.produtos and self.fornecedores):
+            raise SystemExit('A equipe precisa de clientes, produtos e fornecedores (veja populate_db.py).')
+
+
+def _resultado(status, esperado=200):
+    return 'ok' if status == esperado else 'erro'
+
+
+def passo_dashboard(cliente, cenario):
+    return _resultado(cliente.requisitar('/')[0])
+
+
+def passo_lista(cliente, cenario):
+    return _resultado(cliente.requisitar(f'/encomendas/?page={random.randint(1, 3)}')[0])
+
+
+def passo_busca(cliente, cenario):
+    termo = random.choice(cenario.clientes)['nome'][:4]
+    return _resultado(cliente.requisitar('/encomendas/?' + urllib.parse.urlencode({'search': termo}))[0])
+
+
+def passo_detalhe(cliente, cenario):
+    if not cenario.encomendas:
+        return passo_lista(cliente, cenario)
+    return _resultado(cliente.requisitar(f'/encomendas/{random.choice(list(cenario.encomendas))}/')[0])
+
+
+def passo_criar(cliente, cenario):
+    dados = {
+        'csrfmiddlewaretoken': cliente.csrf(),
+        'chave_idempotencia': uuid.uuid4().hex,
+        'cliente': random.choice(cenario.clientes)['id'],
+        'valor_pago_adiantamento': '0.00',
+        'data_prevista_entrega': '',
+        'observacoes': 'teste de carga',
+        'status': 'criada',
+        'itens-TOTAL_FORMS': cenario.itens,
+        'itens-INITIAL_FORMS': 0,
+        'itens-MIN_NUM_FORMS': 0,
+        'itens-MAX_NUM_FORMS': 1000,
+    }
+    for indice in range(cenario.itens):
+        dados.update({
+            f'itens-{indice}-produto': random.choice(cenario.produtos),
+            f'itens-{indice}-fornecedor': random.choice(cenario.fornecedores),
+            f'itens-{indice}-quantidade': random.randint(1, 3),
+            f'itens-{indice}-preco_cotado': f'{random.uniform(5, 80):.2f}',
+            f'itens-{indice}-observacoes': '',
+        })
+    status, url, _ = cliente.requisitar('/encomendas/nova/', dados)
+    criada = re.search(r'/encomendas/(\d+)/$', url)
+    if status == 200 and criada:
+        cenario.encomendas[int(criada.group(1))] = 1
+        return 'ok'
+    return 'erro'
+
+
+def passo_status(cliente, cenario):
+    if not cenario.encomendas:
+        return passo_lista(cliente, cenario)
+    numero = random.choice(list(cenario.encomendas))
+    status, _, corpo = cliente.requisitar(
+        f'/api/encomenda/{numero}/status/',
+        {'status': random.choice(STATUS), 'versao': cenario.encomendas[numero]},
+        {'X-CSRFToken': cliente.csrf()},
+    )
+    if status in (200, 409):
+        # 409: outro usuário virtual mudou a encomenda antes; a resposta traz a versão atual
+        cenario.encomendas[numero] = json.loads(corpo)['versao']
+        return 'ok' if status == 200 else 'conflito'
+    return 'erro'
+
+
+PASSOS = {
+    'dashboard': passo_dashboard, 'lista': passo_lista, 'busca': passo_busca,
+    'detalhe': passo_detalhe, 'criar': passo_criar, 'status': passo_status,
+}
+
+
+async def usuario_virtual(args, cenario, estado, parar):
+    cliente = Cliente(args.url, args.timeout)
+    await asyncio.to_thread(cliente.login, args.usuario, args.senha)
+    nomes, pesos = zip(*estado['pesos'].items())
+    while not parar.is_set():
+        passo = random.choices(nomes, pesos)[0]
+        inicio = time.perf_counter()
+        try:
+            resultado = await asyncio.to_thread(PASSOS[passo], cliente, cenario)
+        except (OSError, urllib.error.URLError):
+            resultado = 'erro'  # timeout, conexão recusada
+        except (ValueError, KeyError):
+            resultado = 'erro'  # resposta que não é o JSON esperado (página de erro do proxy, HTML)
+        estado['atual'].registrar(passo, (time.perf_counter() - inicio) * 1000, resultado)
+        if args.pausa:
+            await asyncio.sleep(random.expovariate(1000 / args.pausa))
+
+
+def histograma(valores):
+    contagem = [0] * (len(FAIXAS_MS) + 1)
+    for valor in valores:
+        contagem[bisect.bisect_left(FAIXAS_MS, valor)] += 1
+    return contagem
+
+
+def imprimir_etapa(estatisticas):
+    duracao = estatisticas.duracao
+    print(f'\n=== {estatisticas.usuarios} usuário(s), {duracao:.0f}s: '
+          f'{estatisticas.total()} requisições, {estatisticas.total() / duracao:.1f} req/s ===')
+    faixas = ''.join(f'{"<" + str(f):>7}' for f in FAIXAS_MS) + f'{">=" + str(FAIXAS_MS[-1]):>8}'
+    print(f'{"passo":<10}{"req/s":>7}{"p50":>7}{"p95":>7}{"p99":>7}{"erros":>8}  histograma (ms): {faixas}')
+    for passo, valores in sorted(estatisticas.latencias.items()):
+        erros = estatisticas.erros[passo] / len(valores) * 100
+        conflitos = f' ({estatisticas.conflitos[passo]} conflitos)' if estatisticas.conflitos[passo] else ''
+        print(
+            f'{passo:<10}{len(valores) / duracao:>7.1f}{statistics.median(valores):>7.0f}'
+            f'{estatisticas.percentil(valores, 0.95):>7.0f}{estatisticas.percentil(valores, 0.99):>7.0f}'
+            f'{erros:>7.1f}%  {"":>17}' + ''.join(f'{n:>7}' for n in histograma(valores))
+            + conflitos
+        )
+
+
+def imprimir_saturacao(etapas):
+    """Vazão por degrau; saturação = mais usuários sem ganho de vazão e com latência em alta."""
+    print('\n=== Rampa ===')
+    print(f'{"usuários":>9}{"req/s":>9}{"p95 ms":>9}{"erros":>8}')
+    anterior, saturacao = None, None
+    for etapa in etapas:
+        todas = [valor for valores in etapa.latencias.values() for valor in valores]
+        vazao = etapa.total() / etapa.duracao
+        p95 = etapa.percentil(todas, 0.95)
+        erros = sum(etapa.erros.values()) / max(1, len(todas)) * 100
+        print(f'{etapa.usuarios:>9}{vazao:>9.1f}{p95:>9.0f}{erros:>7.1f}%')
+        if anterior and saturacao is None and (vazao < anterior[0] * 1.1 and p95 > anterior[1] * 1.5 or erros > 1):
+            saturacao = anterior[2]
+        anterior = (vazao, p95, etapa.usuarios)
+    if saturacao:
+        print(f'\nSaturação provável a partir de ~{saturacao} usuários simultâneos.')
+    else:
+        print('\nSem sinal de saturação na rampa; aumente os degraus.')
+
+
+async def executar(args):
+    pesos = dict(PESOS_PADRAO)
+    if args.pesos:
+        for par in args.pesos.split(','):
+            nome, peso = par.split('=')
+            if nome not in PASSOS:
+                raise SystemExit(f'Passo desconhecido: {nome} (use {", ".join(PASSOS)})')
+            pesos[nome] = float(peso)
+    pesos = {nome: peso for nome, peso in pesos.items() if peso > 0}
+
+    degraus = [int(n) for n in args.rampa.split(',')] if args.rampa else [args.usuarios]
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max(degraus) + 4))
+
+    preparo = Cliente(args.url, args.timeout)
+    await asyncio.to_thread(preparo.login, args.usuario, args.senha)
+    cenario = await asyncio.to_thread(Cenario, preparo, args.itens)
+
+    parar = asyncio.Event()
+    estado = {'pesos': pesos}
+    tarefas, etapas = [], []
+    for usuarios in degraus:
+        estado['atual'] = Estatisticas(usuarios)
+        while len(tarefas) < usuarios:
+            tarefas.append(asyncio.create_task(usuario_virtual(args, cenario, estado, parar)))
+        await asyncio.sleep(args.aquecimento)
+        estado['atual'] = Estatisticas(usuarios)  # descarta o aquecimento (logins, conexões novas)
+        await asyncio.sleep(args.duracao)
+        etapa = estado['atual']
+        etapa.fim = time.perf_counter()
+        estado['atual'] = Estatisticas(usuarios)  # requisições em curso não entram na etapa encerrada
+        etapas.append(etapa)
+        imprimir_etapa(etapa)
+
+    parar.set()
+    await asyncio.gather(*tarefas, return_exceptions=True)
+    if len(etapas) > 1:
+        imprimir_saturacao(etapas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Endereço do servidor.')
+    parser.add_argument('--usuario', required=True, help='Usuário (com equipe) usado no login.')
+    parser.add_argument('--senha', required=True)
+    parser.add_argument('--usuarios', type=int, default=10, help='Usuários simultâneos (sem --rampa).')
+    parser.add_argument('--rampa', help='Degraus de concorrência, p.ex. 5,10,20,40.')
+    parser.add_argument('--duracao', type=float, default=30, help='Segundos medidos por degrau.')
+    parser.add_argument('--aquecimento', type=float, default=5, help='Segundos descartados no início de cada degrau.')
+    parser.add_argument('--pausa', type=float, default=500, help='Pausa média entre passos, em ms (0 = sem pausa).')
+    parser.add_argument('--itens', type=int, default=3, help='Itens por encomenda criada.')
+    parser.add_argument('--pesos', help='Pesos das jornadas, p.ex. dashboard=1,lista=5 (padrão: %s).' % (
+        ','.join(f'{nome}={peso}' for nome, peso in PESOS_PADRAO.items())))
+    parser.add_argument('--timeout', type=float, default=30, help='Timeout por requisição, em segundos.')
+    asyncio.run(executar(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()